@@ -3,8 +3,21 @@
 # Before running make sure to import or define your abc_response(prompt) function
 
 import streamlit as st
-import json
-import re
+import html
+import os
+
+from agent_core import agent_llm, regen_core
+from agent_runtime import default_runtime, turn_reply
+from agent_tools import build_registry
+from chat_render import poll_job, render_history, render_steps
+from conversation_memory import ConversationMemory
+from intent_router import default_router
+from llm_gateway import default_gateway
+from resilience import default_policy
+from response_cache import ResponseCache
+from session_store import attach_session, flush_session
+from tool_registry import ToolRegistry
+from tracing import activate, export_trace
 
 # --- CONFIG ---
 st.set_page_config(page_title="React Agent - Full Version", layout="wide")
@@ -21,83 +34,69 @@ body {background: #fce4ec;}
 </style>
 """, unsafe_allow_html=True)
 
+# --- SHARED RESOURCES (one per process: completion cache, built-in tools) ---
+@st.cache_resource
+def get_response_cache(): return ResponseCache(path=os.environ.get("AGENT_CACHE_PATH"))
+@st.cache_resource
+def get_tools(): return build_registry()
+
 # --- SESSION ---
+# Restored from AGENT_SESSION_STORE, if set; job and tool_registry stay in this process
+session = attach_session(("history", "agent_steps", "step_count", "max_steps", "uploaded_file", "last_observation", "memory"))
 if "history" not in st.session_state: st.session_state.history = []
 if "agent_steps" not in st.session_state: st.session_state.agent_steps = []
 if "step_count" not in st.session_state: st.session_state.step_count = 0
 if "max_steps" not in st.session_state: st.session_state.max_steps = 10
 if "uploaded_file" not in st.session_state: st.session_state.uploaded_file = None
-if "typing" not in st.session_state: st.session_state.typing = False
 if "last_observation" not in st.session_state: st.session_state.last_observation = None
-if "tool_registry" not in st.session_state: st.session_state.tool_registry = {
-    "conversation": "For chatting, greetings, clarifications",
-    "calculator": "For math calculations",
-    "python_executor": "For on-the-fly python code execution",
-    "file_preview": "To preview uploaded files"
-}
-
-# --- TOOL FUNCTIONS ---
-def calculator_tool(prompt):
-    try: expr = "".join(re.findall(r"[-+*/().0-9 ]+", prompt)); result = eval(expr, {"__builtins__": None}); return f"The result is {result}"
-    except: return "Invalid calculation."
-
-def python_executor(code):
-    try: exec_globals = {}; exec(code, exec_globals); return str(exec_globals.get("result", "Code executed."))
-    except Exception as e: return f"Error: {str(e)}"
-
-def file_preview():
-    if st.session_state.uploaded_file:
-        try: content = st.session_state.uploaded_file.getvalue().decode("utf-8").splitlines(); return "\n".join(content[:5])
-        except: return "Could not read the file."
-    return "No file uploaded."
-
-def conversation_tool(prompt):
-    return f"I heard you: {prompt}"
-
-# --- SAFE PARSER ---
-def safe_json_extract(text):
-    try:
-        if "```" in text: text = text.split("```")[1]
-        return json.loads(text.strip())
-    except:
-        try: return json.loads(re.search(r"\{.*\}", text, re.DOTALL).group())
-        except: return {"action": "finish"}
+if "memory" not in st.session_state: st.session_state.memory = ConversationMemory()  # token-budgeted window + rolling summary
+if "job" not in st.session_state: st.session_state.job = None  # background turn in flight
+if "tool_registry" not in st.session_state: st.session_state.tool_registry = ToolRegistry(base=get_tools())  # overlay: new tools can be registered at runtime
 
 # --- AGENT STEP ---
-def agent_step(user_input):
+# Turns run as background jobs with no access to st.session_state: snapshot() captures what they read.
+def snapshot():
+    f = st.session_state.uploaded_file
+    return {"uploaded_file": f, "file_name": f.name if f else None, "max_steps": st.session_state.max_steps,
+            "core": regen_core(st.session_state.tool_registry), "last_observation": st.session_state.last_observation, "conversation": st.session_state.memory.render() or "None"}
+
+def start_turn(user_msg):
+    ctx, cache = snapshot(), get_response_cache()
+    file_ctx = f"[File Uploaded]: {ctx['file_name']}\n" if ctx["file_name"] else ""
+    def turn(job):
+        return ctx["core"].turn(user_msg, llm=agent_llm(abc_response, cache, on_token=job.on_token), uploaded_file=ctx["uploaded_file"], max_steps=ctx["max_steps"],
+                                on_step=job.on_step, conversation=ctx["conversation"], default_observation=ctx["last_observation"], file_ctx=file_ctx)
+    return default_runtime().submit(turn, user_input=user_msg)
+
+def record_step(step):
     st.session_state.step_count += 1
-    tools_info = "\n".join([f"- {k}: {v}" for k,v in st.session_state.tool_registry.items()])
-    file_ctx = f"\n[File Uploaded]: {st.session_state.uploaded_file.name}" if st.session_state.uploaded_file else ""
-    prompt = f"""[System]\nYou are a step-limited reasoning agent.\nUse minimal steps.\nSoft Limit: {st.session_state.max_steps}\nStep: {st.session_state.step_count}\nTools:\n{tools_info}\nPrevious Observation: {st.session_state.last_observation or 'None'}{file_ctx}\n\nRespond as:\n{{\"thought\":\"...\",\"action\":\"tool_name\",\"action_input\":\"...\"}}\n\n[User]: {user_input}"""
-    st.session_state.typing = True
-    agent_raw = abc_response(prompt)
-    result = safe_json_extract(agent_raw)
-    if result.get("action") == "finish" or st.session_state.step_count >= st.session_state.max_steps:
-        return {"thought": "Finished.", "action": "finish", "observation": "Task completed."}
-    action, input_ = result.get("action"), result.get("action_input")
-    if action == "calculator": obs = calculator_tool(input_)
-    elif action == "conversation": obs = conversation_tool(input_)
-    elif action == "python_executor": obs = python_executor(input_)
-    elif action == "file_preview": obs = file_preview()
-    elif action in st.session_state.tool_registry: obs = f"[External Tool Placeholder for {action}]"
-    else: obs = "Unknown tool."
-    st.session_state.last_observation = obs
-    return {"thought": result.get("thought"), "action": action, "observation": obs}
+    st.session_state.agent_steps.append(step)
+    if step["action"] != "finish": st.session_state.last_observation = step["observation"]
+
+def finish_turn(job):
+    for step in job.steps: record_step(step)
+    st.session_state.step_count = 0
+    reply = turn_reply(job)
+    st.session_state.history.append({"role": "agent", "content": reply})
+    st.session_state.memory.add("user", job.context["user_input"]); st.session_state.memory.add("agent", reply)
 
 # --- INTRO ---
 if not st.session_state.history:
     st.session_state.history.append({"role": "agent", "content": "Hi! I'm your React Agent.\n\nI can:\n- Chat\n- Calculate\n- Execute Python\n- Preview Files\n- Create & Test new Tools\nUse the input below or upload a file."})
 
+# --- SETTLE FINISHED TURN ---
+settled = None  # finished turn's trace; also times this rerun's render
+if st.session_state.job is not None and st.session_state.job.done(): finish_turn(st.session_state.job); settled = st.session_state.job.trace; st.session_state.job = None
+
 # --- STATUS BAR ---
-st.markdown(f"<div class=\"status-bar\"><b>Status:</b> Agent Ready | Step {st.session_state.step_count}/{st.session_state.max_steps}</div>", unsafe_allow_html=True)
+cache_stats = get_response_cache().stats()
+router = default_router()
+local = f" | Local {router.stats()['hit_rate']:.0%}" if router else ""
+st.markdown(f"<div class=\"status-bar\"><b>Status:</b> Agent Ready | Step {st.session_state.step_count}/{st.session_state.max_steps} | Cache {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} hits{local} | {default_gateway().describe()}, {default_policy().describe()}</div>", unsafe_allow_html=True)
 
 # --- CHAT ---
 st.markdown("### Conversation")
-st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-for m in st.session_state.history:
-    role = "user-msg" if m["role"] == "user" else "agent-msg"
-    st.markdown(f"<div class='{role}'>{m['content']}</div>", unsafe_allow_html=True)
-st.markdown("</div>", unsafe_allow_html=True)
+with activate(settled): render_history(st.session_state.history, lambda m: f"<div class='{'user-msg' if m['role'] == 'user' else 'agent-msg'}'>{html.escape(m['content'])}</div>")
 
 # --- INPUT ---
 with st.form("chat_input"):
@@ -105,19 +104,19 @@ with st.form("chat_input"):
     with col1: user_msg = st.text_input("Your message")
     with col2: uploaded = st.file_uploader("➕", label_visibility="collapsed");
     if uploaded: st.session_state.uploaded_file = uploaded
-    submitted = st.form_submit_button("Send")
+    submitted = st.form_submit_button("Send", disabled=st.session_state.job is not None)
 
-# --- MAIN LOOP ---
+# --- MAIN LOOP (background job, polled) ---
 if submitted and user_msg:
-    st.session_state.history.append({"role": "user", "content": user_msg})
-    result = agent_step(user_msg)
-    st.session_state.agent_steps.append(result)
-    st.session_state.history.append({"role": "agent", "content": result["observation"]})
+    if st.session_state.job is not None: st.toast("Still working on the previous message.")
+    else: st.session_state.history.append({"role": "user", "content": user_msg}); st.session_state.job = start_turn(user_msg)
+def show_progress(job):
+    st.markdown(f"<div class='user-msg'>{html.escape(job.context['user_input'])}</div><div class='agent-msg'>{html.escape(job.text or '...')}</div>", unsafe_allow_html=True)
+    st.caption(f"Step {len(job.steps) + 1}/{st.session_state.max_steps} · {job.elapsed:.0f}s")
+if st.session_state.job is not None: poll_job(st.session_state.job, show_progress)
 
 # --- INSPECTOR ---
 st.markdown("### Thought Inspector")
-for i, step in enumerate(st.session_state.agent_steps):
-    with st.expander(f"Step {i+1}"):
-        st.markdown(f"**Thought:** {step.get('thought', '')}")
-        st.markdown(f"**Action:** {step.get('action', '')}")
-        st.markdown(f"**Observation:** {step.get('observation', '')}")
+with activate(settled): render_steps(st.session_state.agent_steps, lambda step: f"**Thought:** {step.get('thought', '')}\n\n**Action:** {step.get('action', '')}\n\n**Observation:** {step.get('observation', '')}" + (f"\n\n*{step['timing']}*" if step.get("timing") else ""))
+export_trace(settled)
+flush_session(session)
@@ -1,179 +1,136 @@
+# --- LangChain ReAct Agent (Streamlit UI) ---
+# The agent itself lives in lang_agent. LangChain takes over a second to
+# import, so it is loaded lazily: the first run of a process renders the
+# page at once and starts loading the agent in the background (see startup).
+# Before running, import or define abc_response in lang_agent.py.
+import startup
+
+run_profile = startup.begin_run("Lang")
+
+from typing import Any, Dict, List
+
 import streamlit as st
-from typing import Any, Dict, List, Optional, Union, Callable
-import json
-from datetime import datetime
 
-# LangChain imports
-from langchain.llms.base import LLM
-from langchain.agents import AgentType, initialize_agent, Tool, AgentExecutor
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.callbacks.manager import CallbackManager
-from langchain.schema import AgentAction, AgentFinish, LLMResult
-from langchain.tools import BaseTool
-from langchain.chains import LLMMathChain
-from langchain.memory import ConversationBufferMemory
+from agent_runtime import AgentJob, default_runtime
+from chat_render import poll_job, visible_page
+from conversation_memory import ConversationMemory
+from intent_router import default_router
+from llm_gateway import default_gateway
+from resilience import default_policy
+from session_store import attach_session, flush_session
+import tracing
 
-# Create a custom LLM class that inherits from LangChain's LLM
-class CustomLLM(LLM):
-    """Custom LLM wrapper for abc_response function."""
-    
-    @property
-    def _llm_type(self) -> str:
-        """Return type of LLM."""
-        return "custom"
-    
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        """Call the custom LLM with the provided prompt."""
-        try:
-            # Use the abc_response function
-            response = abc_response(prompt)
-            
-            # Handle stop sequences if provided
-            if stop:
-                for sequence in stop:
-                    if sequence in response:
-                        response = response.split(sequence)[0]
-            
-            return response
-        except Exception as e:
-            return f"Error: {str(e)}"
-    
-    @property
-    def _identifying_params(self) -> Dict[str, Any]:
-        """Get identifying parameters."""
-        return {"model": "custom_abc_response"}
+run_profile.mark("imports")
 
-# Create a custom callback handler to track agent steps for display
-class StreamlitCallbackHandler(BaseCallbackHandler):
-    def __init__(self):
-        self.steps = []
-        
-    def on_agent_action(self, action: AgentAction, **kwargs) -> Any:
-        """Run on agent action."""
-        self.steps.append({
-            "type": "action",
-            "tool": action.tool, 
-            "tool_input": action.tool_input,
-            "log": action.log
-        })
-    
-    def on_tool_end(self, output: str, **kwargs) -> Any:
-        """Run on tool end."""
-        if self.steps:
-            self.steps[-1]["output"] = output
-    
-    def on_agent_finish(self, finish: AgentFinish, **kwargs) -> Any:
-        """Run on agent end."""
-        self.steps.append({
-            "type": "finish",
-            "output": finish.return_values["output"],
-            "log": finish.log if hasattr(finish, "log") else ""
-        })
+# LangChain agent, tools and LLM wrapper; imported on first use
+lang_agent = startup.lazy("lang_agent")
 
-# Custom date tool
-def date_tool(query: str) -> str:
-    """Get the current date and time or answer date-related questions."""
-    current_date = datetime.now()
-    
-    if "current date" in query.lower() or "today" in query.lower():
-        return f"The current date is {current_date.strftime('%Y-%m-%d')}"
-    elif "current time" in query.lower() or "now" in query.lower():
-        return f"The current time is {current_date.strftime('%H:%M:%S')}"
-    elif "day of week" in query.lower():
-        return f"Today is {current_date.strftime('%A')}"
-    elif "month" in query.lower():
-        return f"The current month is {current_date.strftime('%B')}"
-    elif "year" in query.lower():
-        return f"The current year is {current_date.strftime('%Y')}"
-    else:
-        return f"Date information: {current_date.strftime('%Y-%m-%d %H:%M:%S')}"
+@st.cache_resource
+def warm_up():
+    """Load LangChain and build the shared agent in the background, once per process."""
+    return lang_agent.preload(lambda module: module.get_agent())
 
-# Simulated search tool
-def search_tool(query: str) -> str:
-    """Simulated search tool that returns information about common topics."""
-    query = query.lower()
-    
-    predefined_answers = {
-        "weather": "The weather search shows partly cloudy with a high of 72°F for today.",
-        "news": "Top headlines: New technological advances in AI announced today.",
-        "stock": "Recent stock market update: Major indices showed mixed performance.",
-        "movie": "Popular movies currently showing include action, comedy and drama genres.",
-        "restaurant": "Top rated restaurants in the area include Italian, Japanese, and American cuisine options.",
-        "population": "The world population is approximately 8 billion people as of 2023.",
-        "distance": "The distance information would depend on specific locations.",
-        "president": "The current president information depends on your country and the current date.",
-    }
-    
-    for key, value in predefined_answers.items():
-        if key in query:
-            return value
-    
-    return "I searched but couldn't find specific information on that topic."
+def format_reasoning(steps: List[Dict[str, Any]]) -> str:
+    """Render the agent's steps as one markdown string."""
+    parts = []
+    for step in steps:
+        if step["type"] == "action":
+            parts += [
+                f"**Thought**: {step['log']}",
+                f"**Action**: {step['tool']}",
+                f"**Action Input**: {step['tool_input']}",
+            ]
+            if "output" in step:
+                parts.append(f"**Observation**: {step['output']}")
+            if "timing" in step:
+                parts.append(f"*{step['timing']}*")
+            parts.append("---")
+        elif step["type"] == "finish":
+            parts.append(f"**Final Thought**: {step['log']}")
+            if "timing" in step:
+                parts.append(f"*{step['timing']}*")
+    return "\n\n".join(parts)
 
-# Function to create LangChain tools
-def create_tools(llm: LLM) -> List[Tool]:
-    """Create a list of tools for the agent."""
-    # LLMMathChain for calculations
-    llm_math_chain = LLMMathChain.from_llm(llm=llm)
-    
-    tools = [
-        Tool(
-            name="Calculator",
-            func=llm_math_chain.run,
-            description="Useful for performing mathematical calculations. Input should be a mathematical expression."
-        ),
-        Tool(
-            name="DateInfo",
-            func=date_tool,
-            description="Useful for getting the current date, time, or answering date-related questions."
-        ),
-        Tool(
-            name="Search",
-            func=search_tool,
-            description="Useful for finding information about various topics like weather, news, stocks, etc."
-        )
-    ]
-    
-    return tools
+
+# Background turns: the agent runs on the shared runtime, not the script thread
+def start_turn(user_input: str) -> AgentJob:
+    """Submit one agent run; its callback handler collects tokens and steps for polling."""
+    memory = lang_agent.WindowedSummaryMemory(conversation=st.session_state.memory)
+    agent = lang_agent.create_executor(memory, user_input)
+    handler = lang_agent.StreamlitCallbackHandler()
+    router = default_router()
+    
+    async def turn(job: AgentJob) -> str:
+        handler.should_stop = job.cancelled
+        handler.trace = job.trace
+        return await lang_agent.run_turn(agent, user_input, handler, router)
+    
+    return default_runtime().submit(turn, handler=handler)
+
+def finish_turn(job: AgentJob) -> Dict[str, Any]:
+    """The assistant message for a settled job, with the steps for its reasoning expander."""
+    steps = job.context["handler"].steps
+    if job.cancelled():
+        return {"role": "assistant", "content": "Stopped before finishing.", "steps": steps}
+    error = job.exception()
+    if error is not None:
+        st.error(f"An error occurred: {str(error)}")
+        return {"role": "assistant", "content": "I encountered an error while processing your request. Please try again.", "steps": steps}
+    return {"role": "assistant", "content": job.result(), "steps": steps}
+
+def show_progress(job: AgentJob) -> None:
+    """Live tokens of the running turn (refreshed by poll_job)."""
+    handler = job.context["handler"]
+    st.markdown("".join(handler.tokens) or "Thinking...")
+    st.caption(f"{len(handler.steps)} steps · {job.elapsed:.0f}s")
 
 # Main Streamlit App
 def main():
     st.title("LangChain ReAct Agent")
     st.markdown("Ask me anything! I can calculate, search, and provide date information.")
-    
-    # Initialize session state for chat history
+    warm_up()
+    # The completion cache lives with the agent; before it is loaded nothing was cached
+    cache_stats = lang_agent.get_response_cache().stats() if lang_agent.loaded else {"hits": 0, "misses": 0}
+    caption = f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses"
+    if default_router() is not None:
+        caption += f" · Answered locally: {default_router().stats()['hit_rate']:.0%}"
+    caption += f" · {default_gateway().describe()}, {default_policy().describe()}"
+    st.caption(caption)
+    
+    # Initialize session state for chat history (restored from AGENT_SESSION_STORE, if set)
+    session = attach_session(("chat_history", "memory"))
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
-    
-    if "agent" not in st.session_state:
-        # Initialize the LLM
-        llm = CustomLLM()
-        
-        # Create tools
-        tools = create_tools(llm)
-        
-        # Create conversation memory
-        memory = ConversationBufferMemory(memory_key="chat_history")
-        
-        # Initialize the agent - this is the standard LangChain way
-        st.session_state.agent = initialize_agent(
-            tools, 
-            llm, 
-            agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,  # Standard ReAct agent
-            verbose=True,
-            memory=memory,
-            handle_parsing_errors=True
-        )
-    
-    # Display chat messages
-    for message in st.session_state.chat_history:
-        with st.chat_message(message["role"]):
-            st.write(message["content"])
+    if "job" not in st.session_state:
+        st.session_state.job = None  # the agent run in flight, if any
+    
+    if not isinstance(st.session_state.get("memory"), ConversationMemory):
+        # Only memory and history are per session; the agent itself is shared
+        st.session_state.memory = ConversationMemory()
+    
+    # Fold a finished background run into the chat
+    settled = None  # its trace also times the render below
+    if st.session_state.job is not None and st.session_state.job.done():
+        st.session_state.chat_history.append(finish_turn(st.session_state.job))
+        settled = st.session_state.job.trace
+        st.session_state.job = None
+    
+    # Display chat messages (older pages load on demand)
+    with tracing.activate(settled), tracing.span("render", view="chat_history", items=len(st.session_state.chat_history)):
+        start = visible_page(st.session_state.chat_history, "chat_history")
+        for message in st.session_state.chat_history[start:]:
+            with st.chat_message(message["role"]):
+                st.write(message["content"])
+                # Display the agent steps as a single markdown block
+                if message.get("steps"):
+                    with st.expander("See agent's reasoning"):
+                        st.markdown(format_reasoning(message["steps"]))
+    tracing.export_trace(settled)  # to AGENT_TRACE_PATH, if set
     
     # User input
-    user_input = st.chat_input("Type your message here...")
+    user_input = st.chat_input("Type your message here...", disabled=st.session_state.job is not None)
     
-    if user_input:
+    if user_input and st.session_state.job is None:
         # Display user message
         with st.chat_message("user"):
             st.write(user_input)
@@ -181,43 +138,16 @@ def main():
         # Add to chat history
         st.session_state.chat_history.append({"role": "user", "content": user_input})
         
-        # Create callback handler for tracking steps
-        callback_handler = StreamlitCallbackHandler()
-        
-        # Get agent response
+        # Run the agent in the background; this script run ends right away
+        st.session_state.job = start_turn(user_input)
+    
+    # Stream the running turn's tokens until it settles
+    if st.session_state.job is not None:
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    # Run the agent with callbacks
-                    response = st.session_state.agent.run(
-                        user_input,
-                        callbacks=[callback_handler]
-                    )
-                    
-                    # Display the response
-                    st.write(response)
-                    
-                    # Display the agent steps
-                    if callback_handler.steps:
-                        with st.expander("See agent's reasoning"):
-                            for i, step in enumerate(callback_handler.steps):
-                                if step["type"] == "action":
-                                    st.markdown(f"**Thought**: {step['log']}")
-                                    st.markdown(f"**Action**: {step['tool']}")
-                                    st.markdown(f"**Action Input**: {step['tool_input']}")
-                                    if "output" in step:
-                                        st.markdown(f"**Observation**: {step['output']}")
-                                    st.markdown("---")
-                                elif step["type"] == "finish":
-                                    st.markdown(f"**Final Thought**: {step['log']}")
-                except Exception as e:
-                    error_msg = f"An error occurred: {str(e)}"
-                    st.error(error_msg)
-                    response = "I encountered an error while processing your request. Please try again."
-                    st.write(response)
-        
-        # Add to chat history
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
+            poll_job(st.session_state.job, show_progress)
+    
+    flush_session(session)  # only the fields this run changed
 
 if __name__ == "__main__":
     main()
+    run_profile.finish()
@@ -1,7 +1,18 @@
 # --- React Agent Core (Preview #1) ---
 import streamlit as st
-import json
-import re
+import html
+import os
+
+from agent_core import agent_llm, sample_core
+from agent_runtime import default_runtime, turn_reply
+from chat_render import poll_job, render_history, render_steps
+from conversation_memory import ConversationMemory
+from intent_router import default_router
+from llm_gateway import default_gateway
+from resilience import default_policy
+from response_cache import ResponseCache
+from session_store import attach_session, flush_session
+from tracing import activate, export_trace
 
 # ---- Streamlit Config ----
 st.set_page_config(page_title="React Agent", layout="wide")
@@ -19,7 +30,14 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# ---- Shared Completion Cache ----
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(path=os.environ.get("AGENT_CACHE_PATH"))
+
 # ---- Session ----
+# Restored from AGENT_SESSION_STORE, if set, when a browser session starts
+session = attach_session(("history", "agent_steps", "step_count", "max_steps", "uploaded_file", "memory"))
 if "history" not in st.session_state:
     st.session_state.history = []
 if "agent_steps" not in st.session_state:
@@ -30,93 +48,55 @@ if "max_steps" not in st.session_state:
     st.session_state.max_steps = 10
 if "uploaded_file" not in st.session_state:
     st.session_state.uploaded_file = None
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+if "job" not in st.session_state:
+    st.session_state.job = None  # the turn running in the background, if any
 
-# ---- Built-in Tools ----
-def calculator_tool(prompt):
-    try:
-        expr = re.findall(r"[-+*/().0-9 ]+", prompt)
-        expr = "".join(expr)
-        result = eval(expr, {"__builtins__": None})
-        return f"The result is {result}"
-    except:
-        return "Invalid calculation."
-
-def python_executor(code):
-    try:
-        exec_globals = {}
-        exec(code, exec_globals)
-        return str(exec_globals.get("result", "Code executed."))
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def file_preview():
-    if st.session_state.uploaded_file:
-        try:
-            content = st.session_state.uploaded_file.getvalue().decode("utf-8").splitlines()
-            return "\n".join(content[:5])
-        except:
-            return "Could not read the file."
-    return "No file uploaded."
-
-def conversation_tool(prompt):
-    return f"I heard you: {prompt}"
+# ---- Agent (built once per process, shared by all sessions) ----
+# Prompt, tools and parser live in agent_core, which runs without Streamlit
+@st.cache_resource
+def get_core():
+    return sample_core()
 
 # ---- Agent Controller ----
-def agent_step(user_input, prev_observation=None):
+def record_step(step):
     st.session_state.step_count += 1
+    st.session_state.agent_steps.append(step)
+
+# ---- Agent Runtime ----
+# A turn runs as a background job; it cannot read st.session_state, so
+# everything it needs is captured here, at submit time.
+def start_turn(user_input):
+    core, cache = get_core(), get_response_cache()
+    conversation = st.session_state.memory.render() or "None"
+    upload = st.session_state.uploaded_file
+    max_steps = st.session_state.max_steps
+    def turn(job):
+        return core.turn(
+            user_input,
+            llm=agent_llm(abc_response, cache, on_token=job.on_token),  # <-- you will import abc_response yourself
+            uploaded_file=upload,
+            max_steps=max_steps,
+            on_step=job.on_step,
+            conversation=conversation,
+        )
+    return default_runtime().submit(turn, user_input=user_input)
+
+def finish_turn(job):
+    for step in job.steps:
+        record_step(step)
+    st.session_state.step_count = 0  # Reset step count
 
-    # ---- Prompt ----
-    agent_prompt = f"""[System]
-You are a React Agent.
-
-Your job is to solve the user's query using minimum steps and tools.
-
-Available tools:
-- calculator
-- conversation
-- python_executor
-- file_preview
-
-Soft Step Limit = {st.session_state.max_steps}
-Steps used so far = {st.session_state.step_count}
-Current observation = {prev_observation or "None"}
-
-Respond strictly in:
-{{"thought": "...", "action": "tool_name", "action_input": "..."}}
-or
-{{"action": "finish"}}
-
-[User]: {user_input}
-"""
-
-    # ---- LLM Call ----
-    agent_response = abc_response(agent_prompt)  # <-- you will import this yourself
-    try:
-        parsed = json.loads(agent_response)
-    except:
-        parsed = {"action": "finish"}
-
-    # ---- React Loop ----
-    if parsed.get("action") == "finish" or st.session_state.step_count >= st.session_state.max_steps:
-        st.session_state.step_count = 0  # Reset step count
-        return {"thought": "Finished.", "action": "finish", "observation": "Task completed."}
-
-    # ---- Tool Dispatcher ----
-    tool_name = parsed.get("action")
-    action_input = parsed.get("action_input")
-
-    if tool_name == "calculator":
-        observation = calculator_tool(action_input)
-    elif tool_name == "conversation":
-        observation = conversation_tool(action_input)
-    elif tool_name == "python_executor":
-        observation = python_executor(action_input)
-    elif tool_name == "file_preview":
-        observation = file_preview()
-    else:
-        observation = "Unknown tool requested."
+    # Agent Replies
+    reply = turn_reply(job)
+    st.session_state.history.append({"role": "agent", "content": reply})
+    st.session_state.memory.add("user", job.context["user_input"])
+    st.session_state.memory.add("agent", reply)
 
-    return {"thought": parsed.get("thought", ""), "action": tool_name, "action_input": action_input, "observation": observation}
+def show_progress(job):
+    st.markdown(f"<div class='agent-msg'>Agent: {html.escape(job.text or '...')}</div>", unsafe_allow_html=True)
+    st.caption(f"Step {len(job.steps) + 1} · {job.elapsed:.0f}s")
 
 # ---- Agent Auto-Intro ----
 if not st.session_state.history:
@@ -130,8 +110,21 @@ if not st.session_state.history:
 
 You can also upload a file using the [+] button."""})
 
+# A finished background turn is folded into the session before the form
+# is drawn, so Send is enabled again on the same rerun
+settled = None  # its trace also times the render below
+if st.session_state.job is not None and st.session_state.job.done():
+    finish_turn(st.session_state.job)
+    settled = st.session_state.job.trace
+    st.session_state.job = None
+
 # ---- UI ----
 st.title("React Agent - Preview #1")
+cache_stats = get_response_cache().stats()
+router = default_router()
+st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses"
+           + (f" · Answered locally: {router.stats()['hit_rate']:.0%}" if router else "")
+           + f" · {default_gateway().describe()}, {default_policy().describe()}")
 
 uploaded = st.file_uploader("Upload file", type=None)
 if uploaded:
@@ -140,34 +133,44 @@ if uploaded:
 # ---- Chat Form ----
 with st.form("chat_form"):
     user_input = st.text_input("Type your message...")
-    submitted = st.form_submit_button("Send")
+    submitted = st.form_submit_button("Send", disabled=st.session_state.job is not None)
 
 if submitted and user_input:
-    st.session_state.history.append({"role": "user", "content": user_input})
-
-    # Agent Thinks
-    step_result = agent_step(user_input)
-    st.session_state.agent_steps.append(step_result)
-
-    # Agent Replies
-    if step_result["action"] != "finish":
-        st.session_state.history.append({"role": "agent", "content": step_result["observation"]})
+    if st.session_state.job is not None:
+        st.toast("Still working on the previous message.")
     else:
-        st.session_state.history.append({"role": "agent", "content": step_result["observation"]})
+        st.session_state.history.append({"role": "user", "content": user_input})
+        st.session_state.job = start_turn(user_input)
+
+# Agent Streams its tokens while the turn runs in the background
+if st.session_state.job is not None:
+    poll_job(st.session_state.job, show_progress)
 
 # ---- Chat History ----
+def format_message(msg):
+    # User input and model replies are text, not markup
+    content = html.escape(msg["content"])
+    if msg["role"] == "user":
+        return f"<div class='user-msg'>You: {content}</div>"
+    return f"<div class='agent-msg'>Agent: {content}</div>"
+
 st.markdown("### Chat")
-with st.container():
-    for msg in st.session_state.history:
-        if msg["role"] == "user":
-            st.markdown(f"<div class='user-msg'>You: {msg['content']}</div>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<div class='agent-msg'>Agent: {msg['content']}</div>", unsafe_allow_html=True)
+with activate(settled):
+    render_history(st.session_state.history, format_message)
 
 # ---- Thought Process ----
+def format_step(step):
+    # Thoughts and observations are model and tool output: escaped, they render as text
+    field = lambda name: html.escape(str(step.get(name, '')))
+    return "\n".join([
+        f"<div class='thought'><b>Thought:</b> {field('thought')}</div>",
+        f"<div class='action'><b>Action:</b> {field('action')}</div>",
+        f"<div class='observation'><b>Observation:</b> {field('observation')}</div>",
+        f"<div class='timing'><small>{field('timing')}</small></div>",
+    ])
+
 st.markdown("### Thought Process")
-for idx, step in enumerate(st.session_state.agent_steps):
-    with st.expander(f"Step {idx+1}"):
-        st.markdown(f"<div class='thought'><b>Thought:</b> {step.get('thought','')}</div>", unsafe_allow_html=True)
-        st.markdown(f"<div class='action'><b>Action:</b> {step.get('action','')}</div>", unsafe_allow_html=True)
-        st.markdown(f"<div class='observation'><b>Observation:</b> {step.get('observation','')}</div>", unsafe_allow_html=True)
+with activate(settled):
+    render_steps(st.session_state.agent_steps, format_step, allow_html=True)
+export_trace(settled)  # to AGENT_TRACE_PATH, if set
+flush_session(session)  # only the fields this run changed
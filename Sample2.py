@@ -1,6 +1,17 @@
 import streamlit as st
-import json
-import re
+import html
+import os
+
+from agent_core import agent_llm, sample2_core
+from agent_runtime import default_runtime, turn_reply
+from chat_render import poll_job, render_history, render_steps
+from conversation_memory import ConversationMemory
+from intent_router import default_router
+from llm_gateway import default_gateway
+from resilience import default_policy
+from response_cache import ResponseCache
+from session_store import attach_session, flush_session
+from tracing import activate, export_trace
 
 # --------------------
 # ---- CONFIG ----
@@ -23,9 +34,18 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# --------------------
+# ---- COMPLETION CACHE ----
+# --------------------
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(path=os.environ.get("AGENT_CACHE_PATH"))
+
 # --------------------
 # ---- SESSION STATE ----
 # --------------------
+# Restored from AGENT_SESSION_STORE, if set, when a browser session starts
+session = attach_session(("history", "agent_steps", "step_count", "max_steps", "uploaded_file", "memory"))
 if "history" not in st.session_state:
     st.session_state.history = []
 if "agent_steps" not in st.session_state:
@@ -36,119 +56,58 @@ if "max_steps" not in st.session_state:
     st.session_state.max_steps = 10
 if "uploaded_file" not in st.session_state:
     st.session_state.uploaded_file = None
-if "typing" not in st.session_state:
-    st.session_state.typing = False
-
-# --------------------
-# ---- BUILT-IN TOOLS ----
-# --------------------
-def calculator_tool(prompt):
-    try:
-        expr = re.findall(r"[-+*/().0-9 ]+", prompt)
-        expr = "".join(expr)
-        result = eval(expr, {"__builtins__": None})
-        return f"The result is {result}"
-    except:
-        return "Invalid calculation."
-
-def python_executor(code):
-    try:
-        exec_globals = {}
-        exec(code, exec_globals)
-        return str(exec_globals.get("result", "Code executed."))
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def file_preview():
-    if st.session_state.uploaded_file:
-        try:
-            content = st.session_state.uploaded_file.getvalue().decode("utf-8").splitlines()
-            return "\n".join(content[:5])
-        except:
-            return "Could not read the file."
-    return "No file uploaded."
-
-def conversation_tool(prompt):
-    return f"I heard you: {prompt}"
-
-# --------------------
-# ---- SAFE JSON PARSER ----
-# --------------------
-def safe_json_extract(text):
-    try:
-        text = text.strip()
-        if "```" in text:
-            text = text.split("```")[1]
-        return json.loads(text)
-    except:
-        try:
-            return json.loads(re.search(r"\{.*\}", text, re.DOTALL).group())
-        except:
-            return {"action": "finish"}
-
-# --------------------
-# ---- AGENT STEP ----
-# --------------------
-def agent_step(user_input, prev_observation=None):
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+if "job" not in st.session_state:
+    st.session_state.job = None  # the turn running in the background, if any
+
+# --------------------
+# ---- AGENT (once per process) ----
+# --------------------
+# Prompt, tools and parser come from agent_core, which runs without Streamlit
+@st.cache_resource
+def get_core():
+    return sample2_core()
+
+# --------------------
+# ---- BACKGROUND TURN ----
+# --------------------
+# The job cannot read st.session_state, so the prompt inputs, the upload and
+# the step limit are captured when the message is submitted.
+def start_turn(user_input):
+    core, cache = get_core(), get_response_cache()
+    conversation = st.session_state.memory.render() or "None"
+    upload = st.session_state.uploaded_file
+    max_steps = st.session_state.max_steps
+    def turn(job):
+        return core.turn(
+            user_input,
+            llm=agent_llm(abc_response, cache, on_token=job.on_token),  # <-- Inject your own LLM here
+            uploaded_file=upload,
+            max_steps=max_steps,
+            on_step=job.on_step,
+            conversation=conversation,
+        )
+    return default_runtime().submit(turn, user_input=user_input)
+
+def record_step(step):
     st.session_state.step_count += 1
+    st.session_state.agent_steps.append(step)
 
-    tool_descriptions = """
-- conversation: For chatting, greeting, follow-ups, asking clarifying questions when requirements are unclear.
-- calculator: For evaluating simple math expressions.
-- python_executor: If on-the-fly python code needs to be generated to fulfill user's requirement, first generate the code explicitly, then execute.
-- file_preview: For previewing uploaded files (e.g., first few lines).
-    """
-
-    agent_prompt = f"""[System]
-You are a React Agent.
-Your goal is to answer user's query using minimal steps and minimal tools.
-
-[Current Step]: {st.session_state.step_count}
-[Soft Limit]: {st.session_state.max_steps}
-[Previous Observation]: {prev_observation or "None"}
-
-[Available Tools]:
-{tool_descriptions}
-
-Always respond strictly as JSON:
-{{"thought": "...", "action": "tool_name", "action_input": "..."}}
-or
-{{"action": "finish"}}
-
-[User]: {user_input}
-"""
-
-    st.session_state.typing = True
-
-    # ------------------
-    # ---- LLM CALL ----
-    # ------------------
-    agent_response = abc_response(agent_prompt)  # <-- Inject your own LLM here
-
-    parsed = safe_json_extract(agent_response)
-
-    if parsed.get("action") == "finish" or st.session_state.step_count >= st.session_state.max_steps:
-        st.session_state.step_count = 0
-        return {"thought": "Finished.", "action": "finish", "observation": "Task completed."}
-
-    # ------------------
-    # ---- TOOL EXECUTION ----
-    # ------------------
-    tool_name = parsed.get("action")
-    action_input = parsed.get("action_input")
-
-    if tool_name == "calculator":
-        observation = calculator_tool(action_input)
-    elif tool_name == "conversation":
-        observation = conversation_tool(action_input)
-    elif tool_name == "python_executor":
-        observation = python_executor(action_input)
-    elif tool_name == "file_preview":
-        observation = file_preview()
-    else:
-        observation = "Unknown tool requested."
+def finish_turn(job):
+    for step in job.steps:
+        record_step(step)
+    st.session_state.step_count = 0
+    reply = turn_reply(job)
+    st.session_state.history.append({"role": "agent", "content": reply})
+    st.session_state.memory.add("user", job.context["user_input"])
+    st.session_state.memory.add("agent", reply)
 
-    return {"thought": parsed.get("thought", ""), "action": tool_name, "action_input": action_input, "observation": observation}
+# ---- Typing Indicator (live tokens) ----
+def show_progress(job):
+    st.markdown(f"<div class='user-msg'>{html.escape(job.context['user_input'])}</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='agent-msg'>Agent is typing... {html.escape(job.text)}</div>", unsafe_allow_html=True)
+    st.caption(f"Step {len(job.steps) + 1}/{st.session_state.max_steps} · {job.elapsed:.0f}s")
 
 # --------------------
 # ---- AUTO INTRO ----
@@ -163,32 +122,35 @@ if not st.session_state.history:
 
 Please type your question or upload a file below."""})
 
+# A finished background turn is folded into the session before rendering
+settled = None  # the finished turn's trace, which also times this render
+if st.session_state.job is not None and st.session_state.job.done():
+    finish_turn(st.session_state.job)
+    settled = st.session_state.job.trace
+    st.session_state.job = None
+
 # --------------------
 # ---- UI ----
 # --------------------
 
 # ---- Status Bar ----
+cache_stats = get_response_cache().stats()
+router = default_router()
+local = f" | Local {router.stats()['hit_rate']:.0%}" if router else ""
 st.markdown(f"""
 <div class="status-bar">
-    <b>Status:</b> Active | Step {st.session_state.step_count}/{st.session_state.max_steps}
+    <b>Status:</b> Active | Step {st.session_state.step_count}/{st.session_state.max_steps} | Cache {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} hits{local} | {default_gateway().describe()}, {default_policy().describe()}
 </div>
 """, unsafe_allow_html=True)
 
 # ---- Chat History ----
+def format_message(msg):
+    role = "user-msg" if msg["role"] == "user" else "agent-msg"
+    return f"<div class='{role}'>{html.escape(msg['content'])}</div>"  # text, not markup
+
 st.markdown("### Chat")
-with st.container():
-    st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-    for msg in st.session_state.history:
-        if msg["role"] == "user":
-            st.markdown(f"<div class='user-msg'>{msg['content']}</div>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<div class='agent-msg'>{msg['content']}</div>", unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
-
-# ---- Typing Indicator ----
-if st.session_state.typing:
-    st.markdown(f"<div class='agent-msg'>Agent is typing...</div>", unsafe_allow_html=True)
-    st.session_state.typing = False
+with activate(settled):
+    render_history(st.session_state.history, format_message)
 
 # ---- Chat Form ----
 with st.form("chat_form"):
@@ -200,21 +162,34 @@ with st.form("chat_form"):
         if uploaded:
             st.session_state.uploaded_file = uploaded
 
-    submitted = st.form_submit_button("Send")
+    submitted = st.form_submit_button("Send", disabled=st.session_state.job is not None)
 
 if submitted and user_input:
-    st.session_state.history.append({"role": "user", "content": user_input})
-    step_result = agent_step(user_input)
-    st.session_state.agent_steps.append(step_result)
-    if step_result["action"] != "finish":
-        st.session_state.history.append({"role": "agent", "content": step_result["observation"]})
+    if st.session_state.job is not None:
+        st.toast("Still working on the previous message.")
     else:
-        st.session_state.history.append({"role": "agent", "content": step_result["observation"]})
+        st.session_state.history.append({"role": "user", "content": user_input})
+        st.session_state.job = start_turn(user_input)
+
+# ------------------
+# ---- REACT LOOP (background) ----
+# ------------------
+if st.session_state.job is not None:
+    poll_job(st.session_state.job, show_progress)
 
 # ---- Thought Inspector ----
+def format_step(step):
+    # Thoughts and observations are model and tool output: escaped, they render as text
+    field = lambda name: html.escape(str(step.get(name, '')))
+    return "\n".join([
+        f"<div class='thought'><b>Thought:</b> {field('thought')}</div>",
+        f"<div class='action'><b>Action:</b> {field('action')}</div>",
+        f"<div class='observation'><b>Observation:</b> {field('observation')}</div>",
+        f"<div class='timing'><small>{field('timing')}</small></div>",
+    ])
+
 st.markdown("### Thought Process (Inspector)")
-for idx, step in enumerate(st.session_state.agent_steps):
-    with st.expander(f"Step {idx+1}"):
-        st.markdown(f"<div class='thought'><b>Thought:</b> {step.get('thought','')}</div>", unsafe_allow_html=True)
-        st.markdown(f"<div class='action'><b>Action:</b> {step.get('action','')}</div>", unsafe_allow_html=True)
-        st.markdown(f"<div class='observation'><b>Observation:</b> {step.get('observation','')}</div>", unsafe_allow_html=True)
+with activate(settled):
+    render_steps(st.session_state.agent_steps, format_step, allow_html=True)
+export_trace(settled)  # to AGENT_TRACE_PATH, if set
+flush_session(session)  # only the fields this run changed
@@ -0,0 +1,153 @@
+# --- Streaming Action Parser ---
+# Single pass over the model output: skip prose and code fences, find the
+# first balanced top-level {...} that decodes to an action, and stop there.
+# Only a candidate that never closes (a quoted "{" in the prose, say) is
+# scanned again, from the next brace after it.
+
+import json
+import re
+
+_OBJECT_START = re.compile(r'\{\s*(?:["}]|\Z)')
+_NON_SPACE = re.compile(r"\S")
+_TOKENS = re.compile(r'[{}"\\]')
+_STRING_TOKENS = re.compile(r'["\\]')
+
+
+class ActionParseError(ValueError):
+    """The completion did not contain a usable action object.
+
+    `kind` is one of "no_object", "unterminated", "invalid_json" or
+    "missing_action"; `position` is the offset in the stream where the
+    offending object started (or where the stream ended).
+    """
+
+    def __init__(self, kind, message, position=None):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+        self.position = position
+
+    def as_observation(self):
+        return f"Parse error ({self.kind}): {self.message}. Respond again with one JSON object only."
+
+
+class ActionParser:
+    """Incremental parser fed with text chunks as they stream in.
+
+    `feed(chunk)` returns the action dict as soon as a complete object has
+    been seen (and `end` holds the stream offset right after it), otherwise
+    None. `close()` returns the action or raises ActionParseError.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.offset = 0
+        self.start = None
+        self.fresh = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.action = None
+        self.end = None
+        self.error = None
+
+    def feed(self, chunk):
+        if self.action is not None:
+            return self.action
+        base, pos, seg = self.offset, 0, 0
+        self.offset += len(chunk)
+        if self.escaped and chunk:
+            self.escaped, pos = False, 1
+        while pos < len(chunk):
+            if self.start is None:
+                # Jump straight to a brace that can open a JSON object;
+                # "{step 2}" and friends are skipped without a second look.
+                opening = _OBJECT_START.search(chunk, pos)
+                brace = chunk.rfind("{", pos, opening.start() if opening else len(chunk))
+                if brace != -1:
+                    self.error = ("invalid_json", "braces do not enclose a JSON object", base + brace)
+                if not opening:
+                    return None
+                pos = opening.start()
+                self.start, self.depth, self.parts, seg = base + pos, 1, [], pos
+                self.fresh = opening.end() == len(chunk) and chunk[-1] not in '"}'
+                pos += 1
+                continue
+            if self.fresh:
+                # The object opened at the very end of the previous chunk
+                first = _NON_SPACE.search(chunk, pos)
+                if first is None:
+                    break
+                self.fresh = False
+                if first.group() not in '"}':
+                    self.error = ("invalid_json", "braces do not enclose a JSON object", self.start)
+                    self.start, self.parts, pos = None, [], first.start()
+                    continue
+            match = (_STRING_TOKENS if self.in_string else _TOKENS).search(chunk, pos)
+            if match is None:
+                break
+            ch, pos = match.group(), match.end()
+            if ch == "\\":
+                if pos < len(chunk):
+                    pos += 1
+                else:
+                    self.escaped = True
+            elif ch == '"':
+                self.in_string = not self.in_string
+            elif ch == "{":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if not self.depth:
+                    self.parts.append(chunk[seg:pos])
+                    if self._complete(base + pos):
+                        return self.action
+        if self.start is not None:
+            self.parts.append(chunk[seg:])
+        return None
+
+    def _complete(self, end):
+        try:
+            candidate = json.loads("".join(self.parts))
+        except ValueError as e:
+            self.error = ("invalid_json", str(e), self.start)
+        else:
+            if isinstance(candidate, dict) and ("action" in candidate or "actions" in candidate):
+                self.action, self.end = candidate, end
+                return True
+            self.error = ("missing_action", "object has no 'action' or 'actions' key", self.start)
+        # Keep scanning after this object; a later one may be the real action.
+        self.start, self.parts = None, []
+        return False
+
+    def close(self):
+        if self.action is not None:
+            return self.action
+        if self.start is not None:
+            unterminated = self.start
+            while self.start is not None and self.action is None:
+                self._rescan()
+            if self.action is None:
+                raise ActionParseError("unterminated", "JSON object was never closed", unterminated)
+            return self.action
+        if self.error is not None:
+            raise ActionParseError(*self.error)
+        raise ActionParseError("no_object", "no JSON object found", self.offset)
+
+
+    def _rescan(self):
+        """Scan again from just after the unterminated candidate's opening brace."""
+        text, start = "".join(self.parts), self.start
+        self.start, self.parts, self.fresh, self.depth, self.in_string, self.escaped = None, [], False, 0, False, False
+        self.offset = start + 1
+        self.feed(text[1:])
+
+
+def parse_action(text_or_chunks):
+    """Parse the first action object out of a string or an iterable of chunks."""
+    parser = ActionParser()
+    chunks = [text_or_chunks] if isinstance(text_or_chunks, str) else text_or_chunks
+    for chunk in chunks:
+        if parser.feed(chunk) is not None:
+            break
+    return parser.close()
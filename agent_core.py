@@ -0,0 +1,186 @@
+# --- Headless Agent Core ---
+# The part of each hand-rolled app that is not UI: its prompt, its tools and
+# how one turn is wired into agent_loop. Nothing in here touches Streamlit,
+# so the apps, the benchmarks and scripts all run the very same agent; the
+# apps only add session state, rendering and the background runtime.
+
+from functools import lru_cache, partial
+
+from action_parser import parse_action
+from agent_loop import run_agent_loop, run_agent_loop_async
+from agent_tools import build_registry
+from intent_router import default_router
+from llm_client import async_llm
+from llm_gateway import coalesced, default_gateway
+from prompt_builder import PromptTemplate
+from resilience import default_policy, resilient
+from response_cache import cached_llm
+from step_budget import StepBudget
+
+
+class AgentCore:
+    """Prompt template + tool registry + parser for one agent.
+
+    `turn()` returns the coroutine for one turn (for AgentRuntime.submit or
+    asyncio), `run()` does the same turn synchronously. Per-turn inputs such
+    as the rendered conversation or the uploaded file are arguments, never
+    global state. `max_steps` is a cap: each turn gets its own step limit and
+    early stop from `budget` (step_budget.StepBudget). With a `router`
+    (intent_router), trivial messages go straight to a tool.
+    """
+
+    def __init__(self, template, registry, parse_response=parse_action, max_steps=10, prompt_defaults=None,
+                 budget=None, router=None):
+        self.template = template
+        self.registry = registry
+        self.parse_response = parse_response
+        self.max_steps = max_steps
+        self.prompt_defaults = prompt_defaults or {}  # values for app-specific template fields
+        self.budget = budget or StepBudget(is_final=self._is_final)
+        self.router = router
+
+    def _is_final(self, name):
+        return getattr(self.registry.get(name), "final", False)
+
+    def prompt_builder(self, conversation="None", max_steps=None, default_observation=None, **fields):
+        """`build_prompt(user_input, step_count, prev_observation)` for one turn."""
+        max_steps = max_steps or self.max_steps
+        fields = {**self.prompt_defaults, **fields}
+
+        def build_prompt(user_input, step_count, prev_observation=None):
+            return self.template(user_input=user_input, step_count=step_count, max_steps=max_steps,
+                                 observation=prev_observation or default_observation or "None",
+                                 conversation=conversation, **fields)
+        return build_prompt
+
+    def _loop_args(self, budget, llm, uploaded_file, on_step, prompt_fields):
+        return {
+            "llm": llm,
+            "build_prompt": self.prompt_builder(max_steps=budget.limit, **prompt_fields),
+            "dispatch_tool": partial(self.registry.dispatch, uploaded_file=uploaded_file),
+            "dispatch_many": partial(self.registry.dispatch_many, uploaded_file=uploaded_file),
+            "parse_response": self.parse_response,
+            "max_steps": budget.limit,
+            "stop_reason": budget.stop_reason,
+            "router": partial(self.router.route, tools=self.registry.names()) if self.router else None,
+            "on_step": on_step,
+        }
+
+    async def turn(self, user_input, llm, uploaded_file=None, max_steps=None, on_step=None, **prompt_fields):
+        """One turn as a coroutine; `llm` is async (see llm_client.async_llm)."""
+        budget = self.budget.plan(user_input, max_steps or self.max_steps)
+        args = self._loop_args(budget, llm, uploaded_file, on_step, prompt_fields)
+        with budget.activate():  # llm retries are paid from the turn's budget (see resilience)
+            return await run_agent_loop_async(user_input, **args)
+
+    def run(self, user_input, llm, uploaded_file=None, max_steps=None, on_step=None, **prompt_fields):
+        """One turn, blocking; `llm(prompt) -> str`."""
+        budget = self.budget.plan(user_input, max_steps or self.max_steps)
+        args = self._loop_args(budget, llm, uploaded_file, on_step, prompt_fields)
+        with budget.activate():
+            return run_agent_loop(user_input, **args)
+
+
+def agent_llm(backend, cache=None, on_token=None):
+    """The async `llm` a turn takes, calling `backend` (e.g. abc_response) through the shared stack.
+
+    Innermost first: the process-wide resilience policy (deadlines, hedging,
+    retries, circuit breaker), the LLM gateway (coalescing, micro-batching),
+    streaming into `on_token`, and the response cache when `cache` is given.
+    Every app and batch_run builds its llm here, so a new layer goes in once.
+    """
+    llm = async_llm(coalesced(resilient(backend, default_policy()), default_gateway()), on_token=on_token)
+    return llm if cache is None else cached_llm(llm, cache)
+
+
+@lru_cache(maxsize=32)
+def compile_template(static, dynamic, **constants):
+    """PromptTemplate, compiled once per distinct static part (e.g. per tool list)."""
+    return PromptTemplate(static, dynamic, **constants)
+
+
+# ---- Sample.py (Preview #1) ----
+SAMPLE_STATIC = """[System]
+You are a React Agent.
+
+Your job is to solve the user's query using minimum steps and tools.
+
+Available tools:
+{tool_names}
+
+Respond strictly in:
+{{"thought": "...", "action": "tool_name", "action_input": "..."}}
+or, to run several independent tools at once:
+{{"thought": "...", "actions": [{{"action": "tool_name", "action_input": "..."}}, ...]}}
+or
+{{"action": "finish"}}
+
+"""
+
+SAMPLE_DYNAMIC = """Conversation so far:
+{conversation}
+
+[User]: {user_input}
+
+Soft Step Limit = {max_steps}
+Steps used so far = {step_count}
+Current observation = {observation}
+"""
+
+
+def sample_core(registry=None):
+    registry = registry or build_registry()
+    tool_names = "\n".join(f"- {name}" for name in registry.names())
+    return AgentCore(compile_template(SAMPLE_STATIC, SAMPLE_DYNAMIC, tool_names=tool_names), registry,
+                     router=default_router())
+
+
+# ---- Sample2.py ----
+SAMPLE2_STATIC = """[System]
+You are a React Agent.
+Your goal is to answer user's query using minimal steps and minimal tools.
+
+[Available Tools]:
+{tools}
+
+Always respond strictly as JSON:
+{{"thought": "...", "action": "tool_name", "action_input": "..."}}
+or, when several independent tools are needed, all of them in one step:
+{{"thought": "...", "actions": [{{"action": "tool_name", "action_input": "..."}}, ...]}}
+or
+{{"action": "finish"}}
+
+"""
+
+SAMPLE2_DYNAMIC = """[Conversation So Far]:
+{conversation}
+
+[User]: {user_input}
+
+[Current Step]: {step_count}
+[Soft Limit]: {max_steps}
+[Previous Observation]: {observation}
+"""
+
+
+def sample2_core(registry=None):
+    registry = registry or build_registry()
+    return AgentCore(compile_template(SAMPLE2_STATIC, SAMPLE2_DYNAMIC, tools=registry.describe()), registry,
+                     router=default_router())
+
+
+# ---- 2regen.py (Preview #3) ----
+# Extra per-turn fields: file_ctx ("[File Uploaded]: name\n" or "") and, via
+# default_observation, the last observation of the previous turn.
+REGEN_STATIC = """[System]\nYou are a step-limited reasoning agent.\nUse minimal steps.\nTools:\n{tools}\n\nRespond as:\n{{\"thought\":\"...\",\"action\":\"tool_name\",\"action_input\":\"...\"}}\nor, for independent tools in parallel:\n{{\"thought\":\"...\",\"actions\":[{{\"action\":\"tool_name\",\"action_input\":\"...\"}}, ...]}}\nor\n{{\"action\":\"finish\"}}\n"""
+REGEN_DYNAMIC = """{file_ctx}\nConversation so far:\n{conversation}\n\n[User]: {user_input}\n\nSoft Limit: {max_steps}\nStep: {step_count}\nPrevious Observation: {observation}"""
+
+
+def regen_core(registry=None):
+    """Built per turn in 2regen (its registry can change at runtime); the template is cached per tool list."""
+    registry = registry or build_registry()
+    return AgentCore(compile_template(REGEN_STATIC, REGEN_DYNAMIC, tools=registry.describe()), registry,
+                     prompt_defaults={"file_ctx": ""}, router=default_router())
+
+
+CORES = {"Sample": sample_core, "Sample2": sample2_core, "2regen": regen_core}
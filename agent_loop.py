@@ -0,0 +1,221 @@
+# --- Headless ReAct Loop ---
+# Shared by Sample.py, Sample2.py and 2regen.py. Nothing in here touches
+# Streamlit, so a whole turn can run inside one submit or as a background job
+# (see agent_runtime).
+
+import asyncio
+import contextvars
+
+import tracing
+from action_parser import ActionParseError, parse_action
+from step_budget import is_error
+
+FINISH = "finish"
+PARSE_ERROR = "parse_error"
+
+
+def tool_calls(parsed):
+    """`[(action, action_input), ...]` from a single- or multi-action reply."""
+    if isinstance(parsed.get("actions"), list):
+        return [(call.get("action"), call.get("action_input")) for call in parsed["actions"]
+                if isinstance(call, dict) and call.get("action") not in (None, FINISH)]
+    if parsed.get("action") == FINISH:
+        return []
+    return [(parsed.get("action"), parsed.get("action_input"))]
+
+
+def merge_observations(calls, observations):
+    return "\n".join(f"[{i}] {action}: {observation}"
+                     for i, ((action, _), observation) in enumerate(zip(calls, observations), 1))
+
+
+def agent_turn(user_input, build_prompt, parse_response=parse_action, max_steps=10, stop_reason=None,
+               route=None):
+    """The ReAct loop itself, free of I/O, as a generator driven by run_agent_loop(_async).
+
+    Yields `("llm", prompt)` and expects the completion to be sent back,
+    `("tools", calls)` and expects the list of observations, and `("step", step)`
+    for every finished step. Returns the full step history.
+    `stop_reason(steps)`, if given, is asked after every step that did not
+    finish; a reason ends the turn right there (see step_budget). A `route`
+    (see intent_router) runs its tool as the first step without asking the
+    model; unless that fails, the turn ends with its observation.
+    """
+    steps = []
+    observation = reply = None
+
+    if route is not None:
+        observation, = yield "tools", [(route.tool, route.action_input)]
+        steps.append({"thought": f"Routed without the model ({route.describe()}).", "action": route.tool,
+                      "action_input": route.action_input, "observation": observation})
+        yield "step", steps[-1]
+        if not is_error(observation):
+            steps.append({"thought": "Answered by the routed tool.", "action": FINISH, "observation": observation})
+            yield "step", steps[-1]
+            return steps
+
+    for step_count in range(1, max_steps + 1):
+        prompt = build_prompt(user_input, step_count, observation)
+        completion = yield "llm", prompt
+        try:
+            parsed = parse_response(completion)
+        except ActionParseError as e:
+            observation = e.as_observation()
+            steps.append({"thought": "", "action": PARSE_ERROR, "observation": observation})
+        else:
+            calls = tool_calls(parsed)
+            if not calls:
+                steps.append({"thought": parsed.get("thought") or "Finished.", "action": FINISH,
+                              "observation": reply or "Task completed."})
+                yield "step", steps[-1]
+                return steps
+
+            observations = yield "tools", calls
+            if len(calls) == 1:
+                (action, action_input), = calls
+                observation = reply = observations[0]
+            else:
+                observation = reply = merge_observations(calls, observations)
+                action = ", ".join(str(name) for name, _ in calls)
+                action_input = [{"action": name, "action_input": value} for name, value in calls]
+            steps.append({"thought": parsed.get("thought", ""), "action": action,
+                          "action_input": action_input, "observation": observation})
+        yield "step", steps[-1]
+
+        reason = stop_reason(steps) if stop_reason else None
+        if reason:
+            steps.append({"thought": f"Stopped early: {reason}.", "action": FINISH,
+                          "observation": reply or f"Stopped early: {reason}."})
+            yield "step", steps[-1]
+            return steps
+
+    steps.append({"thought": "Step limit reached.", "action": FINISH,
+                  "observation": reply or "Task completed."})
+    yield "step", steps[-1]
+    return steps
+
+
+class _StepTracer:
+    """Tracing for the drivers, kept out of agent_turn.
+
+    A `step` span opens when the step's prompt is built and closes when
+    agent_turn yields the step; the llm, parse and tool spans nest inside it.
+    The finished step gets a one-line `timing` summary for the Inspector.
+    """
+
+    def __init__(self, build_prompt, parse_response):
+        self._build_prompt = build_prompt
+        self._parse_response = parse_response
+        self._step = None
+
+    def route(self, router, user_input):
+        """Ask `router` for a Route; a routed step's span opens right away."""
+        with tracing.span("route") as span:
+            route = router(user_input)
+            span.set(intent=route.intent if route is not None else None)
+        if route is not None:
+            self._step = tracing.enter("step", step=0, routed=route.intent)
+        return route
+
+    def build_prompt(self, user_input, step_count, observation):
+        self.close()
+        self._step = tracing.enter("step", step=step_count)
+        with tracing.span("prompt") as span:
+            prompt = self._build_prompt(user_input, step_count, observation)
+            span.set(chars=len(prompt), cache_prefix_chars=len(getattr(prompt, "cache_prefix", "")))
+        return prompt
+
+    def parse_response(self, completion):
+        with tracing.span("parse"):
+            return self._parse_response(completion)
+
+    def close(self, step=None):
+        span = tracing.leave(self._step)
+        self._step = None
+        if span is not None and step is not None:
+            step["timing"] = tracing.describe(span)
+
+
+def _dispatch(calls, dispatch_tool, dispatch_many):
+    # Single calls go through dispatch_many too: it enforces the tools' timeouts
+    return dispatch_many(calls) if dispatch_many else [dispatch_tool(*call) for call in calls]
+
+
+def run_agent_loop(user_input, llm, build_prompt, dispatch_tool, parse_response=parse_action,
+                   max_steps=10, on_step=None, dispatch_many=None, stop_reason=None, router=None):
+    """Iterate thought -> action -> observation until `finish` or `max_steps`.
+
+    `llm(prompt)` returns the raw completion, `build_prompt(user_input, step_count,
+    prev_observation)` renders the prompt for one step, `parse_response(text)`
+    turns the completion into an action dict and `dispatch_tool(action, action_input)`
+    returns the observation. A reply may also carry an `actions` list. When the
+    app provides `dispatch_many(calls)`, every step's calls go through it (run
+    concurrently, with the tools' timeouts), and the observations of several
+    calls are merged in order into one step.
+    Each step is handed to `on_step` as soon as it is done. Inside an active
+    trace (see tracing) every step is recorded as spans and gets a `timing` line.
+    An ActionParseError does not end the turn: it becomes the observation of a
+    `parse_error` step so the model can retry on the next step. `stop_reason`
+    can end a turn early and `router(user_input)` can answer it with a tool
+    alone (see agent_turn).
+    Returns the full step history; the last step is always a `finish` step whose
+    observation is the reply for the user.
+    """
+    tracer = _StepTracer(build_prompt, parse_response)
+    route = tracer.route(router, user_input) if router else None
+    turn = agent_turn(user_input, tracer.build_prompt, tracer.parse_response, max_steps, stop_reason, route)
+    result = None
+    try:
+        while True:
+            kind, payload = turn.send(result)
+            result = None
+            if kind == "llm":
+                with tracing.span("llm", prompt_chars=len(payload)) as span:
+                    result = llm(payload)
+                    span.set(response_chars=len(result))
+            elif kind == "tools":
+                with tracing.span("tools", calls=len(payload)):
+                    result = _dispatch(payload, dispatch_tool, dispatch_many)
+            else:
+                tracer.close(payload)
+                if on_step:
+                    on_step(payload)
+    except StopIteration as done:
+        return done.value
+    finally:
+        tracer.close()
+
+
+async def run_agent_loop_async(user_input, llm, build_prompt, dispatch_tool, parse_response=parse_action,
+                               max_steps=10, on_step=None, dispatch_many=None, stop_reason=None, router=None):
+    """run_agent_loop for asyncio: `await llm(prompt)` (see llm_client.async_llm).
+
+    The blocking tool dispatchers run in the event loop's executor, so a turn
+    only holds a thread while a tool is actually running.
+    """
+    loop = asyncio.get_running_loop()
+    tracer = _StepTracer(build_prompt, parse_response)
+    route = tracer.route(router, user_input) if router else None
+    turn = agent_turn(user_input, tracer.build_prompt, tracer.parse_response, max_steps, stop_reason, route)
+    result = None
+    try:
+        while True:
+            kind, payload = turn.send(result)
+            result = None
+            if kind == "llm":
+                with tracing.span("llm", prompt_chars=len(payload)) as span:
+                    result = await llm(payload)
+                    span.set(response_chars=len(result))
+            elif kind == "tools":
+                with tracing.span("tools", calls=len(payload)):
+                    # copy_context: tool spans nest under this one from the executor thread
+                    result = await loop.run_in_executor(None, contextvars.copy_context().run,
+                                                        _dispatch, payload, dispatch_tool, dispatch_many)
+            else:
+                tracer.close(payload)
+                if on_step:
+                    on_step(payload)
+    except StopIteration as done:
+        return done.value
+    finally:
+        tracer.close()
@@ -0,0 +1,141 @@
+# --- Background Agent Runtime ---
+# Turns run as jobs on one asyncio event loop in a daemon thread instead of
+# inside the Streamlit script run. The script submits a job, finishes, and
+# polls it on later (fragment) reruns; a second click cannot abort or
+# duplicate a turn that is already in flight. Async backends wait on the loop
+# without a thread; blocking ones borrow an executor thread only while the
+# call is running.
+#
+# Jobs must not read st.session_state (there is no script context on the
+# loop thread): apps capture what a turn needs at submit time.
+
+import asyncio
+import atexit
+import itertools
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import tracing
+
+_job_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's callbacks once the job has been cancelled."""
+
+
+class AgentJob:
+    """Handle on one submitted turn.
+
+    `tokens` holds the streamed text of the current step and `steps` the
+    finished steps; both are appended to from the runtime and are safe to
+    read from the script thread at any time. `trace` collects the turn's spans.
+    """
+
+    def __init__(self, **context):
+        self.id = next(_job_ids)
+        self.context = context
+        self.tokens = []
+        self.steps = []
+        self.started = time.monotonic()
+        self.future = None
+        self.trace = tracing.Trace("turn", job=self.id)
+        self._cancel = threading.Event()
+
+    # Callbacks for the turn (run on the loop or an executor thread)
+    def on_token(self, token):
+        if self._cancel.is_set():
+            raise JobCancelled()  # closes the upstream stream via stream_until
+        self.tokens.append(token)
+
+    def on_step(self, step):
+        self.steps.append(step)
+        self.tokens = []
+
+    # Polling API for the script thread
+    @property
+    def text(self):
+        return "".join(self.tokens)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        self._cancel.set()
+        self.future.cancel()
+
+    def cancelled(self):
+        return self._cancel.is_set() or self.future.cancelled()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def exception(self):
+        """The exception the turn raised, or None (also None while running or when cancelled)."""
+        if not self.future.done() or self.future.cancelled():
+            return None
+        error = self.future.exception()
+        return None if isinstance(error, JobCancelled) else error
+
+
+class AgentRuntime:
+    def __init__(self, max_threads=32):
+        self.loop = asyncio.new_event_loop()
+        # Blocking abc_response calls and tools run here, not on the loop
+        self.loop.set_default_executor(ThreadPoolExecutor(max_threads, thread_name_prefix="agent-io"))
+        self._thread = threading.Thread(target=self.loop.run_forever, name="agent-runtime", daemon=True)
+        self._thread.start()
+
+    def submit(self, turn, **context):
+        """Start `turn(job)` (a coroutine function) in the background and return the job."""
+        job = AgentJob(**context)
+        job.future = asyncio.run_coroutine_threadsafe(self._traced(turn, job), self.loop)
+        return job
+
+    @staticmethod
+    async def _traced(turn, job):
+        with tracing.activate(job.trace):
+            try:
+                return await turn(job)
+            finally:
+                job.trace.finish(steps=len(job.steps), cancelled=job._cancel.is_set())
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine on the runtime and block for its result (headless callers)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def close(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+
+_default_runtime = None
+_default_lock = threading.Lock()
+
+
+def default_runtime(**options):
+    """Process-wide runtime, created on first use and stopped at exit."""
+    global _default_runtime
+    with _default_lock:
+        if _default_runtime is None:
+            _default_runtime = AgentRuntime(**options)
+            atexit.register(_default_runtime.close)
+        return _default_runtime
+
+
+def turn_reply(job):
+    """The reply for the user once an agent-loop job has settled."""
+    if job.cancelled():
+        return "Stopped before finishing."
+    try:
+        return job.result()[-1]["observation"]
+    except (CancelledError, JobCancelled):
+        return "Stopped before finishing."
+    except Exception as e:
+        return f"Error: {e}"
@@ -0,0 +1,94 @@
+# --- Built-in Tools ---
+# Shared by the hand-rolled React agents. None of these read Streamlit state:
+# the uploaded file is handed in by the registry as context.
+
+import csv
+
+from file_store import describe_stats, head_lines, spool_upload, tail_lines
+from safe_math import MathError, calculate
+from sandbox import default_pool
+from tool_registry import ToolRegistry
+
+PYTHON_TIMEOUT = 10  # wall-clock seconds per python_executor snippet
+PREVIEW_LINES = 5
+
+
+def calculator_tool(prompt):
+    try:
+        return f"The result is {calculate(str(prompt))}"
+    except MathError as e:
+        return f"Invalid calculation: {e}"
+
+def python_executor(code):
+    # Runs in a sandboxed worker process, never inside the app server
+    reply = default_pool(timeout=PYTHON_TIMEOUT).run(code)
+    output = f"Error: {reply['error']}" if "error" in reply else reply["result"]
+    if reply.get("stdout"):
+        output = f"{output}\n[stdout]\n{reply['stdout'].rstrip()}"
+    return output
+
+def file_preview(action_input=None, uploaded_file=None):
+    # Spooled to disk once; only the lines shown are ever decoded
+    if uploaded_file:
+        try:
+            spooled = spool_upload(uploaded_file)
+            wants_tail = any(word in str(action_input or "").lower() for word in ("tail", "last", "end"))
+            lines = tail_lines(spooled, PREVIEW_LINES) if wants_tail else head_lines(spooled, PREVIEW_LINES)
+            return "\n".join(lines)
+        except OSError:
+            return "Could not read the file."
+    return "No file uploaded."
+
+def file_info(action_input=None, uploaded_file=None):
+    if uploaded_file:
+        try:
+            return describe_stats(spool_upload(uploaded_file))
+        except (OSError, csv.Error) as e:
+            return f"Could not analyze the file: {e}"
+    return "No file uploaded."
+
+def conversation_tool(prompt):
+    return f"I heard you: {prompt}"
+
+def upload_key(uploaded_file=None):
+    # File tools are cached per upload content, whatever its name or session
+    return spool_upload(uploaded_file).digest if uploaded_file else None
+
+
+def build_registry():
+    """Registry with the built-in tools; apps may register more at runtime."""
+    registry = ToolRegistry()
+    registry.register(
+        "conversation", conversation_tool,
+        "For chatting, greeting, follow-ups, asking clarifying questions when requirements are unclear.",
+        input_schema={"type": "string", "description": "the message to reply to"},
+        final=True,
+    )
+    registry.register(
+        "calculator", calculator_tool,
+        "For evaluating math expressions: + - * / // % **, sqrt, log, sin, factorial, pi, ...",
+        input_schema={"type": "string", "description": "a math expression"},
+        cacheable=True,
+        final=True,
+    )
+    registry.register(
+        "python_executor", python_executor,
+        "If on-the-fly python code needs to be generated to fulfill user's requirement, first generate the code explicitly, then execute.",
+        input_schema={"type": "string", "description": "python code that stores its answer in `result`"},
+        timeout=PYTHON_TIMEOUT + 5,  # the sandbox enforces its own limit first
+    )
+    registry.register(
+        "file_preview", file_preview,
+        "For previewing uploaded files (e.g., first few lines, or the last lines with input 'tail').",
+        uses_context=True,
+        cacheable=True,
+        context_key=upload_key,
+    )
+    registry.register(
+        "file_info", file_info,
+        "For analyzing uploaded files: size, encoding, row count, columns and their types (CSV, TSV, JSON lines).",
+        uses_context=True,
+        cacheable=True,
+        context_key=upload_key,
+    )
+    return registry
@@ -0,0 +1,208 @@
+# --- Batch Runner ---
+# Runs a JSONL file of queries through one of the agents without Streamlit:
+# a bounded pool of workers on an AgentRuntime, abc_response behind the LLM
+# gateway (see llm_gateway) and a shared rate limiter, and every result
+# appended to the output JSONL the moment it is done. The output doubles as
+# the checkpoint: a rerun with the same files skips every id that already has
+# a result and retries the ones that failed.
+#
+#   python batch_run.py queries.jsonl -o results.jsonl --agent Sample2 \
+#       --backend mymodel:abc_response --concurrency 16 --rate 5
+#
+# Input lines are {"id": ..., "query": ..., "file": optional path} (or a bare
+# JSON string); ids default to the line number. Output lines are
+# {"id", "query", "reply", "steps", "elapsed_s"} or {"id", "query", "error", "elapsed_s"},
+# in completion order; after a retry the last line for an id is the one that counts.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import tracing
+from agent_core import CORES, agent_llm
+from agent_runtime import AgentRuntime
+from llm_client import load_backend
+from llm_gateway import default_gateway
+from rate_limit import RateLimiter, rate_limited
+from resilience import default_policy
+from response_cache import ResponseCache
+
+AGENTS = tuple(CORES) + ("Lang",)
+
+
+def read_queries(path):
+    """`{"id", "query", "file"}` dicts from a JSONL file; blank lines are skipped."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"query": record}
+            query = record.get("query") or record.get("input") or record.get("question")
+            if not query:
+                raise ValueError(f"{path}:{number}: no query")
+            yield {"id": record.get("id", number), "query": query, "file": record.get("file")}
+
+
+def finished_ids(path, retry_errors=True):
+    """Ids that already have a result in `path` (the checkpoint); a torn last line is ignored."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not (retry_errors and "error" in record):
+                done.add(record["id"])
+    return done
+
+
+def _terminate_last_line(path):
+    # A run killed mid-write leaves a torn line; new results must not be appended to it
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
+def core_runner(agent, backend, max_steps, cache=None):
+    """`async run(record) -> result` for a hand-rolled agent (agent_core)."""
+    core = CORES[agent]()
+    llm = agent_llm(backend, cache)
+
+    async def run(record):
+        steps = await core.turn(record["query"], llm, uploaded_file=record["file"], max_steps=max_steps)
+        return {"reply": steps[-1]["observation"], "steps": len(steps)}
+    return run
+
+
+def lang_runner(backend):
+    """`async run(record) -> result` for the LangChain agent of Lang.py (lang_agent)."""
+    import lang_agent  # LangChain is only needed for this agent
+    from conversation_memory import ConversationMemory
+    lang_agent.abc_response = backend  # CustomLLM calls the module-level abc_response
+
+    async def run(record):
+        memory = lang_agent.WindowedSummaryMemory(conversation=ConversationMemory())
+        executor = lang_agent.create_executor(memory, record["query"])
+        executor.verbose = False
+        handler = lang_agent.StreamlitCallbackHandler()
+        result = await executor.ainvoke({"input": record["query"]}, config={"callbacks": [handler]})
+        return {"reply": result["output"], "steps": len(handler.steps)}
+    return run
+
+
+async def run_batch(queries, run, out, concurrency, progress_every=50):
+    """Feed `queries` to `concurrency` workers; each result is written and flushed as it lands."""
+    pending = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"ok": 0, "error": 0}
+    started = time.perf_counter()
+
+    async def worker():
+        while True:
+            record = await pending.get()
+            if record is None:
+                return
+            t0 = time.perf_counter()
+            trace = tracing.Trace("batch", id=str(record["id"]))
+            try:
+                with tracing.activate(trace):
+                    result = await run(record)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            trace.finish()
+            tracing.export_trace(trace)  # to AGENT_TRACE_PATH, if set
+            result = {"id": record["id"], "query": record["query"], **result,
+                      "elapsed_s": round(time.perf_counter() - t0, 3)}
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["error" if "error" in result else "ok"] += 1
+            total = counts["ok"] + counts["error"]
+            if progress_every and total % progress_every == 0:
+                rate = total / (time.perf_counter() - started)
+                print(f"{total} done ({counts['error']} errors), {rate:.1f} queries/s", file=sys.stderr)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for record in queries:
+            await pending.put(record)
+        for _ in workers:
+            await pending.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return counts
+
+
+def main():
+    args = argparse.ArgumentParser(description="Run a JSONL file of queries through an agent.")
+    args.add_argument("queries", help="input JSONL")
+    args.add_argument("-o", "--output", required=True, help="results JSONL (appended; also the resume checkpoint)")
+    args.add_argument("--agent", choices=AGENTS, default="Sample2")
+    source = args.add_mutually_exclusive_group(required=True)
+    source.add_argument("--backend", help="abc_response to use, as module:attribute")
+    source.add_argument("--mock", action="store_true", help="use benchmarks.mock_llm instead of a model")
+    args.add_argument("--concurrency", type=int, default=8, help="queries in flight")
+    args.add_argument("--rate", type=float, help="max abc_response calls per second")
+    args.add_argument("--burst", type=float, help="calls allowed at once before --rate applies")
+    args.add_argument("--max-steps", type=int, default=10)
+    args.add_argument("--no-cache", action="store_true", help="skip the response cache (AGENT_CACHE_PATH)")
+    args.add_argument("--keep-errors", action="store_true", help="on resume, do not retry queries that failed")
+    args.add_argument("--progress", type=int, default=50, help="report every N results (0: quiet)")
+    opts = args.parse_args()
+
+    if opts.mock:
+        from benchmarks.mock_llm import MockLLM
+        backend = MockLLM(style="react" if opts.agent == "Lang" else "json")
+    else:
+        backend = load_backend(opts.backend)
+    gateway = default_gateway()  # AGENT_LLM_BATCH turns on micro-batching
+    if opts.rate:
+        limiter = RateLimiter(opts.rate, opts.burst)
+        backend = rate_limited(backend, limiter)
+        if gateway.batcher is not None:  # a batched call takes one slot, inside the batch resilience policy
+            gateway.batcher.batch_backend = rate_limited(gateway.batcher.batch_backend, limiter)
+
+    if opts.agent == "Lang":
+        run = lang_runner(backend)  # Lang has its own response cache
+    else:
+        cache = None if opts.no_cache else ResponseCache(path=os.environ.get("AGENT_CACHE_PATH"))
+        run = core_runner(opts.agent, backend, opts.max_steps, cache)
+
+    done = finished_ids(opts.output, retry_errors=not opts.keep_errors)
+    queries = (record for record in read_queries(opts.queries) if record["id"] not in done)
+    if done:
+        print(f"resuming: {len(done)} queries already done", file=sys.stderr)
+
+    runtime = AgentRuntime(max_threads=max(32, opts.concurrency + 4))
+    started = time.perf_counter()
+    _terminate_last_line(opts.output)
+    with open(opts.output, "a", encoding="utf-8") as out:
+        future = asyncio.run_coroutine_threadsafe(
+            run_batch(queries, run, out, opts.concurrency, opts.progress), runtime.loop)
+        try:
+            counts = future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            print("interrupted; rerun the same command to resume", file=sys.stderr)
+            sys.exit(130)
+        finally:
+            runtime.close()
+    elapsed = time.perf_counter() - started
+    total = counts["ok"] + counts["error"]
+    print(f"{total} queries in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s), "
+          f"{counts['error']} errors", file=sys.stderr)
+    print(f"{gateway.describe()}, {default_policy().describe()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
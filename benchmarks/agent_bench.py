@@ -0,0 +1,162 @@
+# --- Agent Throughput Benchmark ---
+# Runs whole turns of the four agents headless, against the deterministic
+# MockLLM instead of abc_response, and reports steps/sec, p50/p99 turn latency
+# and peak memory per concurrency level. Turns run on an AgentRuntime, as in
+# the apps. Every turn asks a new question, so the response caches never hit.
+#
+#   python -m benchmarks.agent_bench [--apps Sample Sample2 2regen Lang]
+#       [--concurrency 1 8 32] [--turns 100] [--latency 0.05] [--tool-steps 1]
+#       [--fixed-steps] [--async-backend] [--trace-memory] [--json results.json]
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+import tracemalloc
+
+from agent_core import CORES
+from agent_runtime import AgentRuntime
+from benchmarks.mock_llm import AsyncMockLLM, MockLLM
+from llm_client import async_llm
+from step_budget import StepBudget
+
+APPS = ("Sample", "Sample2", "2regen", "Lang")
+
+_questions = itertools.count(1)
+
+
+def question():
+    return f"Question {next(_questions)}: what is 2+3?"
+
+
+def core_turn(app, mock, fixed_steps=False):
+    """`async run_turn() -> steps` for a hand-rolled app (agent_core)."""
+    core = CORES[app]()
+    if fixed_steps:  # run the whole script instead of stopping once the first observation answers
+        core.budget = StepBudget(min_steps=core.max_steps, early_finish=False)
+    llm = async_llm(mock)
+
+    async def run_turn():
+        return len(await core.turn(question(), llm))
+    return run_turn
+
+
+def lang_turn(mock, fixed_steps=False):
+    """`async run_turn() -> steps` for the LangChain agent of Lang.py (lang_agent)."""
+    import lang_agent  # LangChain is only needed for this app
+    from conversation_memory import ConversationMemory
+    lang_agent.abc_response = mock  # CustomLLM calls the module-level abc_response
+
+    async def run_turn():
+        query = question()
+        executor = lang_agent.create_executor(lang_agent.WindowedSummaryMemory(conversation=ConversationMemory()),
+                                              None if fixed_steps else query)
+        executor.verbose = False
+        handler = lang_agent.StreamlitCallbackHandler()
+        await executor.ainvoke({"input": query}, config={"callbacks": [handler]})
+        return len(handler.steps)
+    return run_turn
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_memory_mb(trace_memory):
+    if trace_memory:
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        return float("nan")
+    # ru_maxrss is KiB on Linux (bytes on macOS); a process-wide high-water mark
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+async def run_level(run_turn, turns, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with gate:
+            started = time.perf_counter()
+            steps = await run_turn()
+            latencies.append(time.perf_counter() - started)
+            return steps
+
+    started = time.perf_counter()
+    steps = await asyncio.gather(*(one() for _ in range(turns)))
+    return sum(steps), time.perf_counter() - started, sorted(latencies)
+
+
+def bench(app, opts):
+    if app == "Lang":
+        # CustomLLM calls abc_response synchronously, so Lang always gets the blocking mock
+        mock = MockLLM(style="react", tool_steps=opts.tool_steps, latency=opts.latency, jitter=opts.jitter)
+        run_turn = lang_turn(mock, opts.fixed_steps)
+    else:
+        mock_class = AsyncMockLLM if opts.async_backend else MockLLM
+        mock = mock_class(tool_steps=opts.tool_steps, latency=opts.latency, jitter=opts.jitter)
+        run_turn = core_turn(app, mock, opts.fixed_steps)
+
+    results = []
+    for concurrency in opts.concurrency:
+        runtime = AgentRuntime(max_threads=max(opts.threads, concurrency))
+        try:
+            runtime.run(run_level(run_turn, 1, 1))  # warm-up: imports, compiled templates
+            if opts.trace_memory:
+                tracemalloc.reset_peak()
+            steps, wall, latencies = runtime.run(run_level(run_turn, opts.turns, concurrency))
+        finally:
+            runtime.close()
+        results.append({
+            "app": app, "concurrency": concurrency, "turns": opts.turns, "steps": steps,
+            "steps_per_s": steps / wall, "turns_per_s": opts.turns / wall,
+            "p50_ms": percentile(latencies, 50) * 1e3, "p99_ms": percentile(latencies, 99) * 1e3,
+            "peak_mb": peak_memory_mb(opts.trace_memory),
+        })
+    return results
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--apps", nargs="+", choices=APPS, default=list(APPS))
+    args.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    args.add_argument("--turns", type=int, default=100, help="turns per concurrency level")
+    args.add_argument("--tool-steps", type=int, default=1, help="tool calls before the model finishes")
+    args.add_argument("--fixed-steps", action="store_true",
+                      help="always run all --tool-steps (no adaptive step budget or early finish)")
+    args.add_argument("--latency", type=float, default=0.05, help="mock seconds per LLM call")
+    args.add_argument("--jitter", type=float, default=0.0, help="+/- fraction of --latency")
+    args.add_argument("--threads", type=int, default=32, help="runtime executor threads (at least the concurrency)")
+    args.add_argument("--async-backend", action="store_true", help="mock abc_response as a coroutine")
+    args.add_argument("--trace-memory", action="store_true",
+                      help="peak memory from tracemalloc (slower) instead of the process peak RSS")
+    args.add_argument("--json", help="also write the results to this file")
+    opts = args.parse_args()
+
+    if opts.trace_memory:
+        tracemalloc.start()
+    print(f"{'app':<9}{'conc':>6}{'turns':>7}{'steps':>7}{'steps/s':>10}{'turns/s':>10}"
+          f"{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    results = []
+    for app in opts.apps:
+        for row in bench(app, opts):
+            results.append(row)
+            print(f"{row['app']:<9}{row['concurrency']:>6}{row['turns']:>7}{row['steps']:>7}"
+                  f"{row['steps_per_s']:>10.1f}{row['turns_per_s']:>10.1f}"
+                  f"{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['peak_mb']:>10.1f}")
+    if opts.json:
+        with open(opts.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
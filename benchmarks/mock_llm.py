@@ -0,0 +1,106 @@
+# --- Mock abc_response ---
+# A deterministic local stand-in for the real model, for benchmarks and
+# headless runs. It answers from a script of canned replies chosen by the
+# step the prompt is on, so concurrent turns never share state, and it can
+# simulate a first-token delay, streaming speed and jitter.
+#
+#   from benchmarks.mock_llm import MockLLM
+#   abc_response = MockLLM(latency=0.2, tool_steps=2)
+
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+
+# "Steps used so far = 2", "[Current Step]: 2", "Step: 2"
+_STEP = re.compile(r"Step(?:s used so far)?\]?:?\s*=?\s*(\d+)")
+
+
+def json_script(tool_steps=1, tool="calculator", action_input="{step}+3"):
+    """Replies for the JSON agents: `tool_steps` tool calls, then finish.
+
+    `{step}` in `action_input` is filled in per call, so that repeated calls
+    are not mistaken for a loop (step_budget).
+    """
+    calls = [json.dumps({"thought": f"Step {i + 1}: use {tool}", "action": tool,
+                         "action_input": action_input.format(step=i + 2)})
+             for i in range(tool_steps)]
+    return calls + [json.dumps({"thought": "Done.", "action": "finish"})]
+
+
+def react_script(tool_steps=1, tool="Calculator", action_input="2+3", answer="5"):
+    """Replies for the LangChain ReAct agent (Lang.py)."""
+    calls = [f"Thought: I should use {tool}\nAction: {tool}\nAction Input: {action_input}" for _ in range(tool_steps)]
+    return calls + [f"Thought: I now know the final answer\nFinal Answer: {answer}"]
+
+
+class MockLLM:
+    """`abc_response(prompt) -> str` with canned replies and simulated latency.
+
+    `style` is "json" (Sample, Sample2, 2regen) or "react" (Lang), or pass
+    `script`, a list of replies. The reply for a prompt is the script entry
+    for its step: the step number the JSON prompts carry, or the number of
+    observations in the ReAct scratchpad. `latency` is the delay before the
+    reply, `jitter` a +/- fraction of it (seeded from the prompt, so runs
+    repeat exactly) and `chunk_delay`, when set, streams the reply in
+    `chunk_size` character chunks instead of returning it at once.
+    """
+
+    def __init__(self, style="json", script=None, tool_steps=1, latency=0.0, jitter=0.0,
+                 chunk_delay=0.0, chunk_size=8):
+        if script is None:
+            script = react_script(tool_steps) if style == "react" else json_script(tool_steps)
+        self.script = list(script)
+        self.style = style
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def step_of(self, prompt):
+        if self.style == "react":
+            # the format instructions above the question mention Observation too
+            return prompt.rsplit("Question:", 1)[-1].count("\nObservation:") + 1
+        match = None
+        for match in _STEP.finditer(prompt):
+            pass  # the step counter comes after anything the user typed
+        return int(match.group(1)) if match else 1
+
+    def reply(self, prompt):
+        return self.script[min(self.step_of(prompt), len(self.script)) - 1]
+
+    def delay(self, prompt):
+        if not self.jitter:
+            return self.latency
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+        return max(0.0, self.latency * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    def _chunks(self, text):
+        for i in range(0, len(text), self.chunk_size):
+            time.sleep(self.chunk_delay)
+            yield text[i:i + self.chunk_size]
+
+    def __call__(self, prompt, cache_prefix=None):
+        self.calls += 1
+        time.sleep(self.delay(prompt))
+        text = self.reply(prompt)
+        return self._chunks(text) if self.chunk_delay else text
+
+
+class AsyncMockLLM(MockLLM):
+    """The same replies from an async backend: waits on the event loop, holds no thread."""
+
+    async def __call__(self, prompt, cache_prefix=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay(prompt))
+        if not self.chunk_delay:
+            return self.reply(prompt)
+        return self._achunks(self.reply(prompt))
+
+    async def _achunks(self, text):
+        for i in range(0, len(text), self.chunk_size):
+            await asyncio.sleep(self.chunk_delay)
+            yield text[i:i + self.chunk_size]
@@ -0,0 +1,69 @@
+# --- Action Parser Benchmark ---
+# Compares action_parser against the regex-based safe_json_extract the apps
+# used before, on long and noisy model outputs.
+#
+#   python -m benchmarks.parser_bench [--repeat 200]
+
+import argparse
+import json
+import re
+import timeit
+
+from action_parser import ActionParseError, parse_action
+
+ACTION = {"thought": "Need the sum of the column", "action": "python_executor",
+          "action_input": "result = sum(range(10)) # braces {} inside a string"}
+
+
+def safe_json_extract(text):
+    """The previous parser from Sample2.py, kept verbatim as the baseline."""
+    try:
+        text = text.strip()
+        if "```" in text:
+            text = text.split("```")[1]
+        return json.loads(text)
+    except:
+        try:
+            return json.loads(re.search(r"\{.*\}", text, re.DOTALL).group())
+        except:
+            return {"action": "finish"}
+
+
+def make_cases(prose_lines):
+    prose = "\n".join(f"Line {i}: the model keeps reasoning about {{step {i}}} here." for i in range(prose_lines))
+    body = json.dumps(ACTION)
+    return {
+        "clean": body,
+        "fenced": f"```json\n{body}\n```",
+        "prose_before": f"{prose}\nSo my answer is:\n{body}",
+        "prose_after": f"{body}\n{prose}",
+        "fenced_with_prose": f"Here you go:\n```\n{body}\n```\n{prose}\nAnd a second object {{\"action\": \"finish\"}}",
+        "streamed_chunks": [body[i:i + 4] for i in range(0, len(body), 4)] + [prose],
+    }
+
+
+def run_parser(fn, case):
+    try:
+        return fn(case)
+    except ActionParseError:
+        return None
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__)
+    args.add_argument("--repeat", type=int, default=200)
+    args.add_argument("--prose-lines", type=int, default=2000)
+    opts = args.parse_args()
+
+    print(f"{'case':<20}{'regex ms':>12}{'parser ms':>12}{'speedup':>10}  regex ok / parser ok")
+    for name, case in make_cases(opts.prose_lines).items():
+        text = case if isinstance(case, str) else "".join(case)
+        regex_s = timeit.timeit(lambda: safe_json_extract(text), number=opts.repeat) / opts.repeat
+        parser_s = timeit.timeit(lambda: run_parser(parse_action, case), number=opts.repeat) / opts.repeat
+        regex_ok = safe_json_extract(text) == ACTION
+        parser_ok = run_parser(parse_action, case) == ACTION
+        print(f"{name:<20}{regex_s * 1e3:>12.3f}{parser_s * 1e3:>12.3f}{regex_s / parser_s:>9.1f}x  {regex_ok} / {parser_ok}")
+
+
+if __name__ == "__main__":
+    main()
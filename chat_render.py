@@ -0,0 +1,110 @@
+# --- Incremental Chat Rendering ---
+# History and agent_steps are append-only logs, so each entry is formatted to
+# HTML exactly once and the result is kept in session state next to it. A
+# rerun only formats what was appended since the last one, sends the visible
+# page as a single element instead of one st.markdown per message, and keeps
+# older pages behind a button. The Inspector runs as a fragment: paging
+# through steps reruns only the Inspector, not the whole app. Renders are
+# timed as `render` spans when the app activates a turn's trace (see tracing).
+
+import time
+
+import streamlit as st
+
+import tracing
+
+PAGE_SIZE = 20  # chat messages shown before "Show earlier messages"
+STEP_PAGE_SIZE = 10  # Inspector steps per page
+POLL_INTERVAL = 0.3  # seconds between progress refreshes of a running turn
+
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+
+def rendered(items, format_item, key):
+    """Formatted HTML for every item, formatting only the ones new since the last rerun."""
+    cache = st.session_state.setdefault(f"_{key}_rendered", [])
+    if len(cache) > len(items):  # the log was cleared or replaced
+        cache.clear()
+    cache.extend(format_item(item) for item in items[len(cache):])
+    return cache
+
+
+def visible_page(items, key, page_size=PAGE_SIZE, label="messages"):
+    """Index of the first visible item (newest `page_size * pages`); a button reveals one more page."""
+    pages_key = f"_{key}_pages"
+    pages = st.session_state.setdefault(pages_key, 1)
+    hidden = max(0, len(items) - pages * page_size)
+    if hidden:
+        # on_click runs before the rerun, so the new page is counted above
+        st.button(f"Show earlier {label} ({hidden} hidden)", key=f"_{key}_more",
+                  on_click=lambda: st.session_state.update({pages_key: pages + 1}))
+    return hidden
+
+
+def render_history(messages, format_message, key="history", page_size=PAGE_SIZE, container_class="chat-container"):
+    """Render the chat as one HTML block built from cached per-message HTML.
+
+    `format_message` must escape the text it embeds (html.escape): it is user
+    input and model output.
+    """
+    with tracing.span("render", view=key, items=len(messages)):
+        start = visible_page(messages, key, page_size)
+        blocks = rendered(messages, format_message, key)[start:]
+        body = "\n".join(blocks)
+        st.markdown(f"<div class='{container_class}'>\n{body}\n</div>", unsafe_allow_html=True)
+
+
+@_fragment
+def render_steps(steps, format_step, key="inspector", page_size=STEP_PAGE_SIZE, title="Step", allow_html=False):
+    """Inspector: one page of expanders, newest page first, each body a single cached element.
+
+    Bodies are markdown. With `allow_html` they are rendered as raw HTML, so
+    `format_step` must escape the thoughts and observations it embeds
+    (html.escape): they come from the model and the tools.
+    """
+    if not steps:
+        return
+    with tracing.span("render", view=key, items=len(steps)):
+        _render_steps(steps, format_step, key, page_size, title, allow_html)
+
+
+def _render_steps(steps, format_step, key, page_size, title, allow_html):
+    bodies = rendered(steps, format_step, key)
+    page = 0  # pages count back from the newest step
+    if len(steps) > page_size:
+        pages = (len(steps) + page_size - 1) // page_size
+        page = st.selectbox(
+            "Inspector page", range(pages), key=f"_{key}_page",
+            format_func=lambda p: f"Steps {max(0, len(steps) - (p + 1) * page_size) + 1}-{len(steps) - p * page_size}"
+            + (" (latest)" if p == 0 else ""),
+        )
+    end = len(steps) - page * page_size
+    for idx in range(max(0, end - page_size), end):
+        with st.expander(f"{title} {idx+1}"):
+            st.markdown(bodies[idx], unsafe_allow_html=allow_html)
+
+
+def _poll_job(job, render_live, key):
+    if job.done():
+        st.rerun()  # let the app pick up the result
+    render_live(job)
+    st.button("Stop", key=f"_{key}_stop", on_click=job.cancel)
+
+
+_poll_fragment = st.fragment(run_every=POLL_INTERVAL)(_poll_job) if hasattr(st, "fragment") else None
+
+
+def poll_job(job, render_live, key="job"):
+    """Show a background job's progress with `render_live(job)` and rerun the app once it settles.
+
+    With st.fragment the progress refreshes itself every POLL_INTERVAL without
+    rerunning the app; on older Streamlit this run waits for the job instead.
+    """
+    if _poll_fragment is not None:
+        return _poll_fragment(job, render_live, key)
+    placeholder = st.empty()
+    while not job.done():
+        with placeholder.container():
+            render_live(job)
+        time.sleep(POLL_INTERVAL)
+    st.rerun()
@@ -0,0 +1,166 @@
+# --- Conversation Memory ---
+# Shared by the hand-rolled agents and Lang.py. Recent turns live in a ring
+# buffer; turns that fall out of it are folded into a rolling summary on a
+# background thread, and render() never returns more than the token budget,
+# so prompt size stays flat however long the session runs.
+
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# One summary at a time per memory; a couple of threads cover all sessions.
+_SUMMARIZER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+ROLE_LABELS = {"user": "User", "agent": "Agent", "assistant": "Agent", "ai": "Agent"}
+
+
+def approx_token_count(text):
+    """~4 characters per token; close enough for budgeting without a tokenizer."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, budget, token_counter=approx_token_count):
+    """Keep the end of `text` (the newest part) within `budget` tokens."""
+    if budget <= 0:
+        return ""
+    cut = False
+    while text and token_counter(text) > budget:
+        # Cut proportionally to the overshoot, at least one character
+        excess = max(1, len(text) - len(text) * budget // token_counter(text))
+        text, cut = text[excess:], True
+    if cut and " " in text:
+        text = text[text.index(" ") + 1:]  # don't start mid-word
+    return text
+
+
+def _first_sentence(text, limit=160):
+    sentence = re.split(r"(?<=[.!?])\s", " ".join(text.split()), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3] + "..."
+
+
+def extractive_summarizer(summary, turns):
+    """Cheap default: append the first sentence of each evicted turn."""
+    lines = [summary] if summary else []
+    lines += [f"{ROLE_LABELS.get(role, role)}: {_first_sentence(content)}" for role, content in turns]
+    return "\n".join(lines)
+
+
+def llm_summarizer(llm, max_words=120):
+    """Build a summarizer that asks `llm(prompt) -> str` to fold turns into the summary."""
+    def summarize(summary, turns):
+        transcript = "\n".join(f"{ROLE_LABELS.get(role, role)}: {content}" for role, content in turns)
+        return llm(
+            f"Update the running summary of a conversation with the new turns below.\n"
+            f"Keep names, numbers, files and open questions; use at most {max_words} words.\n\n"
+            f"Current summary:\n{summary or 'None'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+        ).strip()
+    return summarize
+
+
+class ConversationMemory:
+    """Ring buffer of recent turns plus a rolling summary of older ones.
+
+    `token_counter(text) -> int` is pluggable (e.g. a tiktoken encoder's
+    `lambda s: len(enc.encode(s))`). `summarizer(summary, turns) -> str` runs
+    in the background; if it fails, the extractive summarizer is used instead.
+    """
+
+    def __init__(self, max_turns=8, token_budget=1000, summary_budget=250,
+                 token_counter=approx_token_count, summarizer=extractive_summarizer):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.token_counter = token_counter
+        self.summarizer = summarizer
+        self.summary = ""
+        self.version = 0  # bumped on every change; session_store's cheap dirty check
+        self._recent = deque()
+        self._pending = []  # evicted from the ring buffer, not yet summarized
+        self._lock = threading.Lock()
+        self._job = None
+
+    def add(self, role, content):
+        with self._lock:
+            self._recent.append((role, str(content)))
+            self.version += 1
+            while len(self._recent) > self.max_turns:
+                self._pending.append(self._recent.popleft())
+            if self._pending and self._job is None:
+                self._job = _SUMMARIZER.submit(self._summarize)
+
+    def _summarize(self):
+        while True:
+            with self._lock:
+                turns, summary = self._pending[:], self.summary
+                if not turns:
+                    self._job = None
+                    return
+            try:
+                updated = self.summarizer(summary, turns)
+            except Exception:
+                updated = extractive_summarizer(summary, turns)
+            updated = truncate_to_tokens(updated, self.summary_budget, self.token_counter)
+            with self._lock:
+                if self._pending[:len(turns)] == turns:  # not cleared meanwhile
+                    self.summary = updated
+                    del self._pending[:len(turns)]
+                    self.version += 1
+
+    def flush(self):
+        """Wait for the background summary to catch up (tests, batch runs)."""
+        while self._job is not None:
+            self._job.result()
+
+    def turns(self):
+        with self._lock:
+            return self._pending + list(self._recent)
+
+    def render(self, token_budget=None):
+        """Summary plus the newest turns that fit, oldest first, within the budget."""
+        budget = self.token_budget if token_budget is None else token_budget
+        with self._lock:
+            summary, turns = self.summary, self._pending + list(self._recent)
+        lines = []
+        for role, content in reversed(turns):
+            line = f"{ROLE_LABELS.get(role, role)}: {content}"
+            cost = self.token_counter(line) + 1
+            if cost > budget:
+                if not lines:  # the newest turn alone is over budget: keep its tail
+                    lines.append(truncate_to_tokens(line, budget, self.token_counter))
+                    budget = 0
+                break
+            lines.append(line)
+            budget -= cost
+        prefix = "Summary of earlier conversation: "
+        budget -= self.token_counter(prefix) + 1
+        if summary and budget > 0:
+            lines.append(prefix + truncate_to_tokens(summary, budget, self.token_counter))
+        return "\n".join(reversed(lines))
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._recent.clear()
+            self._pending.clear()
+            self.version += 1
+
+    def to_state(self):
+        """Plain data for session_store; the summarizer and token counter are not included."""
+        with self._lock:
+            return {"summary": self.summary, "recent": [list(turn) for turn in self._recent],
+                    "pending": [list(turn) for turn in self._pending]}
+
+    @classmethod
+    def from_state(cls, state, **options):
+        memory = cls(**options)
+        memory.summary = state.get("summary", "")
+        memory._recent.extend(tuple(turn) for turn in state.get("recent", ()))
+        memory._pending.extend(tuple(turn) for turn in state.get("pending", ()))
+        if memory._pending:  # the previous process did not get to summarize these
+            memory._job = _SUMMARIZER.submit(memory._summarize)
+        return memory
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending) + len(self._recent)
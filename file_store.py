@@ -0,0 +1,361 @@
+# --- Upload Store ---
+# Uploads are spooled to disk once (content-addressed by SHA-256) and read
+# back through mmap or streaming readers, so previewing a multi-GB CSV never
+# materializes it as bytes + str + list of lines. Encoding detection is
+# incremental and CSV / JSON-lines statistics are computed once per digest.
+
+import codecs
+import csv
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+CHUNK_SIZE = 1 << 20
+ENCODING_SAMPLE = 4 << 20  # bytes checked before trusting utf-8
+UPLOAD_DIR = os.environ.get("AGENT_UPLOAD_DIR") or os.path.join(tempfile.gettempdir(), "agent-uploads")
+MAX_SPOOLED = int(os.environ.get("AGENT_UPLOAD_SPOOLED") or 64)  # uploads remembered (and kept on disk)
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"),
+]
+# BOM -> the codec that decodes what follows it, for line scanning
+_BOM_CODECS = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF32_LE, "utf-32-le"), (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+
+class SpooledFile:
+    def __init__(self, path, digest, name, size):
+        self.path = path
+        self.digest = digest
+        self.name = name
+        self.size = size
+
+
+# (file_id or path, ...) -> SpooledFile, least recently used first
+_spooled = OrderedDict()
+_spool_lock = threading.Lock()
+
+
+def spool_upload(upload, directory=UPLOAD_DIR):
+    """Write an upload to disk once and return its SpooledFile.
+
+    `upload` is a Streamlit UploadedFile (or any BytesIO), a filesystem
+    path or an already spooled file (e.g. restored by session_store); paths
+    are hashed in place instead of being copied. Uploads with a `file_id`
+    and paths are remembered, up to MAX_SPOOLED of them; the spooled copy
+    of a forgotten upload is removed unless another one shares it.
+    """
+    if isinstance(upload, SpooledFile):
+        return upload
+    if isinstance(upload, (str, os.PathLike)):
+        path = os.fspath(upload)
+        key = (path, os.path.getmtime(path))
+    elif getattr(upload, "file_id", None):
+        key = (upload.file_id, getattr(upload, "name", ""), getattr(upload, "size", None))
+    else:
+        key = None  # nothing stable to remember it by; spooling again is deduplicated by digest
+    with _spool_lock:
+        if key in _spooled:
+            _spooled.move_to_end(key)
+            return _spooled[key]
+
+    if isinstance(upload, (str, os.PathLike)):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        spooled = SpooledFile(path, digest.hexdigest(), os.path.basename(path), os.path.getsize(path))
+    else:
+        spooled = _spool_buffer(upload, directory)
+    if key is None:
+        return spooled
+    with _spool_lock:
+        _spooled[key] = spooled
+        evicted = []
+        while len(_spooled) > MAX_SPOOLED:
+            evicted.append(_spooled.popitem(last=False)[1])
+        in_use = {other.path for other in _spooled.values()}
+    for old in evicted:
+        # Paths are the user's own files; only spooled copies are ours to remove
+        if old.path not in in_use and os.path.basename(old.path) == old.digest:
+            try:
+                os.remove(old.path)
+            except OSError:
+                pass
+    return spooled
+
+
+def _spool_buffer(upload, directory):
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    # getbuffer() exposes the upload's bytes without copying them
+    buffer = upload.getbuffer() if hasattr(upload, "getbuffer") else memoryview(upload.getvalue())
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for start in range(0, len(buffer), CHUNK_SIZE):
+                chunk = buffer[start:start + CHUNK_SIZE]
+                digest.update(chunk)
+                out.write(chunk)
+        size = len(buffer)
+    finally:
+        buffer.release()
+    path = os.path.join(directory, digest.hexdigest())
+    if os.path.exists(path):
+        os.remove(tmp_path)  # same content was spooled before
+    else:
+        os.replace(tmp_path, path)
+    return SpooledFile(path, digest.hexdigest(), getattr(upload, "name", os.path.basename(path)), size)
+
+
+@lru_cache(maxsize=256)
+def detect_encoding(path, digest=None):
+    """BOM sniffing, then an incremental utf-8 decode of the first ENCODING_SAMPLE bytes.
+
+    `digest` only keys the cache. Falls back to cp1252, then latin-1 (which
+    decodes anything).
+    """
+    with open(path, "rb") as f:
+        head = f.read(4)
+        for bom, encoding in _BOMS:
+            if head.startswith(bom):
+                return encoding
+        f.seek(0)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        seen = 0
+        try:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                decoder.decode(chunk)
+                seen += len(chunk)
+                if seen >= ENCODING_SAMPLE:
+                    return "utf-8"
+            decoder.decode(b"", final=True)
+            return "utf-8"
+        except UnicodeDecodeError:
+            pass
+        f.seek(0)
+        try:
+            f.read(ENCODING_SAMPLE).decode("cp1252")
+            return "cp1252"
+        except UnicodeDecodeError:
+            return "latin-1"
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _layout(mapped, encoding):
+    """`(codec, newline, offset)` for scanning `mapped` line by line.
+
+    The newline is encoded like the text (two or four bytes in UTF-16/32),
+    `offset` skips the BOM, and a match only counts when it starts on a
+    code-unit boundary (`len(newline)` bytes) counted from `offset`.
+    """
+    if encoding in ("utf-8-sig", "utf-16", "utf-32"):
+        for bom, codec in _BOM_CODECS:
+            if mapped[:len(bom)] == bom:
+                return codec, "\n".encode(codec), len(bom)
+    return encoding, b"\n", 0
+
+
+def _find_newline(mapped, newline, offset, start):
+    found = mapped.find(newline, start)
+    while found != -1 and (found - offset) % len(newline):
+        found = mapped.find(newline, found + 1)
+    return found
+
+
+def _rfind_newline(mapped, newline, offset, end):
+    found = mapped.rfind(newline, offset, end)
+    while found != -1 and (found - offset) % len(newline):
+        found = mapped.rfind(newline, offset, found + len(newline) - 1)
+    return found
+
+
+def head_lines(spooled, n=5):
+    """First `n` lines, found by scanning the mapped file for newlines."""
+    encoding = detect_encoding(spooled.path, spooled.digest)
+    mapped = _map(spooled.path)
+    if mapped is None:
+        return []
+    with mapped:
+        codec, newline, offset = _layout(mapped, encoding)
+        end = offset
+        for _ in range(n):
+            found = _find_newline(mapped, newline, offset, end)
+            if found == -1:
+                end = len(mapped)
+                break
+            end = found + len(newline)
+        return mapped[offset:end].decode(codec, errors="replace").splitlines()[:n]
+
+
+def tail_lines(spooled, n=5):
+    """Last `n` lines, found by scanning backwards from the end of the mapped file."""
+    encoding = detect_encoding(spooled.path, spooled.digest)
+    mapped = _map(spooled.path)
+    if mapped is None:
+        return []
+    with mapped:
+        codec, newline, offset = _layout(mapped, encoding)
+        end = len(mapped)
+        if end - len(newline) >= offset and mapped[end - len(newline):end] == newline \
+                and (end - len(newline) - offset) % len(newline) == 0:
+            end -= len(newline)
+        start = end
+        for _ in range(n):
+            found = _rfind_newline(mapped, newline, offset, start)
+            if found == -1:
+                start = offset
+                break
+            start = found
+        return mapped[start:end].decode(codec, errors="replace").splitlines()[-n:]
+
+
+# --- Statistics ---
+def _value_type(value):
+    lowered = value.strip().lower()
+    if lowered in ("true", "false"):
+        return "bool"
+    try:
+        int(lowered)
+        return "int"
+    except ValueError:
+        pass
+    try:
+        float(lowered)
+        return "float"
+    except ValueError:
+        return "str"
+
+
+def _merge_type(current, new):
+    if current is None or current == new:
+        return new
+    if {current, new} == {"int", "float"}:
+        return "float"
+    return "str"
+
+
+def _csv_stats(path, encoding, delimiter):
+    with open(path, newline="", encoding=encoding, errors="replace") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        columns = next(reader, [])
+        types = [None] * len(columns)
+        empty = [0] * len(columns)
+        rows = 0
+        for row in reader:
+            rows += 1
+            for i, value in enumerate(row[:len(columns)]):
+                if value == "":
+                    empty[i] += 1
+                elif types[i] != "str":
+                    types[i] = _merge_type(types[i], _value_type(value))
+    return {"rows": rows, "columns": [
+        {"name": name, "dtype": dtype or "empty", "empty": blanks}
+        for name, dtype, blanks in zip(columns, types, empty)
+    ]}
+
+
+def _json_type(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return type(value).__name__
+    if value is None:
+        return None
+    return {str: "str", list: "list", dict: "object"}.get(type(value), "str")
+
+
+def _jsonl_stats(path, encoding):
+    types, empty, rows, invalid = {}, {}, 0, 0
+    with open(path, encoding=encoding, errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                invalid += 1
+                continue
+            rows += 1
+            if not isinstance(record, dict):
+                record = {"value": record}
+            for key, value in record.items():
+                kind = _json_type(value)
+                if kind is None:
+                    empty[key] = empty.get(key, 0) + 1
+                else:
+                    types[key] = _merge_type(types.get(key), kind)
+    keys = list(dict.fromkeys([*types, *empty]))
+    return {"rows": rows, "invalid_lines": invalid, "columns": [
+        {"name": key, "dtype": types.get(key) or "empty", "empty": empty.get(key, 0)} for key in keys
+    ]}
+
+
+def _line_count(path):
+    count = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+@lru_cache(maxsize=64)
+def _stats(path, digest, kind):
+    encoding = detect_encoding(path, digest)
+    if kind == "csv":
+        stats = _csv_stats(path, encoding, ",")
+    elif kind == "tsv":
+        stats = _csv_stats(path, encoding, "\t")
+    elif kind == "jsonl":
+        stats = _jsonl_stats(path, encoding)
+    else:
+        stats = {"lines": _line_count(path)}
+    stats["encoding"] = encoding
+    return stats
+
+
+def file_stats(spooled):
+    """Row count, columns and dtypes in one streaming pass; cached per file digest."""
+    name = spooled.name.lower()
+    if name.endswith(".csv"):
+        kind = "csv"
+    elif name.endswith((".tsv", ".tab")):
+        kind = "tsv"
+    elif name.endswith((".jsonl", ".ndjson")):
+        kind = "jsonl"
+    else:
+        kind = "text"
+    return dict(_stats(spooled.path, spooled.digest, kind), kind=kind, size=spooled.size)
+
+
+def describe_stats(spooled):
+    stats = file_stats(spooled)
+    lines = [f"File: {spooled.name} ({stats['size']:,} bytes, {stats['encoding']})"]
+    if "rows" in stats:
+        lines.append(f"Rows: {stats['rows']:,}")
+        columns = []
+        for column in stats["columns"]:
+            blanks = f", {column['empty']:,} empty" if column["empty"] else ""
+            columns.append(f"{column['name']} ({column['dtype']}{blanks})")
+        lines.append(f"Columns: {', '.join(columns) or 'none'}")
+    else:
+        lines.append(f"Lines: {stats['lines']:,}")
+    if stats.get("invalid_lines"):
+        lines.append(f"Invalid lines: {stats['invalid_lines']:,}")
+    return "\n".join(lines)
@@ -0,0 +1,274 @@
+# --- Intent Router ---
+# A pre-LLM stage for trivial messages. Greetings, arithmetic that is
+# clearly meant as such and "what's the date" are recognized locally and
+# sent straight to the tool that answers them, so those turns never wait on
+# abc_response. Regex rules go first; an optional TF-IDF + logistic
+# regression model, trained on labeled messages and stored as JSON, catches
+# paraphrases. Only matches at or above the confidence threshold are
+# routed, everything else goes to the agent as before.
+#
+#   python intent_router.py train labeled.jsonl -o router-model.json
+#   AGENT_ROUTER_MODEL=router-model.json AGENT_ROUTER_THRESHOLD=0.9 streamlit run Sample2.py
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+from collections import Counter
+
+from safe_math import MathError, evaluate
+
+# Tools that answer each intent, by the names the apps register them under
+INTENT_TOOLS = {
+    "greeting": ("conversation",),
+    "math": ("calculator", "Calculator"),
+    "date": ("DateInfo",),
+}
+THRESHOLD = float(os.environ.get("AGENT_ROUTER_THRESHOLD") or 0.9)
+MODEL_PATH = os.environ.get("AGENT_ROUTER_MODEL")
+ENABLED = os.environ.get("AGENT_ROUTER", "1") != "0"
+
+_GREETING = re.compile(
+    r"^(?:hi|hello|hey|hiya|yo|howdy|greetings|good (?:morning|afternoon|evening)|thanks|thank you|thx|"
+    r"bye|goodbye|see you)(?: there| all| everyone| so much| a lot)?[\s!.,:)]*$", re.IGNORECASE)
+_DATE = re.compile(
+    r"^(?:what(?:'s| is) (?:the |today'?s )?(?:date|day|time|year|month)(?: today| now| is it)?|"
+    r"what day (?:is it|is today)|what time is it|today'?s date|current (?:date|time))[\s?.!]*$",
+    re.IGNORECASE)
+_MATH_PREFIX = re.compile(r"^(?:what(?:'s| is)|calculate|compute|evaluate|solve)\s+", re.IGNORECASE)
+_MATH_FUNCTION = re.compile(r"\b(?:sqrt|log|ln|exp|sin|cos|tan|factorial|abs|pi)\b")
+_MATH_OPERATOR = re.compile(r"[-+*/%^()]|" + _MATH_FUNCTION.pattern)
+_SPACED_OPERATOR = re.compile(r"\s(?:\*\*|[-+*/%^])\s")
+# Dates (2026-10-18, 12/25/2026), phone numbers (555-1234) and ranges (10-12) evaluate fine but are not sums
+_NOT_ARITHMETIC = re.compile(r"\d-\d|\d+/\d+/\d+")
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+
+def extract_expression(message):
+    """The arithmetic expression a message consists of, or None if it is anything more."""
+    text = _MATH_PREFIX.sub("", message.strip()).rstrip(" ?=.!")
+    if not re.search(r"\d", text) or not _MATH_OPERATOR.search(text) or _NOT_ARITHMETIC.search(text):
+        return None
+    try:
+        evaluate(text.replace("^", "**"))  # strict: calculate() would dig numbers out of any sentence
+    except (MathError, ArithmeticError):
+        return None
+    return text
+
+
+def math_confidence(message):
+    """1.0 with an explicit cue ("calculate ...", "... =", a function, spaced operators), else 0.8."""
+    message = message.strip()
+    explicit = (_MATH_PREFIX.match(message) or message.rstrip(" ?").endswith("=")
+                or _MATH_FUNCTION.search(message) or _SPACED_OPERATOR.search(message))
+    return 1.0 if explicit else 0.8
+
+
+# The action input for each intent; None means the message cannot be routed after all
+EXTRACTORS = {
+    "greeting": lambda message: message.strip(),
+    "math": extract_expression,
+    "date": lambda message: message.strip(),
+}
+
+
+def rule_intent(message):
+    """`(intent, confidence)` from the built-in rules, or None."""
+    if _GREETING.match(message):
+        return "greeting", 0.95
+    if _DATE.match(message):
+        return "date", 0.95
+    if extract_expression(message) is not None:
+        return "math", math_confidence(message)
+    return None
+
+
+class Route:
+    def __init__(self, intent, tool, action_input, confidence, source):
+        self.intent = intent
+        self.tool = tool
+        self.action_input = action_input
+        self.confidence = confidence
+        self.source = source  # "rule" or "model"
+
+    def describe(self):
+        return f"{self.intent} by {self.source}, {self.confidence:.2f}"
+
+
+# ---- Classifier ----
+
+def features(text):
+    """Word unigrams and bigrams of a message."""
+    words = [word.lower() for word in _WORD.findall(text)]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TfidfClassifier:
+    """Multinomial logistic regression over L2-normalized TF-IDF features, as plain JSON."""
+
+    def __init__(self, classes, vocabulary, idf, weights, bias):
+        self.classes = classes
+        self.vocabulary = vocabulary  # term -> column
+        self.idf = idf
+        self.weights = weights  # one row of columns per class
+        self.bias = bias
+
+    def vector(self, text):
+        counts = Counter(self.vocabulary[f] for f in features(text) if f in self.vocabulary)
+        vector = {column: count * self.idf[column] for column, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {column: value / norm for column, value in vector.items()}
+
+    def probabilities(self, vector):
+        scores = [b + sum(row[column] * value for column, value in vector.items())
+                  for row, b in zip(self.weights, self.bias)]
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, text):
+        """`(class, probability)` of the most likely class."""
+        probabilities = self.probabilities(self.vector(text))
+        best = max(range(len(self.classes)), key=probabilities.__getitem__)
+        return self.classes[best], probabilities[best]
+
+    @classmethod
+    def train(cls, examples, epochs=30, learning_rate=0.5, l2=1e-4, seed=0):
+        """Fit on `(text, label)` pairs; include an "other" label for messages to leave alone."""
+        classes = sorted({label for _, label in examples})
+        documents = [set(features(text)) for text, _ in examples]
+        df = Counter(term for document in documents for term in document)
+        vocabulary = {term: column for column, term in enumerate(sorted(df))}
+        idf = [0.0] * len(vocabulary)
+        for term, column in vocabulary.items():
+            idf[column] = math.log((1 + len(examples)) / (1 + df[term])) + 1
+        model = cls(classes, vocabulary, idf, [[0.0] * len(vocabulary) for _ in classes], [0.0] * len(classes))
+        data = [(model.vector(text), classes.index(label)) for text, label in examples]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for vector, target in data:
+                probabilities = model.probabilities(vector)
+                for k, row in enumerate(model.weights):
+                    gradient = probabilities[k] - (k == target)
+                    model.bias[k] -= learning_rate * gradient
+                    for column, value in vector.items():
+                        row[column] -= learning_rate * (gradient * value + l2 * row[column])
+        return model
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"classes": self.classes, "vocabulary": self.vocabulary, "idf": self.idf,
+                       "weights": self.weights, "bias": self.bias}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["classes"], data["vocabulary"], data["idf"], data["weights"], data["bias"])
+
+
+# ---- Router ----
+
+class IntentRouter:
+    """Rules, then the optional classifier; a Route at `threshold` confidence or better.
+
+    `stats()` is the hit rate: the share of messages answered without the model.
+    """
+
+    def __init__(self, threshold=THRESHOLD, classifier=None, rules=rule_intent, intent_tools=None):
+        self.threshold = threshold
+        self.classifier = classifier
+        self.rules = rules
+        self.intent_tools = intent_tools or INTENT_TOOLS
+        self.total = 0
+        self.routed = Counter()
+        self._lock = threading.Lock()
+
+    def route(self, message, tools=()):
+        """The Route for `message` among the available `tools`, or None to use the agent."""
+        route = self._match(message or "", set(tools))
+        with self._lock:
+            self.total += 1
+            if route is not None:
+                self.routed[route.intent] += 1
+        return route
+
+    def _match(self, message, tools):
+        if len(message) > 200:  # trivial messages are short; skip the classifier on real questions
+            return None
+        candidates = []
+        matched = self.rules(message)
+        if matched:
+            candidates.append((*matched, "rule"))
+        if self.classifier is not None:
+            candidates.append((*self.classifier.predict(message), "model"))
+        for intent, confidence, source in candidates:
+            if confidence < self.threshold or intent not in self.intent_tools:
+                continue
+            tool = next((name for name in self.intent_tools[intent] if name in tools), None)
+            action_input = EXTRACTORS[intent](message) if tool else None
+            if action_input is not None:
+                return Route(intent, tool, action_input, confidence, source)
+        return None
+
+    def stats(self):
+        with self._lock:
+            routed = sum(self.routed.values())
+            return {"total": self.total, "routed": routed, "hit_rate": routed / self.total if self.total else 0.0,
+                    "by_intent": dict(self.routed)}
+
+
+_default_router = None
+_default_lock = threading.Lock()
+
+
+def default_router():
+    """Process-wide router (AGENT_ROUTER_MODEL, AGENT_ROUTER_THRESHOLD), or None when AGENT_ROUTER=0."""
+    global _default_router
+    if not ENABLED:
+        return None
+    with _default_lock:
+        if _default_router is None:
+            classifier = TfidfClassifier.load(MODEL_PATH) if MODEL_PATH else None
+            _default_router = IntentRouter(classifier=classifier)
+        return _default_router
+
+
+def main():
+    args = argparse.ArgumentParser(description="Train or try the intent router's classifier.")
+    commands = args.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help='fit on a JSONL file of {"text": ..., "intent": ...}')
+    train.add_argument("examples")
+    train.add_argument("-o", "--output", required=True)
+    train.add_argument("--epochs", type=int, default=30)
+    route = commands.add_parser("route", help="show how messages (one per line on stdin) are routed")
+    route.add_argument("--model")
+    route.add_argument("--threshold", type=float, default=THRESHOLD)
+    opts = args.parse_args()
+
+    if opts.command == "train":
+        with open(opts.examples, encoding="utf-8") as f:
+            examples = [(r["text"], r["intent"]) for r in map(json.loads, filter(str.strip, f))]
+        model = TfidfClassifier.train(examples, epochs=opts.epochs)
+        model.save(opts.output)
+        correct = sum(model.predict(text)[0] == label for text, label in examples)
+        print(f"{len(examples)} examples, {len(model.classes)} intents, {len(model.vocabulary)} features, "
+              f"training accuracy {correct / len(examples):.1%}", file=sys.stderr)
+        return
+    router = IntentRouter(opts.threshold, TfidfClassifier.load(opts.model) if opts.model else None)
+    tools = [name for names in INTENT_TOOLS.values() for name in names]
+    for line in sys.stdin:
+        matched = router.route(line.strip(), tools)
+        print(f"{matched.tool}({matched.action_input!r}) [{matched.describe()}]" if matched else "agent",
+              "<-", line.strip())
+    print(router.stats(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# --- LangChain Agent ---
+# The LangChain half of Lang.py: the abc_response LLM wrapper, memory,
+# callback handler, tools and the ReAct agent, with no Streamlit in it.
+# Importing LangChain takes over a second, so Lang.py loads this module
+# lazily (see startup) and only the first turn of a process waits for it;
+# batch_run and the benchmarks import it directly. The agent parts are
+# built on first use and shared by every session of the process.
+#
+# abc_response is looked up here (a module global or builtin) when a call
+# is made; import or define it in this module.
+
+import asyncio
+import os
+from datetime import datetime
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain.agents import AgentExecutor, Tool, ZeroShotAgent
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.llms.base import LLM
+from langchain.schema import AgentAction, AgentFinish, BaseMemory, LLMResult
+from langchain.schema.output import GenerationChunk
+
+import tracing
+from agent_runtime import JobCancelled
+from intent_router import Route
+from llm_client import iter_response, stream_until
+from llm_gateway import coalesced, default_gateway
+from prompt_builder import split_prompt, static_prefix
+from resilience import default_policy, resilient
+from response_cache import ResponseCache
+from safe_math import MathError, calculate
+from search_index import load_index
+from step_budget import StepBudget, is_error
+from tool_registry import ToolRegistry
+
+# Create a custom LLM class that inherits from LangChain's LLM
+class CustomLLM(LLM):
+    """Custom LLM wrapper for abc_response function."""
+    
+    # Optional completion cache shared by every session (see get_response_cache)
+    response_cache: Optional[Any] = None
+    # Static head of the agent prompt, passed to abc_response as cache_prefix
+    cache_prefix: Optional[str] = None
+    # Shared LLM gateway: identical concurrent prompts make one abc_response call
+    gateway: Optional[Any] = None
+    # Deadlines, hedging, retries and circuit breaker for abc_response
+    resilience: Optional[Any] = None
+    
+    @property
+    def _llm_type(self) -> str:
+        """Return type of LLM."""
+        return "custom"
+    
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Call the custom LLM with the provided prompt.
+
+        Backend failures raise (see resilience) rather than come back as text
+        for the agent to parse.
+        """
+        # Drain the stream so callbacks still see every token
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+    
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream the abc_response completion, stopping generation at the first stop sequence."""
+        cached = self.response_cache.get(prompt, stop) if self.response_cache else None
+        if cached is not None:
+            chunk = GenerationChunk(text=cached, generation_info={"cache_hit": True})
+            if run_manager:
+                run_manager.on_llm_new_token(cached, chunk=chunk)
+            yield chunk
+            return
+        
+        tokens = []
+        prompt = split_prompt(prompt, self.cache_prefix)
+        backend = resilient(abc_response, self.resilience) if self.resilience else abc_response
+        if self.gateway:
+            backend = coalesced(backend, self.gateway)
+        for token in stream_until(iter_response(backend, prompt), stop=stop):
+            tokens.append(token)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        
+        # Only complete generations are cached
+        if self.response_cache:
+            self.response_cache.set(prompt, "".join(tokens), stop)
+    
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """Get identifying parameters."""
+        return {"model": "custom_abc_response"}
+
+# Token-budgeted memory shared with the hand-rolled agents
+class WindowedSummaryMemory(BaseMemory):
+    """Ring buffer of recent turns plus a rolling summary, rendered within a token budget."""
+    
+    conversation: Any = None
+    memory_key: str = "chat_history"
+    input_key: str = "input"
+    output_key: str = "output"
+    
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+    
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        return {self.memory_key: self.conversation.render() or "None"}
+    
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        self.conversation.add("user", inputs[self.input_key])
+        self.conversation.add("agent", outputs[self.output_key])
+    
+    def clear(self) -> None:
+        self.conversation.clear()
+
+
+# ReAct suffix with room for the (bounded) conversation history
+AGENT_SUFFIX = """Conversation so far:
+{chat_history}
+
+Begin!
+
+Question: {input}
+Thought:{agent_scratchpad}"""
+
+# Create a custom callback handler to track agent steps for display
+class StreamlitCallbackHandler(BaseCallbackHandler):
+    # Let on_llm_new_token abort the run once the turn's job is cancelled
+    raise_error = True
+    
+    def __init__(self, token_placeholder=None, should_stop: Optional[Callable[[], bool]] = None,
+                 trace: Optional[tracing.Trace] = None):
+        self.steps = []
+        self.token_placeholder = token_placeholder
+        self.should_stop = should_stop
+        self.tokens = []
+        # Callbacks may run on executor threads, so spans are parented explicitly
+        self.trace = trace
+        self._step_span = self._llm_span = self._parse_span = self._tool_span = None
+        
+    def on_route(self, route: Route) -> None:
+        """A routed step has no LLM call; its span opens before the tool runs."""
+        if self.trace is not None:
+            self._step_span = self.trace.root.child("step", step=len(self.steps) + 1, routed=route.intent)
+    
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs) -> Any:
+        """Run on LLM start."""
+        self.tokens = []
+        if self.trace is not None:
+            if self._step_span is None:
+                self._step_span = self.trace.root.child("step", step=len(self.steps) + 1)
+            self._llm_span = self._step_span.child("llm", prompt_chars=sum(len(p) for p in prompts), cache_hit=False)
+    
+    def on_llm_new_token(self, token: str, **kwargs) -> Any:
+        """Render each new token as soon as it arrives."""
+        if self.should_stop and self.should_stop():
+            raise JobCancelled()
+        self.tokens.append(token)
+        chunk = kwargs.get("chunk")
+        if self._llm_span is not None and chunk is not None and (chunk.generation_info or {}).get("cache_hit"):
+            self._llm_span.set(cache_hit=True)
+        if self.token_placeholder is not None:
+            self.token_placeholder.markdown("".join(self.tokens))
+    
+    def on_llm_end(self, response: LLMResult, **kwargs) -> Any:
+        """Time the LLM call; what follows until the action is output parsing."""
+        if self._llm_span is not None:
+            text = "".join(g.text for generations in response.generations for g in generations)
+            self._llm_span.finish(response_chars=len(text))
+            self._parse_span = self._step_span.child("parse")
+    
+    def on_agent_action(self, action: AgentAction, **kwargs) -> Any:
+        """Run on agent action."""
+        if self._parse_span is not None:
+            self._parse_span.finish()
+        self.steps.append({
+            "type": "action",
+            "tool": action.tool, 
+            "tool_input": action.tool_input,
+            "log": action.log
+        })
+    
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs) -> Any:
+        if self._step_span is not None:
+            name = serialized.get("name")
+            self._tool_span = self._step_span.child(f"tool:{name}", input_chars=len(input_str))
+            registry = get_tool_registry()
+            if name in registry and registry.get(name).cacheable:
+                self._tool_span.set(cache_hit=registry.cached(name, input_str))
+    
+    def on_tool_end(self, output: str, **kwargs) -> Any:
+        """Run on tool end."""
+        if self._tool_span is not None:
+            self._tool_span.finish(output_chars=len(str(output)))
+        if self.steps:
+            self.steps[-1]["output"] = output
+            self._finish_step()
+    
+    def on_tool_error(self, error: BaseException, **kwargs) -> Any:
+        if self._tool_span is not None:
+            self._tool_span.finish(error=f"{type(error).__name__}: {error}")
+        self._finish_step()
+    
+    def on_agent_finish(self, finish: AgentFinish, **kwargs) -> Any:
+        """Run on agent end."""
+        if self._parse_span is not None:
+            self._parse_span.finish()
+        self.steps.append({
+            "type": "finish",
+            "output": finish.return_values["output"],
+            "log": finish.log if hasattr(finish, "log") else ""
+        })
+        self._finish_step()
+    
+    def _finish_step(self) -> None:
+        """Close the step's span and give the step its one-line timing for the reasoning view."""
+        if self._step_span is not None:
+            self._step_span.finish()
+            if self.steps:
+                self.steps[-1]["timing"] = tracing.describe(self._step_span)
+        self._step_span = self._llm_span = self._parse_span = self._tool_span = None
+
+
+# Custom date tool
+def date_tool(query: str) -> str:
+    """Get the current date and time or answer date-related questions."""
+    current_date = datetime.now()
+    
+    if "current date" in query.lower() or "today" in query.lower():
+        return f"The current date is {current_date.strftime('%Y-%m-%d')}"
+    elif "current time" in query.lower() or "now" in query.lower():
+        return f"The current time is {current_date.strftime('%H:%M:%S')}"
+    elif "day of week" in query.lower():
+        return f"Today is {current_date.strftime('%A')}"
+    elif "month" in query.lower():
+        return f"The current month is {current_date.strftime('%B')}"
+    elif "year" in query.lower():
+        return f"The current year is {current_date.strftime('%Y')}"
+    else:
+        return f"Date information: {current_date.strftime('%Y-%m-%d %H:%M:%S')}"
+
+# Search tool: the local index (search_index.py) when one is configured,
+# canned answers for common topics otherwise
+SEARCH_INDEX = os.environ.get("AGENT_SEARCH_INDEX")
+SEARCH_RESULTS = 3
+SEARCH_TTL = 300  # seconds a result is reused; the index may be rebuilt meanwhile
+
+def search_tool(query: str) -> str:
+    """Top passages from the local search index, falling back to canned answers."""
+    index = load_index(SEARCH_INDEX) if SEARCH_INDEX else None
+    hits = index.search(query, k=SEARCH_RESULTS) if index is not None else []
+    if hits:
+        return "\n".join(f"[{i}] {hit.source}: {hit.snippet}" for i, hit in enumerate(hits, 1))
+
+    query = query.lower()
+    predefined_answers = {
+        "weather": "The weather search shows partly cloudy with a high of 72°F for today.",
+        "news": "Top headlines: New technological advances in AI announced today.",
+        "stock": "Recent stock market update: Major indices showed mixed performance.",
+        "movie": "Popular movies currently showing include action, comedy and drama genres.",
+        "restaurant": "Top rated restaurants in the area include Italian, Japanese, and American cuisine options.",
+        "population": "The world population is approximately 8 billion people as of 2023.",
+        "distance": "The distance information would depend on specific locations.",
+        "president": "The current president information depends on your country and the current date.",
+    }
+    
+    for key, value in predefined_answers.items():
+        if key in query:
+            return value
+    
+    return "I searched but couldn't find specific information on that topic."
+
+# Calculator tool backed by the safe arithmetic engine (no LLM round-trip)
+def calculator_tool(expression: str) -> str:
+    """Evaluate a mathematical expression locally."""
+    try:
+        return f"Answer: {calculate(expression)}"
+    except MathError as e:
+        return f"Invalid expression: {e}"
+
+# Function to create the tool registry
+def create_tool_registry() -> ToolRegistry:
+    """Register the agent's tools; the LangChain tools are rendered from this registry."""
+    registry = ToolRegistry()
+    registry.register(
+        "Calculator",
+        calculator_tool,
+        "Useful for performing mathematical calculations. Input should be a mathematical expression.",
+        cacheable=True,
+    )
+    registry.register(
+        "DateInfo",
+        date_tool,
+        "Useful for getting the current date, time, or answering date-related questions.",
+        cacheable=True,
+        ttl=1,  # answers include the time of day
+    )
+    registry.register(
+        "Search",
+        search_tool,
+        "Useful for finding information about various topics like weather, news, stocks, etc.",
+        cacheable=True,
+        ttl=SEARCH_TTL,
+    )
+    return registry
+
+# Function to create LangChain tools
+def create_tools(registry: Optional[ToolRegistry] = None) -> List[Tool]:
+    """Create a list of tools for the agent."""
+    registry = registry or create_tool_registry()
+    
+    return [
+        Tool(
+            name=spec.name,
+            func=partial(registry.dispatch, spec.name),
+            description=spec.description
+        )
+        for spec in registry
+    ]
+
+# Completion cache shared by all sessions of this process
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(path=os.environ.get("AGENT_CACHE_PATH"))
+
+# Immutable agent parts, built on first use and shared by all sessions
+@lru_cache(maxsize=None)
+def get_llm(cache_prefix: Optional[str] = None) -> CustomLLM:
+    return CustomLLM(response_cache=get_response_cache(), cache_prefix=cache_prefix, gateway=default_gateway(),
+                     resilience=default_policy())
+
+@lru_cache(maxsize=None)
+def get_tool_registry() -> ToolRegistry:
+    return create_tool_registry()
+
+@lru_cache(maxsize=None)
+def get_tools() -> List[Tool]:
+    return create_tools(get_tool_registry())
+
+@lru_cache(maxsize=None)
+def get_agent() -> ZeroShotAgent:
+    """The ReAct agent: compiled prompt template, LLM chain and output parser (stateless)."""
+    input_variables = ["input", "chat_history", "agent_scratchpad"]
+    # Everything before {chat_history} (instructions, tools, format) is the same for every call
+    prompt = ZeroShotAgent.create_prompt(get_tools(), suffix=AGENT_SUFFIX, input_variables=input_variables)
+    return ZeroShotAgent.from_llm_and_tools(
+        get_llm(static_prefix(prompt.template)),
+        get_tools(),
+        suffix=AGENT_SUFFIX,
+        input_variables=input_variables,
+    )
+
+# Iteration cap per turn; each turn gets a smaller limit sized by its query
+MAX_ITERATIONS = 15
+STEP_BUDGET = StepBudget()
+
+def create_executor(memory: BaseMemory, user_input: Optional[str] = None) -> AgentExecutor:
+    """Executor around the shared agent and tools with one session's memory; cheap enough to build per turn."""
+    max_iterations = STEP_BUDGET.limit_for(user_input, MAX_ITERATIONS) if user_input else MAX_ITERATIONS
+    return AgentExecutor.from_agent_and_tools(
+        agent=get_agent(),
+        tools=get_tools(),
+        memory=memory,
+        verbose=True,
+        handle_parsing_errors=True,
+        max_iterations=max_iterations,
+    )
+
+# Turns
+async def run_routed(route: Route, handler: StreamlitCallbackHandler) -> Optional[str]:
+    """Answer with the routed tool alone, recording the step as the agent would; None if the tool failed."""
+    handler.on_route(route)
+    handler.on_agent_action(AgentAction(route.tool, route.action_input,
+                                        f"Routed without the model ({route.describe()})."))
+    handler.on_tool_start({"name": route.tool}, route.action_input)
+    output = await asyncio.get_running_loop().run_in_executor(
+        None, get_tool_registry().dispatch, route.tool, route.action_input)
+    handler.on_tool_end(output)
+    if is_error(output):
+        return None
+    handler.on_agent_finish(AgentFinish({"output": output}, "Answered by the routed tool."))
+    return output
+
+async def run_turn(agent: AgentExecutor, user_input: str, handler: StreamlitCallbackHandler,
+                   router: Optional[Any] = None) -> str:
+    """One turn: answered by a routed tool when `router` (intent_router) matches, by the agent otherwise."""
+    # The handler builds this turn's spans; context-based ones would only duplicate them
+    with tracing.activate(None):
+        # Trivial messages skip the model; the tool's answer still goes to memory
+        route = router.route(user_input, tools=get_tool_registry().names()) if router else None
+        output = await run_routed(route, handler) if route is not None else None
+        if output is not None:
+            agent.memory.save_context({"input": user_input}, {"output": output})
+            return output
+        result = await agent.ainvoke({"input": user_input}, config={"callbacks": [handler]})
+    return result["output"]
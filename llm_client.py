@@ -0,0 +1,192 @@
+# --- abc_response Adapters ---
+# abc_response(prompt) may return the whole completion as a str or, for a
+# streaming backend, an iterator of text chunks. Everything here accepts both,
+# and async_llm also accepts a coroutine or async-generator abc_response.
+# Backends that take a `cache_prefix` keyword also get the prompt's static
+# prefix (see prompt_builder).
+
+import asyncio
+import contextvars
+import importlib
+import inspect
+
+from action_parser import ActionParser
+
+
+def load_backend(spec):
+    """`module:attribute` -> the abc_response callable, e.g. `mymodel:abc_response`."""
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name or "abc_response")
+
+
+def accepts_cache_prefix(backend):
+    try:
+        parameters = inspect.signature(backend).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == "cache_prefix" or p.kind is p.VAR_KEYWORD for p in parameters)
+
+
+def call_backend(backend, prompt):
+    """`backend(prompt)`, adding `cache_prefix=` when the prompt carries one
+    (see prompt_builder) and the backend can take it."""
+    prefix = getattr(prompt, "cache_prefix", None)
+    if prefix and accepts_cache_prefix(backend):
+        return backend(prompt, cache_prefix=prefix)
+    return backend(prompt)
+
+
+def iter_response(backend, prompt):
+    """Yield the completion of `backend(prompt)` chunk by chunk."""
+    response = call_backend(backend, prompt)
+    if isinstance(response, str):
+        yield response
+        return
+    try:
+        yield from response
+    finally:
+        close = getattr(response, "close", None)
+        if close:
+            close()  # stop generation upstream if we bail out early
+
+
+class StreamCutter:
+    """Incremental core of stream_until: feed chunks in, get back what is safe to emit.
+
+    `push(chunk)` returns the text that can be yielded now and sets `done`
+    once a stop sequence (or, with `stop_on_json`, the end of the first
+    action object) has been seen; `flush()` returns the held-back tail.
+    """
+
+    def __init__(self, stop=None, stop_on_json=False):
+        self.stop = [s for s in (stop or []) if s]
+        self.holdback = max((len(s) for s in self.stop), default=1) - 1
+        self.parser = ActionParser() if stop_on_json else None
+        self.text, self.emitted, self.done = "", 0, False
+
+    def push(self, chunk):
+        if not chunk or self.done:
+            return ""
+        start = max(0, len(self.text) - self.holdback)
+        self.text += chunk
+        cut = None
+        for sequence in self.stop:
+            found = self.text.find(sequence, start)
+            if found != -1 and (cut is None or found < cut):
+                cut = found
+        if self.parser and self.parser.feed(chunk) is not None and (cut is None or self.parser.end < cut):
+            cut = self.parser.end
+        if cut is not None:
+            self.done = True
+            return self._emit(cut)
+        return self._emit(len(self.text) - self.holdback)
+
+    def flush(self):
+        return "" if self.done else self._emit(len(self.text))
+
+    def _emit(self, upto):
+        if upto <= self.emitted:
+            return ""
+        out, self.emitted = self.text[self.emitted:upto], upto
+        return out
+
+
+def stream_until(chunks, stop=None, stop_on_json=False):
+    """Re-yield `chunks`, cutting the stream at the first stop sequence.
+
+    With `stop_on_json` the stream also ends right after the first complete
+    action object (see action_parser). Text that could still turn into a stop
+    sequence is held back, so nothing past the cut point is ever yielded. The
+    upstream iterator is closed as soon as we stop reading from it.
+    """
+    cutter = StreamCutter(stop, stop_on_json)
+    chunks = iter(chunks)
+    try:
+        for chunk in chunks:
+            text = cutter.push(chunk)
+            if text:
+                yield text
+            if cutter.done:
+                return
+        text = cutter.flush()
+        if text:
+            yield text
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+async def astream_until(chunks, stop=None, stop_on_json=False):
+    """stream_until for an async iterator of chunks."""
+    cutter = StreamCutter(stop, stop_on_json)
+    try:
+        async for chunk in chunks:
+            text = cutter.push(chunk)
+            if text:
+                yield text
+            if cutter.done:
+                return
+        text = cutter.flush()
+        if text:
+            yield text
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+def streaming_llm(backend, on_token=None, stop=None, stop_on_json=True):
+    """Wrap `backend` as `llm(prompt) -> str` that streams tokens into `on_token`."""
+    def call(prompt):
+        tokens = []
+        for token in stream_until(iter_response(backend, prompt), stop=stop, stop_on_json=stop_on_json):
+            tokens.append(token)
+            if on_token:
+                on_token(token)
+        return "".join(tokens)
+    call.on_token = on_token  # cached_llm replays cache hits through it
+    return call
+
+
+def is_async_backend(backend):
+    # Also true for objects whose __call__ is async (inspect does not look there)
+    return any(inspect.iscoroutinefunction(f) or inspect.isasyncgenfunction(f)
+               for f in (backend, getattr(backend, "__call__", None)))
+
+
+def async_llm(backend, on_token=None, stop=None, stop_on_json=True):
+    """Wrap `backend` as `await llm(prompt) -> str`, streaming tokens into `on_token`.
+
+    An async backend (a coroutine returning a str or an async iterator, or an
+    async generator) runs on the event loop itself. A blocking backend runs
+    through streaming_llm in the loop's executor, so the loop never waits on it.
+    """
+    if not is_async_backend(backend):
+        blocking = streaming_llm(backend, on_token=on_token, stop=stop, stop_on_json=stop_on_json)
+
+        async def call_blocking(prompt):
+            # copy_context: the backend sees the turn's trace and step budget from the executor thread
+            return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run,
+                                                                    blocking, prompt)
+        call_blocking.on_token = on_token
+        return call_blocking
+
+    async def call(prompt):
+        response = call_backend(backend, prompt)
+        if inspect.isawaitable(response):
+            response = await response
+        if isinstance(response, str):
+            cutter = StreamCutter(stop, stop_on_json)
+            text = cutter.push(response) + cutter.flush()
+            if text and on_token:
+                on_token(text)
+            return text
+        tokens = []
+        async for token in astream_until(response, stop=stop, stop_on_json=stop_on_json):
+            tokens.append(token)
+            if on_token:
+                on_token(token)
+        return "".join(tokens)
+    call.on_token = on_token
+    return call
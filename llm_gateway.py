@@ -0,0 +1,316 @@
+# --- LLM Gateway ---
+# One front door to abc_response for every session of the process. Identical
+# prompts that are in flight at the same time reach the backend once
+# (singleflight): the first caller's completion is shared chunk by chunk with
+# everyone who asks for the same prompt before it finishes, so streaming
+# still works for all of them and a backend error reaches all of them. With
+# a batch backend (`abc_response_batch(prompts) -> [completion, ...]`),
+# distinct prompts that arrive within `max_wait` of each other go out as one
+# call of up to `max_batch` prompts.
+#
+#   AGENT_LLM_BATCH=mymodel:abc_response_batch AGENT_LLM_BATCH_SIZE=8 AGENT_LLM_BATCH_WAIT_MS=10
+#
+# Wrap abc_response inside any response cache (cache hits never get here)
+# and outside resilience.resilient and any rate limiter (coalesced callers
+# share one call, with its retries and hedges). Batched calls never reach
+# that wrapped backend: the gateway applies its own `policy` to every batch
+# instead (resilience.resilient_batch).
+
+import asyncio
+import inspect
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from llm_client import call_backend, is_async_backend, iter_response, load_backend
+from resilience import default_policy, resilient_batch
+from response_cache import cache_key
+
+BATCH_BACKEND = os.environ.get("AGENT_LLM_BATCH")
+BATCH_SIZE = int(os.environ.get("AGENT_LLM_BATCH_SIZE") or 8)
+BATCH_WAIT = float(os.environ.get("AGENT_LLM_BATCH_WAIT_MS") or 10) / 1000
+
+
+class _Flight:
+    """One backend call and the chunks it produced so far, read by every caller of the same prompt.
+
+    Readers take the chunks they have not seen yet; whoever runs out pulls the
+    next one from upstream, under `lock`, while the others wait on the lock.
+    The last reader to leave closes the upstream stream.
+    """
+
+    def __init__(self, upstream, lock):
+        self.upstream = upstream
+        self.lock = lock
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.readers = 0
+
+
+class MicroBatcher:
+    """Collects prompts from many callers and sends them to `batch_backend` in batches.
+
+    A batch goes out once it holds `max_batch` prompts or its first prompt
+    has waited `max_wait` seconds. Up to `max_concurrent` batches run at a
+    time; while they all run, new prompts keep queueing and the next batch
+    fills up. `submit(prompt)` returns a concurrent.futures.Future. With a
+    ResiliencePolicy, each batch runs under it (see resilient_batch).
+    """
+
+    def __init__(self, batch_backend, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT, max_concurrent=4, policy=None):
+        self.batch_backend = batch_backend
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pending = []  # (prompt, future, queued at)
+        self._ready = threading.Condition()
+        self._collector = None
+        self._local = threading.local()  # an event loop per batch thread, for an async batch_backend
+        self.batch_sizes = Counter()
+        self.peak_queue_depth = 0
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def submit(self, prompt):
+        future = Future()
+        with self._ready:
+            self._pending.append((prompt, future, time.monotonic()))
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._pending))
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name="llm-batcher", daemon=True)
+                self._collector.start()
+            self._ready.notify()
+        return future
+
+    def _collect(self):
+        while True:
+            self._slots.acquire()
+            with self._ready:
+                while not self._pending:
+                    self._ready.wait()
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch and time.monotonic() < deadline:
+                    self._ready.wait(deadline - time.monotonic())
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self.batch_sizes[len(batch)] += 1
+            threading.Thread(target=self._run, args=(batch,), name="llm-batch", daemon=True).start()
+
+    def _run(self, batch):
+        try:
+            prompts = [prompt for prompt, _, _ in batch]
+            backend = resilient_batch(self.batch_backend, self.policy) if self.policy else self.batch_backend
+            try:
+                completions = call_backend(backend, prompts)
+                if inspect.isawaitable(completions):
+                    completions = self._loop().run_until_complete(completions)
+                completions = list(completions)
+                if len(completions) != len(prompts):
+                    raise ValueError(f"batch backend returned {len(completions)} completions for {len(prompts)} prompts")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            for (_, future, _), completion in zip(batch, completions):
+                future.set_result(completion)
+        finally:
+            self._slots.release()
+
+    def _loop(self):
+        loop = getattr(self._local, "loop", None)
+        if loop is None:
+            loop = self._local.loop = asyncio.new_event_loop()
+        return loop
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        prompts = sum(size * count for size, count in self.batch_sizes.items())
+        return {"queue_depth": self.queue_depth, "peak_queue_depth": self.peak_queue_depth, "batches": batches,
+                "mean_batch_size": prompts / batches if batches else 0.0,
+                "max_batch_size": max(self.batch_sizes, default=0), "batch_sizes": dict(self.batch_sizes)}
+
+
+class LLMGateway:
+    """Singleflight and, with a `batch_backend`, micro-batching for abc_response calls.
+
+    `wrap(backend)` (see `coalesced`) returns a backend to use in place of
+    `backend`: blocking or async like it, streaming like it. Calls are
+    coalesced by backend and normalized prompt (the response cache's key).
+    With a batch backend, every prompt that is not coalesced is answered
+    through it, as a single chunk, and `policy` guards each batch call.
+    """
+
+    def __init__(self, batch_backend=None, max_batch=BATCH_SIZE, max_wait=BATCH_WAIT, max_concurrent_batches=4,
+                 policy=None):
+        self.batcher = (MicroBatcher(batch_backend, max_batch, max_wait, max_concurrent_batches, policy)
+                        if batch_backend else None)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.backend_calls = 0
+
+    def wrap(self, backend):
+        if is_async_backend(backend):
+            async def acall(prompt):
+                async for chunk in self._aread(backend, prompt):
+                    yield chunk
+            return acall
+
+        def call(prompt):
+            return self._read(backend, prompt)
+        return call
+
+    # ---- Flights ----
+
+    def _join(self, key, start):
+        with self._lock:
+            self.requests += 1
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = start()
+                self.backend_calls += 1
+            else:
+                self.coalesced += 1
+            flight.readers += 1
+            return flight
+
+    def _leave(self, key, flight):
+        """Drop a reader; True for the last one, who must close an unfinished upstream."""
+        with self._lock:
+            flight.readers -= 1
+            if flight.readers == 0 and self._flights.get(key) is flight:
+                del self._flights[key]
+            return flight.readers == 0 and not flight.done
+
+    def _land(self, key, flight):
+        # A finished flight takes no new readers; a later identical prompt is a new call (or a cache hit)
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _read(self, backend, prompt):
+        key = (backend, cache_key(prompt))
+        flight = self._join(key, lambda: _Flight(self._upstream(backend, prompt), threading.Lock()))
+        seen = 0
+        try:
+            while True:
+                if seen < len(flight.chunks):
+                    seen += 1
+                    yield flight.chunks[seen - 1]
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                with flight.lock:
+                    if seen < len(flight.chunks) or flight.done:
+                        continue
+                    try:
+                        flight.chunks.append(next(flight.upstream))
+                    except StopIteration:
+                        flight.done = True
+                    except Exception as e:
+                        flight.error, flight.done = e, True
+                if flight.done:
+                    self._land(key, flight)
+        finally:
+            if self._leave(key, flight):
+                flight.upstream.close()
+
+    async def _aread(self, backend, prompt):
+        key = (asyncio.get_running_loop(), backend, cache_key(prompt))
+        flight = self._join(key, lambda: _Flight(self._aupstream(backend, prompt), asyncio.Lock()))
+        seen = 0
+        try:
+            while True:
+                if seen < len(flight.chunks):
+                    seen += 1
+                    yield flight.chunks[seen - 1]
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                async with flight.lock:
+                    if seen < len(flight.chunks) or flight.done:
+                        continue
+                    try:
+                        flight.chunks.append(await flight.upstream.__anext__())
+                    except StopAsyncIteration:
+                        flight.done = True
+                    except Exception as e:
+                        flight.error, flight.done = e, True
+                if flight.done:
+                    self._land(key, flight)
+        finally:
+            if self._leave(key, flight):
+                await flight.upstream.aclose()
+
+    # ---- Backend calls ----
+
+    def _upstream(self, backend, prompt):
+        if self.batcher is None:
+            yield from iter_response(backend, prompt)
+        else:
+            yield self.batcher.submit(prompt).result()
+
+    async def _aupstream(self, backend, prompt):
+        if self.batcher is not None:
+            yield await asyncio.wrap_future(self.batcher.submit(prompt))
+            return
+        response = call_backend(backend, prompt)
+        if inspect.isawaitable(response):
+            response = await response
+        if isinstance(response, str):
+            yield response
+            return
+        try:
+            async for chunk in response:
+                yield chunk
+        finally:
+            aclose = getattr(response, "aclose", None)
+            if aclose:
+                await aclose()
+
+    def stats(self):
+        with self._lock:
+            stats = {"requests": self.requests, "coalesced": self.coalesced, "backend_calls": self.backend_calls,
+                     "in_flight": len(self._flights)}
+        stats.update(self.batcher.stats() if self.batcher else {"queue_depth": 0, "batches": 0})
+        return stats
+
+    def describe(self):
+        """Short status line for the apps."""
+        stats = self.stats()
+        text = f"LLM {stats['in_flight']} in flight, {stats['coalesced']} coalesced"
+        if self.batcher is not None:
+            text += f", {stats['queue_depth']} queued, batch avg {stats['mean_batch_size']:.1f}"
+        return text
+
+
+def coalesced(backend, gateway):
+    """`backend` (blocking or async, as accepted by llm_client) behind `gateway`."""
+    return gateway.wrap(backend)
+
+
+_default_gateway = None
+_default_lock = threading.Lock()
+
+
+def default_gateway():
+    """Process-wide gateway; batching is on when AGENT_LLM_BATCH names a batch backend.
+
+    Batches run under the process-wide ResiliencePolicy, like single calls.
+    """
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            batch_backend = load_backend(BATCH_BACKEND) if BATCH_BACKEND else None
+            _default_gateway = LLMGateway(batch_backend, policy=default_policy())
+        return _default_gateway
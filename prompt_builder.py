@@ -0,0 +1,51 @@
+# --- Prompt Builder ---
+# Prompts are split into a static prefix (system text, tool list, response
+# format) that is rendered once and stays byte-identical across steps and
+# sessions, and a dynamic tail formatted on every step. The prefix travels
+# with the prompt as `.cache_prefix`, and llm_client hands it to backends
+# that accept a `cache_prefix` argument so they can reuse their prefix/KV
+# cache; for everything else the prompt is just a str.
+
+import string
+
+
+class Prompt(str):
+    """A prompt string that knows which leading part of it is static."""
+
+    def __new__(cls, prefix, tail=""):
+        prompt = super().__new__(cls, prefix + tail)
+        prompt.cache_prefix = prefix
+        return prompt
+
+
+class PromptTemplate:
+    """`static` is formatted once with `constants`; `dynamic` on every call.
+
+    Keep anything that varies per step, turn or session out of `static`,
+    otherwise the prefix changes and backend prefix caches stop hitting.
+    Both parts use str.format syntax ({{ and }} for literal braces).
+    """
+
+    def __init__(self, static, dynamic, **constants):
+        self.prefix = static.format(**constants)
+        self.dynamic = dynamic
+
+    def __call__(self, **fields):
+        return Prompt(self.prefix, self.dynamic.format(**fields))
+
+
+def static_prefix(template):
+    """The literal text of a str.format template up to its first field."""
+    literal = []
+    for text, field, _, _ in string.Formatter().parse(template):
+        literal.append(text)
+        if field is not None:
+            break
+    return "".join(literal)
+
+
+def split_prompt(text, prefix):
+    """`text` as a Prompt when it starts with `prefix`, otherwise unchanged."""
+    if prefix and text.startswith(prefix):
+        return Prompt(prefix, text[len(prefix):])
+    return text
@@ -0,0 +1,64 @@
+# --- Backend Rate Limiting ---
+# A token bucket in front of abc_response, shared by every turn in the
+# process. Callers reserve a slot under a lock and then wait outside it, so
+# concurrent turns queue up fairly instead of polling, and a blocking backend
+# waits on its own executor thread while an async one waits on the loop.
+
+import asyncio
+import inspect
+import threading
+import time
+
+from llm_client import call_backend, is_async_backend
+
+
+class RateLimiter:
+    """At most `rate` calls per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a slot and return how long to wait before using it."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def rate_limited(backend, limiter):
+    """`backend` (blocking or async, as accepted by llm_client) behind `limiter`.
+
+    Wrap the raw abc_response, inside any response cache, so that cache hits
+    do not use up the budget.
+    """
+    if is_async_backend(backend):
+        async def acall(prompt):
+            await limiter.aacquire()
+            response = call_backend(backend, prompt)
+            return await response if inspect.isawaitable(response) else response
+        return acall
+
+    def call(prompt):
+        limiter.acquire()
+        return call_backend(backend, prompt)
+    return call
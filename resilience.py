@@ -0,0 +1,463 @@
+# --- Backend Resilience ---
+# Deadlines, hedging, retries and a circuit breaker around abc_response, so
+# one slow or failing completion cannot stall a turn:
+#
+# - every attempt has a deadline (`timeout`) for its whole completion;
+# - when an attempt has not produced its first chunk after the backend's
+#   recent p95 time-to-first-chunk, a duplicate request is fired and
+#   whichever answers first is used (the other is abandoned and closed);
+# - a failed or timed-out attempt is retried with exponential backoff and
+#   jitter, while the turn's step budget has calls to spare (see step_budget);
+# - after `failure_threshold` failed calls in a row the circuit opens and
+#   calls fail at once with CircuitOpen until `reset_after` seconds have
+#   passed; then one trial call decides whether it closes again.
+#
+# A call is only retried or hedged before its first chunk is handed on, so
+# streaming output is never duplicated. Failures raise LLMError subclasses
+# (or the backend's own exception) instead of returning text.
+#
+#   AGENT_LLM_TIMEOUT=60 AGENT_LLM_RETRIES=2 AGENT_LLM_HEDGE=1
+
+import asyncio
+import inspect
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from llm_client import call_backend, is_async_backend, iter_response
+from step_budget import active_budget
+
+TIMEOUT = float(os.environ.get("AGENT_LLM_TIMEOUT") or 60)
+RETRIES = int(os.environ.get("AGENT_LLM_RETRIES") or 2)
+HEDGE = os.environ.get("AGENT_LLM_HEDGE", "1") != "0"
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class CircuitOpen(LLMError):
+    pass
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies (seconds) and their quantiles."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """The `q` quantile, or None until `min_samples` latencies were seen."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures -> half-open after `reset_after`."""
+
+    def __init__(self, failure_threshold=5, reset_after=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None  # the trial call of the half-open state
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.clock() - self.opened_at >= self.reset_after else "open"
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go out now; in half-open state only one trial call may."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            # A trial call that never reported back (cancelled, say) does not block the next one forever
+            if state == "half-open" and (self._probe_started is None
+                                         or self.clock() - self._probe_started >= self.reset_after):
+                self._probe_started = self.clock()
+                return
+            raise CircuitOpen(f"backend unavailable after {self.failures} failed calls; "
+                              f"retrying in {max(0.0, self.opened_at + self.reset_after - self.clock()):.0f}s")
+
+    def success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probe_started = 0, None, None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe_started is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._probe_started = None
+
+
+class ResiliencePolicy:
+    """Settings and shared state (latencies, breaker, counters) for `resilient` backends.
+
+    Hedged requests are not charged to the step budget: they only go out
+    for the slowest ~5% of calls and are meant to cut latency, not to
+    recover from failures.
+    """
+
+    def __init__(self, timeout=TIMEOUT, retries=RETRIES, backoff=0.5, max_backoff=8.0, hedge=HEDGE,
+                 hedge_quantile=0.95, min_hedge_delay=0.05, breaker=None, latency=None, clock=time.monotonic):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency or LatencyTracker()
+        self.clock = clock
+        self.counts = {"calls": 0, "hedged": 0, "hedge_wins": 0, "retries": 0, "timeouts": 0, "failures": 0,
+                       "rejected": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def hedge_delay(self):
+        """Seconds to wait for a first chunk before hedging, or None (no hedge)."""
+        if not self.hedge:
+            return None
+        p95 = self.latency.quantile(self.hedge_quantile)
+        return None if p95 is None else max(self.min_hedge_delay, p95)
+
+    def retry_delay(self, attempt):
+        """Backoff before retry number `attempt` (0-based), or None when no retry is left."""
+        if attempt >= self.retries:
+            return None
+        budget = active_budget()
+        if budget is not None and not budget.spend_retry():
+            return None
+        self.count("retries")
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats.update(circuit=self.breaker.state, hedge_delay=self.hedge_delay())
+        return stats
+
+    def describe(self):
+        """Short status line for the apps."""
+        stats = self.stats()
+        return f"{stats['hedged']} hedged, {stats['retries']} retried, circuit {stats['circuit']}"
+
+
+# ---- Blocking backends ----
+# Each attempt streams from its own daemon thread into a queue shared by the
+# attempts of a call; a backend that hangs only ever ties up that thread.
+
+class _Attempt:
+    def __init__(self, backend, prompt, events, clock):
+        self.started = clock()
+        self.cancelled = False
+        thread = threading.Thread(target=self._pump, args=(backend, prompt, events), name="llm-attempt",
+                                  daemon=True)
+        thread.start()
+
+    def _pump(self, backend, prompt, events):
+        chunks = iter_response(backend, prompt)
+        try:
+            for chunk in chunks:
+                if self.cancelled:
+                    return
+                events.put((self, "chunk", chunk))
+            events.put((self, "end", None))
+        except Exception as e:
+            events.put((self, "error", e))
+        finally:
+            chunks.close()
+
+
+def _first_event(policy, backend, prompt, events):
+    """Run one attempt, hedged once it is slow; `(attempt, kind, value)` of the first chunk or end."""
+    now = policy.clock()
+    deadline = now + policy.timeout
+    delay = policy.hedge_delay()
+    hedge_at = None if delay is None else now + delay
+    live = [_Attempt(backend, prompt, events, policy.clock)]
+    while True:
+        now = policy.clock()
+        if now >= deadline:
+            for attempt in live:
+                attempt.cancelled = True
+            raise LLMTimeout(f"no response within {policy.timeout:g}s")
+        wait = deadline - now if hedge_at is None else max(0.0, min(deadline, hedge_at) - now)
+        try:
+            attempt, kind, value = events.get(timeout=wait)
+        except queue.Empty:
+            if hedge_at is not None and policy.clock() >= hedge_at:
+                hedge_at = None
+                policy.count("hedged")
+                live.append(_Attempt(backend, prompt, events, policy.clock))
+            continue
+        if attempt not in live:
+            continue  # a late event of an attempt that already failed
+        if kind == "error":
+            live.remove(attempt)
+            if not live:
+                raise value
+            continue
+        for other in live:
+            if other is not attempt:
+                other.cancelled = True
+        if attempt is not live[0]:
+            policy.count("hedge_wins")
+        policy.latency.record(policy.clock() - attempt.started)
+        return attempt, kind, value, deadline
+
+
+def _resilient_call(policy, backend, prompt):
+    policy.count("calls")
+    for attempt_number in range(policy.retries + 1):
+        try:
+            policy.breaker.before_call()
+        except CircuitOpen:
+            policy.count("rejected")
+            raise
+        events = queue.Queue()
+        try:
+            attempt, kind, value, deadline = _first_event(policy, backend, prompt, events)
+        except Exception as e:
+            policy.breaker.failure()
+            policy.count("timeouts" if isinstance(e, LLMTimeout) else "failures")
+            delay = policy.retry_delay(attempt_number)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        policy.breaker.success()  # the backend answered; the caller may stop reading early
+        try:
+            while kind == "chunk":
+                yield value
+                kind, value = _next_event(policy, attempt, events, deadline)
+            if kind == "error":
+                raise value
+        except BaseException as e:
+            attempt.cancelled = True
+            if isinstance(e, Exception):
+                policy.breaker.failure()
+                policy.count("timeouts" if isinstance(e, LLMTimeout) else "failures")
+            raise
+        return
+
+
+def _next_event(policy, attempt, events, deadline):
+    while True:
+        wait = deadline - policy.clock()
+        if wait <= 0:
+            raise LLMTimeout(f"response not finished within {policy.timeout:g}s")
+        try:
+            source, kind, value = events.get(timeout=wait)
+        except queue.Empty:
+            continue
+        if source is attempt:
+            return kind, value
+
+
+# ---- Async backends ----
+
+async def _apump(backend, prompt, events, tag):
+    response = None
+    try:
+        response = call_backend(backend, prompt)
+        if inspect.isawaitable(response):
+            response = await response
+        if isinstance(response, str):
+            await events.put((tag, "chunk", response))
+        else:
+            async for chunk in response:
+                await events.put((tag, "chunk", chunk))
+        await events.put((tag, "end", None))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await events.put((tag, "error", e))
+    finally:
+        aclose = getattr(response, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+async def _afirst_event(policy, backend, prompt, events):
+    now = policy.clock()
+    deadline = now + policy.timeout
+    delay = policy.hedge_delay()
+    hedge_at = None if delay is None else now + delay
+    tasks = []  # by tag
+    live = {}  # task -> start time
+
+    def start():
+        task = asyncio.ensure_future(_apump(backend, prompt, events, len(tasks)))
+        tasks.append(task)
+        live[task] = policy.clock()
+    start()
+    try:
+        while True:
+            now = policy.clock()
+            if now >= deadline:
+                raise LLMTimeout(f"no response within {policy.timeout:g}s")
+            wait = deadline - now if hedge_at is None else max(0.0, min(deadline, hedge_at) - now)
+            try:
+                tag, kind, value = await asyncio.wait_for(events.get(), wait)
+            except asyncio.TimeoutError:
+                if hedge_at is not None and policy.clock() >= hedge_at:
+                    hedge_at = None
+                    policy.count("hedged")
+                    start()
+                continue
+            task = tasks[tag]
+            if task not in live:
+                continue
+            if kind == "error":
+                del live[task]
+                if not live:
+                    raise value
+                continue
+            if tag:
+                policy.count("hedge_wins")
+            policy.latency.record(policy.clock() - live[task])
+            losers = [other for other in live if other is not task]
+            live = {task: live[task]}
+            for other in losers:
+                other.cancel()
+            return task, tag, kind, value, deadline
+    except BaseException:
+        for task in live:
+            task.cancel()
+        raise
+
+
+async def _aresilient_call(policy, backend, prompt):
+    policy.count("calls")
+    for attempt_number in range(policy.retries + 1):
+        try:
+            policy.breaker.before_call()
+        except CircuitOpen:
+            policy.count("rejected")
+            raise
+        events = asyncio.Queue()
+        try:
+            task, tag, kind, value, deadline = await _afirst_event(policy, backend, prompt, events)
+        except Exception as e:
+            policy.breaker.failure()
+            policy.count("timeouts" if isinstance(e, LLMTimeout) else "failures")
+            delay = policy.retry_delay(attempt_number)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        policy.breaker.success()
+        try:
+            while kind == "chunk":
+                yield value
+                kind, value = await _anext_event(policy, tag, events, deadline)
+            if kind == "error":
+                raise value
+        except BaseException as e:
+            task.cancel()
+            if isinstance(e, Exception):
+                policy.breaker.failure()
+                policy.count("timeouts" if isinstance(e, LLMTimeout) else "failures")
+            raise
+        return
+
+
+async def _anext_event(policy, tag, events, deadline):
+    while True:
+        wait = deadline - policy.clock()
+        if wait <= 0:
+            raise LLMTimeout(f"response not finished within {policy.timeout:g}s")
+        try:
+            source, kind, value = await asyncio.wait_for(events.get(), wait)
+        except asyncio.TimeoutError:
+            continue
+        if source == tag:
+            return kind, value
+
+
+@lru_cache(maxsize=64)
+def resilient(backend, policy):
+    """`backend` (blocking or async, as accepted by llm_client) with `policy`'s deadlines, hedging,
+    retries and circuit breaker; streaming like `backend`.
+
+    Wrap it inside the LLM gateway (coalesced callers share one resilient
+    call) and outside any rate limiter (hedges and retries take slots too).
+    The same wrapper is returned for the same backend and policy, so the
+    gateway sees one backend.
+    """
+    if is_async_backend(backend):
+        async def acall(prompt):
+            async for chunk in _aresilient_call(policy, backend, prompt):
+                yield chunk
+        return acall
+
+    def call(prompt):
+        return _resilient_call(policy, backend, prompt)
+    return call
+
+
+@lru_cache(maxsize=64)
+def resilient_batch(batch_backend, policy):
+    """`batch_backend(prompts) -> [completion, ...]` (blocking or async) with `policy` applied to
+    each batch as one call: one deadline, hedge, retries and breaker verdict for all its prompts.
+
+    Used by the LLM gateway's MicroBatcher; wrap rate limiting inside it.
+    """
+    if is_async_backend(batch_backend):
+        async def whole_async(prompts):
+            completions = call_backend(batch_backend, prompts)
+            if inspect.isawaitable(completions):
+                completions = await completions
+            yield list(completions)
+
+        async def acall(prompts):
+            return [completions async for completions in _aresilient_call(policy, whole_async, prompts)][0]
+        return acall
+
+    def whole(prompts):
+        yield list(call_backend(batch_backend, prompts))
+
+    def call(prompts):
+        return list(_resilient_call(policy, whole, prompts))[0]
+    return call
+
+
+_default_policy = None
+_default_lock = threading.Lock()
+
+
+def default_policy():
+    """Process-wide policy (AGENT_LLM_TIMEOUT, AGENT_LLM_RETRIES, AGENT_LLM_HEDGE), shared by all sessions."""
+    global _default_policy
+    with _default_lock:
+        if _default_policy is None:
+            _default_policy = ResiliencePolicy()
+        return _default_policy
@@ -0,0 +1,152 @@
+# --- Completion Cache ---
+# Sits in front of abc_response / CustomLLM._call. Keys are a hash of the
+# normalized prompt plus stop sequences; entries live in an in-memory LRU
+# with TTL and, optionally, in a SQLite file that survives restarts.
+
+import hashlib
+import inspect
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """Thread-safe LRU map with a default TTL and optional per-entry TTL (None = forever)."""
+
+    def __init__(self, max_entries=1024, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires = None if ttl is None else self.clock() + ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+def cache_key(prompt, stop=None):
+    material = normalize_prompt(prompt) + "\x00" + "\x1f".join(stop or [])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Completion cache with hit/miss counters and an optional SQLite tier at `path`."""
+
+    def __init__(self, max_entries=1024, ttl=3600, path=None):
+        self.ttl = ttl
+        self.memory = LRUTTLCache(max_entries, ttl)
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created REAL)"
+            )
+            self._db.commit()
+
+    def get(self, prompt, stop=None):
+        key = cache_key(prompt, stop)
+        response = self.memory.get(key)
+        if response is None and self._db is not None:
+            response = self._disk_get(key)
+            if response is not None:
+                self.memory.set(key, response)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, prompt, response, stop=None):
+        key = cache_key(prompt, stop)
+        self.memory.set(key, response)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, time.time())
+                )
+                self._db.commit()
+
+    def _disk_get(self, key):
+        with self._db_lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created = row
+        if self.ttl is not None and created + self.ttl <= time.time():
+            return None
+        return response
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.memory),
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def cached_llm(llm, cache, stop=None, on_token=None):
+    """Wrap `llm(prompt) -> str` (or `async llm`) so repeated prompts are answered from `cache`.
+
+    A hit is streamed into `on_token` as one chunk, like a live completion;
+    by default that is the callback `llm` streams into (see llm_client).
+    """
+    on_token = on_token or getattr(llm, "on_token", None)
+
+    def hit(prompt):
+        response = cache.get(prompt, stop)
+        tracing.annotate(cache_hit=response is not None)
+        if response and on_token:
+            on_token(response)
+        return response
+
+    if inspect.iscoroutinefunction(llm):
+        async def acall(prompt):
+            response = hit(prompt)
+            if response is None:
+                response = await llm(prompt)
+                cache.set(prompt, response, stop)
+            return response
+        return acall
+
+    def call(prompt):
+        response = hit(prompt)
+        if response is None:
+            response = llm(prompt)
+            cache.set(prompt, response, stop)
+        return response
+    return call
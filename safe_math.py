@@ -0,0 +1,227 @@
+# --- Safe Arithmetic Engine ---
+# Replaces eval() in calculator_tool and LLMMathChain in Lang.py. Expressions
+# are parsed with ast, checked against a whitelist, compiled once into a tree
+# of closures and memoized. Exponents and integer sizes are bounded, so
+# "9**9**9" fails fast instead of hanging the process.
+
+import ast
+import math
+import operator
+import re
+from functools import lru_cache, reduce
+
+try:
+    import numpy as np
+except ImportError:  # evaluate_batch falls back to one-by-one evaluation
+    np = None
+
+MAX_EXPRESSION_LENGTH = 1000
+MAX_EXPONENT = 10_000
+MAX_INT_BITS = 14_000  # ~4,200 digits, inside Python's int-to-str limit
+MAX_FACTORIAL = 1000
+
+
+class MathError(ValueError):
+    """The expression is invalid, unsupported or too expensive to evaluate."""
+
+
+class UnsupportedExpression(MathError):
+    """The text is not a whitelisted arithmetic expression at all."""
+
+
+def _pow(base, exponent):
+    largest = abs(exponent).max() if hasattr(exponent, "max") else abs(exponent)
+    if largest > MAX_EXPONENT:
+        raise MathError(f"exponent larger than {MAX_EXPONENT}")
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 \
+            and base.bit_length() * exponent > MAX_INT_BITS:
+        raise MathError("result is too large")
+    result = base ** exponent
+    if isinstance(result, complex):  # a negative base to a fractional power
+        raise MathError("result is not a real number")
+    return result
+
+
+def _mul(left, right):
+    if isinstance(left, int) and isinstance(right, int) \
+            and left.bit_length() + right.bit_length() > MAX_INT_BITS:
+        raise MathError("result is too large")
+    return left * right
+
+
+def _factorial(n):
+    if n > MAX_FACTORIAL:
+        raise MathError(f"factorial argument larger than {MAX_FACTORIAL}")
+    return math.factorial(n)
+
+
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: _mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: _pow,
+}
+_UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+FUNCTIONS = {
+    "abs": abs, "round": round, "min": min, "max": max,
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10, "log2": math.log2,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan, "asin": math.asin, "acos": math.acos,
+    "atan": math.atan, "floor": math.floor, "ceil": math.ceil, "factorial": _factorial,
+}
+NUMPY_FUNCTIONS = {} if np is None else {
+    "abs": np.abs, "round": np.round,
+    "min": lambda *args: reduce(np.minimum, args), "max": lambda *args: reduce(np.maximum, args),
+    "sqrt": np.sqrt, "exp": np.exp, "log": np.log, "log10": np.log10, "log2": np.log2,
+    "sin": np.sin, "cos": np.cos, "tan": np.tan, "asin": np.arcsin, "acos": np.arccos,
+    "atan": np.arctan, "floor": np.floor, "ceil": np.ceil,
+}
+
+
+def _compile(node, variables):
+    """Turn a whitelisted AST node into `fn(env, functions) -> value`."""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = node.value
+        return lambda env, fns: value
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            value = CONSTANTS[node.id]
+            return lambda env, fns: value
+        name = node.id
+        variables.add(name)
+        return lambda env, fns: env[name]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op, left, right = _BINARY[type(node.op)], _compile(node.left, variables), _compile(node.right, variables)
+        return lambda env, fns: op(left(env, fns), right(env, fns))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        op, operand = _UNARY[type(node.op)], _compile(node.operand, variables)
+        return lambda env, fns: op(operand(env, fns))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+            and not node.keywords:
+        name, args = node.func.id, [_compile(arg, variables) for arg in node.args]
+        return lambda env, fns: fns[name](*[arg(env, fns) for arg in args])
+    raise UnsupportedExpression(f"unsupported syntax: {ast.unparse(node) if hasattr(ast, 'unparse') else type(node).__name__}")
+
+
+class CompiledExpression:
+    def __init__(self, source, fn, variables):
+        self.source = source
+        self.fn = fn
+        self.variables = frozenset(variables)
+        # Constant expressions are folded once, so repeats cost a cache lookup.
+        self.value = self._run({}, FUNCTIONS) if not variables else None
+
+    def _run(self, env, functions):
+        try:
+            return self.fn(env, functions)
+        except MathError:
+            raise
+        except KeyError as e:
+            raise UnsupportedExpression(f"unknown name {e}") from None
+        except OverflowError:
+            raise MathError("result is too large") from None
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise MathError(str(e)) from None
+
+    def __call__(self, **variables):
+        if self.value is not None:
+            return self.value
+        return self._run(variables, FUNCTIONS)
+
+
+@lru_cache(maxsize=2048)
+def compile_expression(source):
+    """Parse, validate and compile `source`; memoized per expression string."""
+    if len(source) > MAX_EXPRESSION_LENGTH:
+        raise MathError("expression is too long")
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError:
+        raise UnsupportedExpression("not a valid expression") from None
+    variables = set()
+    try:
+        return CompiledExpression(source, _compile(tree.body, variables), variables)
+    except RecursionError:
+        raise MathError("expression is nested too deeply") from None
+
+
+def evaluate(source, **variables):
+    return compile_expression(source)(**variables)
+
+
+_NUMBER = re.compile(r"(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.])")
+
+
+@lru_cache(maxsize=512)
+def _compile_template(template):
+    return _compile(ast.parse(template, mode="eval").body, set())
+
+
+def evaluate_batch(expressions):
+    """Evaluate many constant expressions as float64, vectorized with NumPy.
+
+    Expressions with the same shape ("2+3", "40+2") are grouped and evaluated
+    with one array operation per node. Results are floats with IEEE semantics
+    (1/0 is inf) and invalid entries come back as nan. Use `evaluate` when
+    exact integer results matter.
+    """
+    if np is None:
+        return [_scalar_or_nan(source) for source in expressions]
+    results = [math.nan] * len(expressions)
+    groups = {}
+    for i, source in enumerate(expressions):
+        constants = []
+
+        def lift(match):
+            constants.append(float(match.group()))
+            return f"_c{len(constants) - 1}"
+
+        groups.setdefault(_NUMBER.sub(lift, source.strip()), []).append((i, constants))
+    for template, members in groups.items():
+        try:
+            if len(template) > MAX_EXPRESSION_LENGTH:
+                raise MathError("expression is too long")
+            fn = _compile_template(template)
+            columns = zip(*[constants for _, constants in members])
+            env = {f"_c{j}": np.asarray(column) for j, column in enumerate(columns)}
+            with np.errstate(all="ignore"):
+                values = np.broadcast_to(fn(env, NUMPY_FUNCTIONS), (len(members),))
+        except (SyntaxError, KeyError, MathError, ArithmeticError, ValueError, TypeError, RecursionError):
+            # Not vectorizable (unknown names, factorial, ...): one by one
+            values = [_scalar_or_nan(expressions[i]) for i, _ in members]
+        for (i, _), value in zip(members, values):
+            results[i] = float(value)
+    return results
+
+
+def _scalar_or_nan(source):
+    try:
+        return float(evaluate(source))
+    except (MathError, OverflowError):
+        return math.nan
+
+
+# "what is 2**10", "compute (3 + 4) * 2 please": prose before the arithmetic only
+_PROSE_THEN_ARITHMETIC = re.compile(r"(?:(?P<prose>[A-Za-z' ]*[A-Za-z'])\s+)?"
+                                    r"(?P<expression>[-+*/().0-9 ]*\d[-+*/().0-9 ]*?)\s*(?:please)?", re.IGNORECASE)
+
+
+def calculate(text):
+    """Evaluate the arithmetic in free text like 'what is 2^10?'; raises MathError.
+
+    The whole text is tried first. Only if it is not an expression at all do
+    we fall back to the arithmetic at its end, and only when the words before
+    it cannot change its meaning (no function or constant names, commas or
+    words after the numbers, as in "pow(2,3)" or "7 squared").
+    """
+    text = text.strip().rstrip("=?.").replace("^", "**")
+    try:
+        return evaluate(text)
+    except UnsupportedExpression as e:
+        error = e
+    match = _PROSE_THEN_ARITHMETIC.fullmatch(text)
+    if not match or any(word.lower() in FUNCTIONS or word.lower() in CONSTANTS
+                        for word in (match.group("prose") or "").split()):
+        raise error
+    try:
+        return evaluate(match.group("expression"))
+    except UnsupportedExpression:
+        raise error from None
@@ -0,0 +1,192 @@
+# --- Python Sandbox ---
+# python_executor runs model-written code here instead of exec() inside the
+# Streamlit server. A small pool of pre-warmed worker interpreters each run
+# one snippet at a time under wall-clock, CPU-time and address-space limits;
+# a worker that blows a limit is killed and replaced in the background.
+#
+# Worker protocol: one JSON request per line on stdin ({"code": ...}), one
+# JSON reply per line on stdout ({"result", "stdout"} or {"error", "stdout"}).
+
+import atexit
+import contextlib
+import io
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, only the wall-clock timeout applies
+    resource = None
+
+MAX_STDOUT = 4000
+
+
+class SandboxWorker:
+    def __init__(self, cpu_seconds, memory_mb, cwd):
+        self.tasks = 0
+        self.proc = subprocess.Popen(
+            [sys.executable, "-I", "-u", __file__, "--worker", str(cpu_seconds or 0), str(memory_mb or 0)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=cwd, text=True, encoding="utf-8",
+        )
+        self.replies = queue.Queue()
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self):
+        for line in self.proc.stdout:
+            self.replies.put(line)
+        self.replies.put(None)  # EOF: the worker died
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def run(self, code, timeout):
+        self.tasks += 1
+        try:
+            self.proc.stdin.write(json.dumps({"code": code}) + "\n")
+            self.proc.stdin.flush()
+        except OSError:
+            return {"error": "sandbox worker is not running", "stdout": ""}
+        try:
+            line = self.replies.get(timeout=timeout)
+        except queue.Empty:
+            self.kill()
+            return {"error": f"execution timed out after {timeout}s", "stdout": ""}
+        if line is None:
+            self.proc.wait()
+            return {"error": f"execution aborted (resource limit exceeded, exit code {self.proc.returncode})", "stdout": ""}
+        try:
+            return json.loads(line)
+        except ValueError:
+            self.kill()
+            return {"error": "sandbox worker sent a malformed reply", "stdout": ""}
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class SandboxPool:
+    """Pool of pre-warmed worker processes.
+
+    `run(code)` waits up to `queue_timeout` seconds for a free worker and
+    returns the worker's reply dict (an error reply if none became free).
+    Workers are recycled after `max_tasks` snippets so module-level state
+    left behind by one snippet does not live forever. `close()` kills the
+    workers and removes their working directory.
+    """
+
+    def __init__(self, size=2, timeout=10, cpu_seconds=5, memory_mb=512, max_tasks=50, queue_timeout=5):
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_tasks = max_tasks
+        self.workdir = tempfile.mkdtemp(prefix="agent-sandbox-")
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        return SandboxWorker(self.cpu_seconds, self.memory_mb, self.workdir)
+
+    def _replace(self):
+        if not self._closed:
+            worker = self._spawn()
+            if self._closed:  # closed while it started
+                worker.kill()
+            else:
+                self._idle.put(worker)
+
+    def run(self, code, timeout=None):
+        if self._closed:
+            return {"error": "sandbox is shut down", "stdout": ""}
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:  # every worker busy, or stuck respawning
+            return {"error": f"no sandbox worker became free within {self.queue_timeout}s", "stdout": ""}
+        try:
+            return worker.run(code, timeout or self.timeout)
+        finally:
+            if not self._closed and worker.alive() and worker.tasks < self.max_tasks:
+                self._idle.put(worker)
+            else:
+                worker.kill()
+                # Respawn off the hot path so the next caller gets a warm worker.
+                threading.Thread(target=self._replace, daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+        # Busy workers are killed as they come back; their files go with the directory
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def default_pool(**options):
+    """Process-wide pool, created on first use and shut down at exit."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = SandboxPool(**options)
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+# --- Worker Side ---
+def _limit_cpu(cpu_seconds):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(cpu_seconds, memory_mb):
+    if resource and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Replies go out on a private copy of stdout; fd 1 itself is pointed at
+    # /dev/null so a snippet writing to it directly cannot corrupt the protocol.
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    sys.stdout = open(os.devnull, "w")
+    for line in sys.stdin:
+        code = json.loads(line)["code"]
+        if resource and cpu_seconds:
+            _limit_cpu(cpu_seconds)  # SIGXCPU ends the worker once this snippet's share is used
+        captured = io.StringIO()
+        exec_globals = {}
+        try:
+            with contextlib.redirect_stdout(captured):
+                exec(code, exec_globals)
+            reply = {"result": str(exec_globals.get("result", "Code executed."))}
+        except MemoryError:
+            reply = {"error": f"memory limit of {memory_mb} MB exceeded"}
+        except Exception as e:
+            reply = {"error": str(e)}
+        except BaseException as e:  # SystemExit, KeyboardInterrupt
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        reply["stdout"] = captured.getvalue()[:MAX_STDOUT]
+        protocol.write(json.dumps(reply) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--worker"]:
+    _worker_main(int(sys.argv[2]), int(sys.argv[3]))
@@ -0,0 +1,593 @@
+# --- Local Search Index ---
+# Backs the Search tool in Lang.py. Documents under a corpus directory are
+# split into passages and indexed for BM25. An index directory holds a few
+# immutable segments, each a set of flat binary arrays (sorted terms,
+# postings, passage lengths and texts) that are memory-mapped on load, so
+# opening the index reads no postings and a query only touches the postings
+# of its own terms. Re-indexing is incremental: new and changed files go
+# into a new segment, stale passages are masked, and segments are merged
+# once there are too many. With an embedder (and numpy) each segment also
+# stores normalized passage vectors, and results are fused with BM25.
+#
+#   python search_index.py build docs/ .search-index [--embedder mymodel:embed]
+#   python search_index.py query .search-index "weather tomorrow" -k 5
+
+import argparse
+import array
+import bisect
+import heapq
+import importlib
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+try:
+    import numpy as np
+except ImportError:  # BM25 scoring falls back to pure Python; no vector index
+    np = None
+
+TEXT_EXTENSIONS = (".txt", ".md", ".rst", ".jsonl")
+PASSAGE_WORDS = 120
+MAX_SEGMENTS = 8
+SNIPPET_CHARS = 240
+K1, B = 1.2, 0.75
+RRF_K = 60  # reciprocal rank fusion constant for hybrid results
+MIN_SIMILARITY = 0.2  # vector-only hits below this cosine are noise, not matches
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me of on or "
+    "that the this to was what when where which who why will with you your".split())
+MANIFEST = "manifest.json"
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def split_passages(text, words=PASSAGE_WORDS):
+    """Paragraph-aligned passages of about `words` words; longer paragraphs are cut."""
+    passage, count = [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        tokens = paragraph.split()
+        if not tokens:
+            continue
+        if count and count + len(tokens) > words:
+            yield "\n\n".join(passage)
+            passage, count = [], 0
+        if len(tokens) > words:
+            for i in range(0, len(tokens), words):
+                yield " ".join(tokens[i:i + words])
+            continue
+        passage.append(paragraph.strip())
+        count += len(tokens)
+    if passage:
+        yield "\n\n".join(passage)
+
+
+def read_passages(path, words=PASSAGE_WORDS):
+    """Passages of one corpus file; `.jsonl` lines are {"text", optional "title"} records."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        if not path.endswith(".jsonl"):
+            return list(split_passages(f.read(), words))
+        passages = []
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = record.get("text") or record.get("content") or ""
+            title = record.get("title")
+            passages.extend(f"{title}\n\n{part}" if title else part for part in split_passages(text, words))
+        return passages
+
+
+def scan_corpus(corpus_dir):
+    """`{relative path: [mtime_ns, size]}` for every indexable file under `corpus_dir`."""
+    files = {}
+    for root, dirs, names in os.walk(corpus_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if name.endswith(TEXT_EXTENSIONS):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, corpus_dir)] = [stat.st_mtime_ns, stat.st_size]
+    return files
+
+
+def load_embedder(spec):
+    """`module:attribute` -> `embed(texts) -> vectors`, e.g. `mymodel:embed`."""
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name or "embed")
+
+
+# ---- Segments ----
+# Files of one segment (all little-endian, native widths):
+#   terms.bin / terms.off    sorted UTF-8 terms and their n+1 byte offsets (Q)
+#   postings.off             n+1 offsets of each term's postings (Q)
+#   postings.doc / .tf       passage ids (I) and term frequencies (H)
+#   lengths                  tokens per passage (I)
+#   text.bin / text.off      passage texts and their offsets (Q)
+#   vectors.f32              optional (passages x dim) unit vectors
+#   segment.json             sources: [{name, first, count, tokens}], passages, tokens, dim
+
+def _write_array(directory, name, typecode, values):
+    with open(os.path.join(directory, name), "wb") as f:
+        array.array(typecode, values).tofile(f)
+
+
+def write_segment(directory, sources, vectors=None, embed=None):
+    """Write `sources` (a list of `(name, passages)`) as a new segment in `directory`.
+
+    `vectors` are the passages' vectors if already known (a merge), otherwise
+    they are computed with `embed` when one is given.
+    """
+    os.makedirs(directory)
+    postings = defaultdict(list)
+    lengths, texts, meta_sources = [], [], []
+    for name, passages in sources:
+        first = len(texts)
+        for passage in passages:
+            counts = Counter(tokenize(passage))
+            for term, tf in counts.items():
+                postings[term].append((len(texts), min(tf, 0xFFFF)))
+            lengths.append(sum(counts.values()))
+            texts.append(passage)
+        meta_sources.append({"name": name, "first": first, "count": len(passages), "tokens": sum(lengths[first:])})
+
+    terms = sorted(postings)
+    encoded = [term.encode("utf-8") for term in terms]
+    with open(os.path.join(directory, "terms.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    _write_array(directory, "terms.off", "Q", _offsets(len(term) for term in encoded))
+    _write_array(directory, "postings.off", "Q", _offsets(len(postings[term]) for term in terms))
+    _write_array(directory, "postings.doc", "I", (doc for term in terms for doc, _ in postings[term]))
+    _write_array(directory, "postings.tf", "H", (tf for term in terms for _, tf in postings[term]))
+    _write_array(directory, "lengths", "I", lengths)
+    encoded = [text.encode("utf-8") for text in texts]
+    with open(os.path.join(directory, "text.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    _write_array(directory, "text.off", "Q", _offsets(len(text) for text in encoded))
+
+    dim = None
+    if vectors is None and embed is not None and np is not None and texts:
+        vectors = _normalize(np.asarray(embed(texts), dtype=np.float32))
+    if vectors is not None and len(vectors):
+        dim = int(vectors.shape[1])
+        vectors.astype(np.float32).tofile(os.path.join(directory, "vectors.f32"))
+    with open(os.path.join(directory, "segment.json"), "w", encoding="utf-8") as f:
+        json.dump({"sources": meta_sources, "passages": len(texts), "tokens": sum(lengths), "dim": dim}, f)
+
+
+def _offsets(sizes):
+    total = 0
+    yield total
+    for size in sizes:
+        total += size
+        yield total
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class _Terms:
+    """The sorted term list of a segment as a sequence, for bisect."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class Segment:
+    """One immutable segment, memory-mapped read-only."""
+
+    def __init__(self, directory, deleted=()):
+        self.directory = directory
+        with open(os.path.join(directory, "segment.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.sources = meta["sources"]
+        self.passages = meta["passages"]
+        self.dim = meta["dim"]
+        self._maps = []
+        self.terms = _Terms(self._map("terms.bin"), self._array("terms.off", "Q"))
+        self.postings_off = self._array("postings.off", "Q")
+        self.docs = self._array("postings.doc", "I")
+        self.tfs = self._array("postings.tf", "H")
+        self.lengths = self._array("lengths", "I")
+        self.text_data = self._map("text.bin")
+        self.text_off = self._array("text.off", "Q")
+        self.vectors = None
+        if self.dim and np is not None:
+            self.vectors = np.memmap(os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r",
+                                     shape=(self.passages, self.dim))
+
+        self.deleted = set(deleted)
+        live = [s for s in self.sources if s["name"] not in self.deleted]
+        self.live_passages = sum(s["count"] for s in live)
+        self.live_tokens = sum(s["tokens"] for s in live)
+        self.mask = None  # passages of deleted sources, for vectorized scoring
+        if self.deleted and np is not None:
+            self.mask = np.zeros(self.passages, dtype=bool)
+            for s in self.sources:
+                if s["name"] in self.deleted:
+                    self.mask[s["first"]:s["first"] + s["count"]] = True
+        self._firsts = [s["first"] for s in self.sources]
+
+    def _map(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.getsize(path):
+            return memoryview(b"")
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)
+
+    def _array(self, name, typecode):
+        data = self._map(name)
+        if np is not None:
+            return np.frombuffer(data, dtype=np.dtype(typecode))
+        return data.cast(typecode)
+
+    def postings(self, term):
+        """`(passage ids, term frequencies)` of `term`, or None."""
+        i = bisect.bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        start, end = self.postings_off[i], self.postings_off[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def source(self, passage):
+        s = self.sources[bisect.bisect_right(self._firsts, passage) - 1]
+        return s["name"]
+
+    def is_live(self, passage):
+        return not self.deleted or self.source(passage) not in self.deleted
+
+    def text(self, passage):
+        start, end = self.text_off[passage], self.text_off[passage + 1]
+        return bytes(self.text_data[start:end]).decode("utf-8")
+
+    def close(self):
+        self.vectors = None
+        self.terms = self.postings_off = self.docs = self.tfs = self.lengths = self.text_data = self.text_off = None
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:  # still exported by a live array; freed with it
+                pass
+
+
+# ---- Searching ----
+
+class Hit:
+    def __init__(self, source, passage, score, snippet, text):
+        self.source = source
+        self.passage = passage
+        self.score = score
+        self.snippet = snippet
+        self.text = text
+
+    def __repr__(self):
+        return f"Hit({self.source!r}, score={self.score:.3f})"
+
+
+def make_snippet(text, terms, width=SNIPPET_CHARS):
+    """About `width` characters of `text` around the first query term it contains."""
+    flat = " ".join(text.split())
+    if len(flat) <= width:
+        return flat
+    match = re.search(r"\b(?:%s)\b" % "|".join(map(re.escape, terms)), flat, re.IGNORECASE) if terms else None
+    start = max(0, (match.start() if match else 0) - width // 3)
+    start = flat.rfind(" ", 0, start) + 1 if start else 0
+    end = min(len(flat), start + width)
+    return ("..." if start else "") + flat[start:end].strip() + ("..." if end < len(flat) else "")
+
+
+class SearchIndex:
+    """Read-only view of the index in `directory`: BM25, plus vectors if it has an embedder.
+
+    `retire()` closes it once the searches in flight are done; a search that
+    arrives later is answered by the directory's current index (load_index).
+    """
+
+    def __init__(self, directory, embed=None):
+        self.directory = directory
+        self._searches = 0
+        self._retired = self._closed = False
+        self._lock = threading.Lock()
+        manifest = read_manifest(directory)
+        self.segments = [Segment(os.path.join(directory, s["name"]), s["deleted"]) for s in manifest["segments"]]
+        self.passages = sum(seg.live_passages for seg in self.segments)
+        self.avgdl = sum(seg.live_tokens for seg in self.segments) / self.passages if self.passages else 0.0
+        if embed is None and manifest.get("embedder"):
+            embed = load_embedder(manifest["embedder"])
+        self.embed = embed if np is not None and any(seg.vectors is not None for seg in self.segments) else None
+
+    def search(self, query, k=5, hybrid=True):
+        """Top `k` passages for `query` as Hits, best first."""
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._searches += 1
+        if closed:
+            current = load_index(self.directory)
+            return current.search(query, k, hybrid) if current is not None and current is not self else []
+        try:
+            return self._search(query, k, hybrid)
+        finally:
+            with self._lock:
+                self._searches -= 1
+                last = self._retired and not self._searches
+            if last:
+                self.close()
+
+    def _search(self, query, k, hybrid):
+        terms = list(dict.fromkeys(tokenize(query)))
+        ranked = self._bm25(terms, k if not (hybrid and self.embed) else 4 * k)
+        if hybrid and self.embed:
+            ranked = _fuse(ranked, self._nearest(query, 4 * k))[:k]
+        hits = []
+        for score, s, passage in ranked[:k]:
+            segment = self.segments[s]
+            text = segment.text(passage)
+            hits.append(Hit(segment.source(passage), passage, score, make_snippet(text, terms), text))
+        return hits
+
+    def _bm25(self, terms, k):
+        if not terms or not self.passages:
+            return []
+        df = {term: 0 for term in terms}
+        found = []
+        for segment in self.segments:
+            lists = {}
+            for term in terms:
+                postings = segment.postings(term)
+                if postings is not None and len(postings[0]):
+                    lists[term] = postings
+                    df[term] += len(postings[0])
+            found.append(lists)
+        # df counts masked passages too until their segment is merged away, as in Lucene
+        idf = {term: math.log(1 + (self.passages - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+        best = []
+        for s, (segment, lists) in enumerate(zip(self.segments, found)):
+            if lists:
+                scorer = self._score_numpy if np is not None else self._score_python
+                best.extend((score, s, passage) for score, passage in scorer(segment, lists, idf, k))
+        return heapq.nlargest(k, best)
+
+    def _score_numpy(self, segment, lists, idf, k):
+        scores = np.zeros(segment.passages, dtype=np.float32)
+        for term, (docs, tfs) in lists.items():
+            tf = tfs.astype(np.float32)
+            norm = K1 * (1 - B + B * segment.lengths[docs] / self.avgdl)
+            scores[docs] += idf[term] * tf * (K1 + 1) / (tf + norm)
+        if segment.mask is not None:
+            scores[segment.mask] = 0
+        top = np.flatnonzero(scores)
+        if len(top) > k:
+            top = top[np.argpartition(scores[top], -k)[-k:]]
+        return [(float(scores[i]), int(i)) for i in top]
+
+    def _score_python(self, segment, lists, idf, k):
+        scores = defaultdict(float)
+        for term, (docs, tfs) in lists.items():
+            weight = idf[term] * (K1 + 1)
+            for doc, tf in zip(docs, tfs):
+                scores[doc] += weight * tf / (tf + K1 * (1 - B + B * segment.lengths[doc] / self.avgdl))
+        live = ((score, doc) for doc, score in scores.items() if segment.is_live(doc))
+        return heapq.nlargest(k, live)
+
+    def _nearest(self, query, k):
+        vector = _normalize(np.asarray(self.embed([query]), dtype=np.float32))[0]
+        best = []
+        for s, segment in enumerate(self.segments):
+            if segment.vectors is None:
+                continue
+            sims = segment.vectors @ vector
+            if segment.mask is not None:
+                sims[segment.mask] = -np.inf
+            top = np.argpartition(sims, -k)[-k:] if len(sims) > k else np.arange(len(sims))
+            best.extend((float(sims[i]), s, int(i)) for i in top if sims[i] >= MIN_SIMILARITY)
+        return heapq.nlargest(k, best)
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            idle = not self._searches
+        if idle:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for segment in self.segments:
+            segment.close()
+
+
+def _fuse(*rankings):
+    """Reciprocal rank fusion of `(score, segment, passage)` rankings."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, (_, s, passage) in enumerate(ranking):
+            fused[s, passage] += 1 / (RRF_K + rank + 1)
+    return sorted(((score, s, passage) for (s, passage), score in fused.items()), reverse=True)
+
+
+_open = {}
+_open_lock = threading.Lock()
+
+
+def load_index(directory):
+    """The SearchIndex for `directory`, reopened only after it was re-indexed; None if there is none.
+
+    The index it replaces is retired, so its segments are unmapped once its
+    last search is done.
+    """
+    path = os.path.join(directory, MANIFEST)
+    try:
+        stat = os.stat(path)
+        version = stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        version = None
+    with _open_lock:
+        cached = _open.get(directory)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        index = SearchIndex(directory) if version is not None else None
+        if index is None:
+            _open.pop(directory, None)
+        else:
+            _open[directory] = version, index
+    if cached is not None:
+        cached[1].retire()
+    return index
+
+
+# ---- Building ----
+
+def _empty_manifest():
+    return {"segments": [], "files": {}, "embedder": None, "passage_words": PASSAGE_WORDS}
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _empty_manifest()
+
+
+def _write_manifest(directory, manifest):
+    tmp = os.path.join(directory, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+def build_index(corpus_dir, directory, embedder=None, passage_words=None, max_segments=MAX_SEGMENTS,
+                rebuild=False):
+    """Bring the index in `directory` up to date with `corpus_dir`; returns what changed.
+
+    Only new and modified files are read. Their old passages stay on disk,
+    masked, until segments are merged. `embedder` ("module:attr") turns on
+    the vector index and is remembered for later runs and queries.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    if rebuild:
+        manifest = {**_empty_manifest(), "embedder": manifest["embedder"]}
+    manifest["embedder"] = embedder or manifest["embedder"]
+    manifest["passage_words"] = passage_words = passage_words or manifest["passage_words"]
+    embed = load_embedder(manifest["embedder"]) if manifest["embedder"] else None
+
+    files = scan_corpus(corpus_dir)
+    indexed = manifest["files"]
+    changed = sorted(name for name, stat in files.items() if indexed.get(name, {}).get("stat") != stat)
+    removed = sorted(name for name in indexed if name not in files)
+    segments = {s["name"]: s for s in manifest["segments"]}
+    for name in changed + removed:
+        if name in indexed:
+            segments[indexed.pop(name)["segment"]]["deleted"].append(name)
+
+    if changed:
+        segment = f"seg-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        sources = [(name, read_passages(os.path.join(corpus_dir, name), passage_words)) for name in changed]
+        write_segment(os.path.join(directory, segment), sources, embed=embed)
+        manifest["segments"].append({"name": segment, "deleted": []})
+        for name in changed:
+            indexed[name] = {"stat": files[name], "segment": segment}
+
+    merged = False
+    if len(manifest["segments"]) > max_segments:
+        _merge(directory, manifest)
+        merged = True
+    # drop segments whose files were all replaced or removed
+    used = {entry["segment"] for entry in indexed.values()}
+    live = manifest["segments"] = [s for s in manifest["segments"] if s["name"] in used]
+    _write_manifest(directory, manifest)
+    kept = {s["name"] for s in live}
+    for name in os.listdir(directory):
+        if name.startswith("seg-") and name not in kept:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return {"added": [n for n in changed if n in files], "removed": removed, "merged": merged,
+            "segments": len(live), "files": len(indexed)}
+
+
+def _merge(directory, manifest):
+    """Rewrite all live passages (and vectors) of `manifest` as one segment."""
+    sources, vectors = [], []
+    for s in manifest["segments"]:
+        segment = Segment(os.path.join(directory, s["name"]), s["deleted"])
+        for source in segment.sources:
+            if source["name"] in segment.deleted:
+                continue
+            first, count = source["first"], source["count"]
+            sources.append((source["name"], [segment.text(i) for i in range(first, first + count)]))
+            if segment.vectors is not None:
+                vectors.append(np.array(segment.vectors[first:first + count]))
+        segment.close()
+    name = f"seg-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    all_vectors = np.concatenate(vectors) if vectors else None
+    if all_vectors is not None and len(all_vectors) != sum(len(p) for _, p in sources):
+        all_vectors = None  # some segments predate the embedder; merged segment is BM25-only
+    write_segment(os.path.join(directory, name), sources, vectors=all_vectors)
+    manifest["segments"] = [{"name": name, "deleted": []}]
+    for entry in manifest["files"].values():
+        entry["segment"] = name
+
+
+def main():
+    args = argparse.ArgumentParser(description="Build or query the local search index.")
+    commands = args.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index new and changed files of a corpus directory")
+    build.add_argument("corpus")
+    build.add_argument("index")
+    build.add_argument("--embedder", help="embed(texts) -> vectors, as module:attribute (needs numpy)")
+    build.add_argument("--passage-words", type=int)
+    build.add_argument("--max-segments", type=int, default=MAX_SEGMENTS)
+    build.add_argument("--rebuild", action="store_true", help="start over instead of updating")
+    query = commands.add_parser("query", help="print the top passages for a query")
+    query.add_argument("index")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=5)
+    query.add_argument("--bm25-only", action="store_true")
+    opts = args.parse_args()
+
+    if opts.command == "build":
+        started = time.perf_counter()
+        summary = build_index(opts.corpus, opts.index, opts.embedder, opts.passage_words, opts.max_segments,
+                              opts.rebuild)
+        print(f"{len(summary['added'])} files indexed, {len(summary['removed'])} removed, "
+              f"{summary['files']} files in {summary['segments']} segments"
+              f"{' (merged)' if summary['merged'] else ''}, {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return
+    index = load_index(opts.index)
+    if index is None:
+        sys.exit(f"no index in {opts.index}")
+    started = time.perf_counter()
+    hits = index.search(opts.text, k=opts.k, hybrid=not opts.bm25_only)
+    for hit in hits:
+        print(f"{hit.score:8.3f}  {hit.source}  {hit.snippet}")
+    print(f"{len(hits)} hits of {index.passages} passages in {(time.perf_counter() - started) * 1000:.1f} ms",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+# --- Session Store ---
+# Keeps the persistent part of a chat session (history, steps, memory, the
+# upload) outside the process, so any replica can pick a session up and a
+# restart loses nothing. st.session_state stays the working copy: a session
+# is loaded into it once, when a browser session starts, and at the end of
+# every run only the fields that changed are written back. Values
+# are stored per field as compact JSON (msgpack when installed); uploads are
+# stored by reference to their spooled file (see file_store), never inline.
+#
+#   AGENT_SESSION_STORE=memory | sqlite:///sessions.db | redis://:password@host:6379/0
+#
+# The session id travels in the page URL (?sid=...), so a reload or another
+# replica finds the same session. Running jobs, caches and registries with
+# live functions stay per process.
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+from conversation_memory import ConversationMemory
+from file_store import SpooledFile, spool_upload
+
+try:
+    import msgpack
+except ImportError:  # JSON only
+    msgpack = None
+
+STORE_URL = os.environ.get("AGENT_SESSION_STORE")
+SESSION_TTL = int(os.environ.get("AGENT_SESSION_TTL") or 7 * 24 * 3600)  # seconds since the last write
+
+
+# ---- Encoding ----
+# Objects that are not plain data are tagged {"__type__": tag, "state": ...}.
+# Classes are matched by name: Streamlit re-executes an app script on every
+# run, so a class defined there is a new object each time.
+_TYPES = {}  # tag -> (to_state, from_state)
+_TAGS = {}  # (module, qualname) -> tag
+_VERSIONS = {}  # tag -> version(obj), for types that can say cheaply whether they changed
+
+
+def _type_name(cls):
+    return cls.__module__, cls.__qualname__
+
+
+def register_type(cls, tag, to_state, from_state, version=None):
+    """Teach the codec a class, e.g. an app's memory wrapper.
+
+    `version(obj)` is optional: a value that changes whenever the object
+    does lets Session.flush skip encoding it on runs that did not touch it.
+    """
+    _TYPES[tag] = (to_state, from_state)
+    _TAGS[_type_name(cls)] = tag
+    if version is not None:
+        _VERSIONS[tag] = version
+
+
+def _is_upload(value):
+    return hasattr(value, "getvalue") and hasattr(value, "name")
+
+
+def _upload_state(value):
+    spooled = spool_upload(value)
+    return {"path": spooled.path, "digest": spooled.digest, "name": spooled.name, "size": spooled.size}
+
+
+def _upload_from_state(state):
+    # The spool directory must be shared between replicas for this to resolve elsewhere
+    if not os.path.exists(state["path"]):
+        return None
+    return SpooledFile(state["path"], state["digest"], state["name"], state["size"])
+
+
+register_type(ConversationMemory, "memory", ConversationMemory.to_state, ConversationMemory.from_state,
+              version=lambda memory: memory.version)
+register_type(SpooledFile, "upload", _upload_state, _upload_from_state)
+
+
+def to_plain(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    if _is_upload(value):
+        return {"__type__": "upload", "state": _upload_state(value)}
+    for cls in type(value).__mro__:
+        tag = _TAGS.get(_type_name(cls))
+        if tag is not None:
+            return {"__type__": tag, "state": to_plain(_TYPES[tag][0](value))}
+    raise TypeError(f"cannot store {type(value).__name__} in a session")
+
+
+def change_marker(value):
+    """Cheap stand-in for comparing a field's encoding, valid while the field holds the same object.
+
+    Plain values and uploads are never changed in place, lists are treated as
+    append-only logs (their length), registered types report their `version`.
+    None: unknown, the field has to be encoded to tell.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)) or _is_upload(value):
+        return ()
+    if isinstance(value, list):
+        return (len(value),)
+    for cls in type(value).__mro__:
+        tag = _TAGS.get(_type_name(cls))
+        if tag is not None:
+            return (_VERSIONS[tag](value),) if tag in _VERSIONS else None
+    return None
+
+
+def from_plain(value):
+    if isinstance(value, list):
+        return [from_plain(v) for v in value]
+    if isinstance(value, dict):
+        if "__type__" in value and value["__type__"] in _TYPES:
+            return _TYPES[value["__type__"]][1](value["state"])
+        return {k: from_plain(v) for k, v in value.items()}
+    return value
+
+
+class JSONCodec:
+    name = "json"
+
+    def encode(self, value):
+        return json.dumps(to_plain(value), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data):
+        return from_plain(json.loads(data))
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def encode(self, value):
+        return msgpack.packb(to_plain(value), use_bin_type=True)
+
+    def decode(self, data):
+        return from_plain(msgpack.unpackb(data, raw=False))
+
+
+def default_codec():
+    return MsgpackCodec() if msgpack is not None else JSONCodec()
+
+
+# ---- Backends ----
+# Each stores `{field: bytes}` per session id: load(sid) -> dict, save(sid, fields), delete(sid).
+
+class MemoryBackend:
+    """This process only; for development and tests."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            return dict(self._sessions.get(sid, {}))
+
+    def save(self, sid, fields):
+        with self._lock:
+            self._sessions.setdefault(sid, {}).update(fields)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLiteBackend:
+    """One row per session field; shared by replicas on the same host or a shared volume."""
+
+    def __init__(self, path, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS session_fields (sid TEXT, field TEXT, value BLOB, "
+                       "updated REAL, PRIMARY KEY (sid, field))")
+            db.execute("DELETE FROM session_fields WHERE updated < ?", (time.time() - ttl,))
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def load(self, sid):
+        rows = self._connect().execute("SELECT field, value FROM session_fields WHERE sid = ? AND updated >= ?",
+                                       (sid, time.time() - self.ttl))
+        return {field: bytes(value) for field, value in rows}
+
+    def save(self, sid, fields):
+        now = time.time()
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO session_fields VALUES (?, ?, ?, ?)",
+                           [(sid, field, value, now) for field, value in fields.items()])
+            db.execute("UPDATE session_fields SET updated = ? WHERE sid = ?", (now, sid))
+
+    def delete(self, sid):
+        with self._connect() as db:
+            db.execute("DELETE FROM session_fields WHERE sid = ?", (sid,))
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """A hash per session over the Redis protocol (RESP); works with any compatible server.
+
+    Only HSET / HGETALL / EXPIRE / DEL are used, so a Redis-protocol stand-in
+    (KeyDB, Dragonfly, a local test server) can replace Redis.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, ttl=SESSION_TTL, prefix="agent:session:",
+                 timeout=5.0):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.ttl = ttl
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, **options):
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password, **options)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            if self.password:
+                self._roundtrip(conn, [b"AUTH", self.password])
+            if self.db:
+                self._roundtrip(conn, [b"SELECT", str(self.db)])
+        return conn
+
+    def command(self, *args):
+        try:
+            return self._roundtrip(self._connection(), args)
+        except OSError:
+            self.close()  # reconnect once; the server may have closed an idle connection
+            return self._roundtrip(self._connection(), args)
+
+    def close(self):
+        """Close this thread's connection, if any."""
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            sock, reader = conn
+            for part in (reader, sock):
+                try:
+                    part.close()
+                except OSError:
+                    pass
+
+    def _roundtrip(self, conn, args):
+        sock, reader = conn
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts += [b"$%d\r\n" % len(data), data, b"\r\n"]
+        sock.sendall(b"".join(parts))
+        return _read_reply(reader)
+
+    def load(self, sid):
+        flat = self.command(b"HGETALL", self.prefix + sid) or []
+        return {flat[i].decode("utf-8"): flat[i + 1] for i in range(0, len(flat), 2)}
+
+    def save(self, sid, fields):
+        if not fields:
+            return
+        key = self.prefix + sid
+        args = [b"HSET", key]
+        for field, value in fields.items():
+            args += [field, value]
+        self.command(*args)
+        self.command(b"EXPIRE", key, self.ttl)
+
+    def delete(self, sid):
+        self.command(b"DEL", self.prefix + sid)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by the server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise RedisError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = reader.read(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        return None if count < 0 else [_read_reply(reader) for _ in range(count)]
+    raise RedisError(f"unexpected reply {line!r}")
+
+
+def open_backend(url):
+    """Backend for an AGENT_SESSION_STORE url; None for an empty url (no persistence)."""
+    if not url:
+        return None
+    if url == "memory":
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):  # sqlite:///relative.db, sqlite:////absolute.db
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "resp://")):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"unknown session store {url!r}")
+
+
+# ---- Sessions ----
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class Session:
+    """The persisted fields of one session, with what was last written, for dirty checks.
+
+    A field that still holds the same object with the same change_marker is
+    skipped without being encoded, so a run that changed nothing costs no
+    serialization. Otherwise it is encoded and written if its digest moved.
+    An app that edits a list entry in place calls `touch(field)`.
+    """
+
+    def __init__(self, backend, sid, fields, codec=None):
+        self.backend = backend
+        self.sid = sid
+        self.fields = tuple(fields)
+        self.codec = codec or default_codec()
+        self._digests = {}
+        self._seen = {}  # field -> (object, change marker) as of the last load or flush
+
+    def load(self):
+        """`{field: value}` of what the store holds for this session."""
+        values = {}
+        for field, data in self.backend.load(self.sid).items():
+            if field in self.fields:
+                values[field] = value = self.codec.decode(data)
+                self._digests[field] = _digest(data)
+                self._seen[field] = (value, change_marker(value))
+        return values
+
+    def touch(self, field):
+        """Have the next flush encode `field` even if it looks unchanged."""
+        self._seen.pop(field, None)
+
+    def flush(self, state):
+        """Write the fields of `state` that changed since the last load or flush; returns their names."""
+        dirty = {}
+        for field in self.fields:
+            if field not in state:
+                continue
+            value = state[field]
+            marker = change_marker(value)
+            seen = self._seen.get(field)
+            if marker is not None and seen is not None and seen[0] is value and seen[1] == marker:
+                continue
+            data = self.codec.encode(value)
+            digest = _digest(data)
+            self._seen[field] = (value, marker)
+            if self._digests.get(field) != digest:
+                dirty[field] = data
+                self._digests[field] = digest
+        if dirty:
+            self.backend.save(self.sid, dirty)
+        return list(dirty)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(url=STORE_URL):
+    """One backend per url and process."""
+    if not url:
+        return None
+    with _backends_lock:
+        if url not in _backends:
+            _backends[url] = open_backend(url)
+        return _backends[url]
+
+
+def attach_session(fields, url=STORE_URL):
+    """Bind this Streamlit session to the store; call it before the app sets its defaults.
+
+    On the first run of a browser session the stored fields are loaded into
+    st.session_state. Returns the Session to `flush` at the end of every run,
+    or None when no store is configured.
+    """
+    import streamlit as st  # the rest of this module runs without Streamlit
+
+    backend = get_backend(url)
+    if backend is None:
+        return None
+    session = st.session_state.get("_session")
+    if session is None:
+        sid = st.query_params.get("sid") or uuid.uuid4().hex
+        st.query_params["sid"] = sid
+        session = st.session_state["_session"] = Session(backend, sid, fields)
+        for field, value in session.load().items():
+            st.session_state[field] = value
+    return session
+
+
+def flush_session(session):
+    """End-of-run write of the dirty fields of st.session_state."""
+    if session is not None:
+        import streamlit as st
+        session.flush(st.session_state)
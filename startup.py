@@ -0,0 +1,231 @@
+# --- Startup Profile ---
+# Cold start is mostly imports: LangChain alone takes well over a second,
+# and Streamlit executes an app script again on every interaction. Two
+# tools for keeping that off the user's path:
+#
+# - `lazy("module")` defers an import to the first attribute access, and
+#   `preload()` starts it on a background thread so it is usually done by
+#   the time it is needed. Each load is timed.
+# - `begin_run()` / `mark()` / `finish()` time each script run: the first
+#   run of a process reports the cold start (process start to first page),
+#   later runs what the rerun spent before reaching the app code (imports,
+#   mostly cached) and in total. With AGENT_STARTUP_PROFILE=1 every run and
+#   every lazy load is reported on stderr.
+#
+# The CLI profiles a script from a fresh interpreter with `-X importtime`
+# and then times its first run and reruns (Streamlit's AppTest):
+#
+#   python startup.py Lang.py [--top 15] [--reruns 5]
+
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+REPORT = os.environ.get("AGENT_STARTUP_PROFILE", "0") != "0"
+
+_imported_at = time.time()
+
+
+def process_started():
+    """Wall-clock start of this process (Linux /proc), else when this module was imported."""
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _imported_at
+
+
+def _report(text):
+    if REPORT:
+        print(f"[startup] {text}", file=sys.stderr)
+
+
+# ---- Lazy imports ----
+
+loads = {}  # module name -> seconds its import took
+
+
+class LazyModule:
+    """A module imported on first attribute access; `loaded` says whether that happened yet."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:  # concurrent first uses wait for one import
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    loads[self._name] = time.perf_counter() - started
+                    _report(f"lazy import {self._name}: {loads[self._name] * 1000:.0f} ms")
+                    self._module = module
+        return self._module
+
+    def preload(self, then=None):
+        """Load in a background thread, then call `then(module)` (e.g. to build shared objects)."""
+        def run():
+            module = self.load()
+            if then is not None:
+                then(module)
+        thread = threading.Thread(target=run, name=f"preload-{self._name}", daemon=True)
+        thread.start()
+        return thread
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{'' if self.loaded else ' (not loaded)'}>"
+
+
+def lazy(name):
+    return LazyModule(name)
+
+
+# ---- Script runs ----
+
+runs = deque(maxlen=100)  # finished RunProfile summaries, oldest first
+_runs_lock = threading.Lock()
+_run_count = 0
+
+
+class RunProfile:
+    """Timing of one script run; `mark(label)` records the time since the run began."""
+
+    def __init__(self, app):
+        global _run_count
+        with _runs_lock:
+            _run_count += 1
+            self.number = _run_count
+        self.app = app
+        self.started = time.perf_counter()
+        self.modules = len(sys.modules)
+        self.marks = {}
+
+    def mark(self, label):
+        self.marks[label] = time.perf_counter() - self.started
+
+    def finish(self):
+        summary = {"app": self.app, "run": self.number, "total_s": time.perf_counter() - self.started,
+                   "new_modules": len(sys.modules) - self.modules, **{f"{k}_s": v for k, v in self.marks.items()}}
+        if self.number == 1:
+            summary["cold_start_s"] = time.time() - process_started()
+        with _runs_lock:
+            runs.append(summary)
+        _report(describe(summary))
+        return summary
+
+
+def begin_run(app):
+    """Call first thing in an app script; `finish()` the result at its end."""
+    return RunProfile(app)
+
+
+def describe(summary):
+    parts = [f"{summary['app']} run {summary['run']}: {summary['total_s'] * 1000:.1f} ms"]
+    parts += [f"{key[:-2]} {value * 1000:.1f} ms" for key, value in summary.items()
+              if key.endswith("_s") and key not in ("total_s", "cold_start_s")]
+    parts.append(f"{summary['new_modules']} new modules")
+    if "cold_start_s" in summary:
+        parts.append(f"cold start {summary['cold_start_s']:.2f} s since process start")
+    return ", ".join(parts)
+
+
+# ---- Profiler (CLI) ----
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(module, cwd=None, python=sys.executable):
+    """`[(module, self_us, cumulative_us, depth)]` for `import module` in a fresh interpreter."""
+    proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"], cwd=cwd,
+                          capture_output=True, text=True)
+    records = []
+    for line in proc.stderr.splitlines():
+        matched = _IMPORTTIME.match(line)
+        if matched:
+            self_us, cumulative_us, indent, name = matched.groups()
+            records.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    if proc.returncode != 0 and not records:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return records
+
+
+def by_package(records):
+    """Self time (us) per top-level package, largest first."""
+    totals = defaultdict(int)
+    for name, self_us, _, _ in records:
+        totals[name.split(".")[0]] += self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def time_runs(script, reruns):
+    """Seconds of the first run and of each rerun of `script` under Streamlit's AppTest."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(script, default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - started)
+    return first, times
+
+
+def main():
+    args = argparse.ArgumentParser(description="Profile the cold start and reruns of an app script.")
+    args.add_argument("script", help="app script, e.g. Lang.py")
+    args.add_argument("--top", type=int, default=15, help="packages and imports to list")
+    args.add_argument("--reruns", type=int, default=5, help="reruns to time after the first run (0: skip)")
+    opts = args.parse_args()
+
+    directory, filename = os.path.split(os.path.abspath(opts.script))
+    module = os.path.splitext(filename)[0]
+    records = importtime(module, cwd=directory)
+    total = next((cumulative for name, _, cumulative, depth in records if name == module and depth == 0),
+                 sum(self_us for _, self_us, _, _ in records))
+    print(f"cold import of {module}: {total / 1000:.0f} ms, {len(records)} modules (-X importtime)")
+    print("  self time by package:")
+    for package, self_us in by_package(records)[:opts.top]:
+        print(f"    {package:<52} {self_us / 1000:8.1f} ms")
+    print("  slowest imports (cumulative):")
+    for name, _, cumulative, _ in sorted(records, key=lambda r: -r[2])[:opts.top]:
+        print(f"    {name:<52} {cumulative / 1000:8.1f} ms")
+
+    if opts.reruns:
+        sys.path.insert(0, directory)
+        first, times = time_runs(os.path.abspath(opts.script), opts.reruns)
+        state = importlib.import_module("startup")  # the app's copy; this one runs as __main__
+        times.sort()
+        print(f"script runs: first {first * 1000:.0f} ms (Streamlit already imported), "
+              f"reruns p50 {times[len(times) // 2] * 1000:.1f} ms / max {times[-1] * 1000:.1f} ms")
+        for summary in list(state.runs)[:1]:
+            print(f"  {describe(summary)}")
+        for thread in threading.enumerate():  # wait for background preloads
+            if thread.name.startswith("preload-"):
+                thread.join()
+        for name, seconds in state.loads.items():
+            print(f"  lazy import {name}: {seconds * 1000:.0f} ms (off the first run's path)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# --- Step Budget ---
+# Decides how many steps a turn may take and when it should stop before the
+# model says `finish`. Each turn gets its own TurnBudget: a limit sized by
+# how much the query asks for (capped by the app's max_steps), plus a check
+# after every step that ends the turn when the agent is looping or when the
+# last observation already answers the query. Every step saved is one
+# abc_response call saved. Retries of a failed abc_response call (see
+# resilience) are paid from the same budget, so a turn never makes more
+# calls than its limit.
+
+import contextvars
+import json
+import re
+from contextlib import contextmanager
+
+# Clause boundaries that usually start another thing to do
+_INTENT_BREAKS = re.compile(r"\?|;|\n|\b(?:and then|then|also|after that|afterwards|next)\b", re.IGNORECASE)
+# Queries that usually take more than one tool call per intent
+_MULTI_STEP = re.compile(r"\b(?:file|csv|json|column|rows?|data|code|python|script|plot|average|summari[sz]e)\b",
+                         re.IGNORECASE)
+# Observations that did not get anywhere (tool errors, missing input)
+ERROR_PREFIXES = ("Error", "Invalid", "Unknown tool", "No file uploaded", "Could not", "Parse error")
+# One line of a merged multi-action observation: "[2] calculator: The result is 42"
+_MERGED_LINE = re.compile(r"^\[\d+\] [^:]*: (.*)$", re.MULTILINE)
+
+_active = contextvars.ContextVar("turn_budget", default=None)
+
+
+def estimate_intents(query):
+    """Rough count of the separate things the user asks for."""
+    clauses = [clause for clause in _INTENT_BREAKS.split(query or "") if len(clause.split()) >= 2]
+    return max(1, len(clauses))
+
+
+def is_error(observation):
+    return str(observation).lstrip().startswith(ERROR_PREFIXES)
+
+
+def active_budget():
+    """The TurnBudget of the turn running in this context, or None (see TurnBudget.activate)."""
+    return _active.get()
+
+
+def _action_key(step):
+    return step["action"], json.dumps(step.get("action_input"), sort_keys=True, default=str)
+
+
+class StepBudget:
+    """Per-turn step policy shared by all turns of an agent.
+
+    A turn gets `base + 2 * intents` steps (one tool call and one finish per
+    intent), `multi_step_bonus` more when the query mentions files, data or
+    code, clamped to `[min_steps, cap]`. `is_final(name)` says whether a
+    tool's observation is a complete answer (ToolSpec.final).
+    """
+
+    def __init__(self, min_steps=3, base=1, multi_step_bonus=2, is_final=None, early_finish=True):
+        self.min_steps = min_steps
+        self.base = base
+        self.multi_step_bonus = multi_step_bonus
+        self.is_final = is_final or (lambda name: False)
+        self.early_finish = early_finish
+
+    def limit_for(self, query, cap):
+        limit = self.base + 2 * estimate_intents(query)
+        if _MULTI_STEP.search(query or ""):
+            limit += self.multi_step_bonus
+        return max(min(self.min_steps, cap), min(limit, cap))
+
+    def plan(self, query, cap):
+        return TurnBudget(self, query, self.limit_for(query, cap))
+
+
+class TurnBudget:
+    """Accounting for one turn: its step limit and why it stopped early, if it did."""
+
+    def __init__(self, policy, query, limit):
+        self.policy = policy
+        self.query = query
+        self.limit = limit
+        self.intents = estimate_intents(query)
+        self.used = 0
+        self.retries = 0
+        self.reason = None
+
+    @contextmanager
+    def activate(self):
+        """Make this the active_budget() of the code run inside (and of tasks it starts)."""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def retries_left(self):
+        """abc_response calls the turn can still spend on retries, keeping one for the current step."""
+        return max(0, self.limit - self.used - 1 - self.retries)
+
+    def spend_retry(self):
+        if self.retries_left() == 0:
+            return False
+        self.retries += 1
+        return True
+
+    def stop_reason(self, steps):
+        """Called by agent_turn after each step that did not finish; a reason ends the turn."""
+        self.used = len(steps)
+        last = steps[-1]
+        self.reason = self._loop(steps, last) or self._answered(last) or self._spent()
+        return self.reason
+
+    def _spent(self):
+        if self.retries and self.used + self.retries >= self.limit:
+            return "the step budget was used up by retries"
+        return None
+
+    def _loop(self, steps, last):
+        earlier = steps[:-1]
+        if earlier and earlier[-1]["observation"] == last["observation"]:
+            return "the last two steps produced the same observation"
+        if "action_input" in last:
+            key = _action_key(last)
+            for step in earlier:
+                # Re-running a call that failed may still work (e.g. a timeout)
+                if "action_input" in step and _action_key(step) == key and not is_error(step["observation"]):
+                    return f"{last['action']} was already run with the same input"
+        return None
+
+    def _answered(self, last):
+        if not self.policy.early_finish or "action_input" not in last:
+            return None
+        calls = last["action_input"] if isinstance(last["action_input"], list) else [
+            {"action": last["action"], "action_input": last["action_input"]}]
+        if len(calls) < self.intents or not all(self.policy.is_final(call["action"]) for call in calls):
+            return None
+        observation = str(last["observation"])
+        if is_error(observation) or any(is_error(part) for part in _MERGED_LINE.findall(observation)):
+            return None
+        return "the observation already answers the query"
@@ -0,0 +1,73 @@
+import pytest
+
+from action_parser import ActionParseError, ActionParser, parse_action
+
+ACTION = '{"thought": "add", "action": "calculator", "action_input": "2+3"}'
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("text", [
+    ACTION,
+    f"Sure! Here is my next step:\n{ACTION}\nLet me know.",
+    f"```json\n{ACTION}\n```",
+    f"Step {{2}} of the plan: {ACTION}",
+    f'{{"note": "no action here"}} then {ACTION}',
+])
+def test_first_action_object_is_found_in_prose_and_fences(text):
+    assert parse_action(text) == {"thought": "add", "action": "calculator", "action_input": "2+3"}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_any_chunking_gives_the_same_action(size):
+    text = 'Thinking {not json} ```json\n{"action": "python_executor", "action_input": "print(\\"{}\\")"}``` tail'
+    assert parse_action(chunked(text, size)) == {"action": "python_executor", "action_input": 'print("{}")'}
+
+
+def test_feed_returns_the_action_as_soon_as_the_object_closes():
+    parser = ActionParser()
+    assert parser.feed('prefix {"action": "fin') is None
+    assert parser.feed('ish"} trailing') == {"action": "finish"}
+    assert parser.end == len('prefix {"action": "finish"}')
+    assert parser.feed("more text") == {"action": "finish"}
+
+
+def test_braces_and_quotes_inside_strings_do_not_end_the_object():
+    text = '{"action": "conversation", "action_input": "a } brace, a \\" quote and a { brace"}'
+    assert parse_action(text)["action_input"] == 'a } brace, a " quote and a { brace'
+
+
+def test_multi_action_replies_are_accepted():
+    text = '{"actions": [{"action": "a", "action_input": 1}, {"action": "b", "action_input": 2}]}'
+    assert [call["action"] for call in parse_action(text)["actions"]] == ["a", "b"]
+
+
+@pytest.mark.parametrize("text, kind", [
+    ("no braces at all", "no_object"),
+    ('{"action": "calculator", "action_input": "2+', "unterminated"),
+    ('{"action": calculator}', "invalid_json"),
+    ('{"thought": "only a thought"}', "missing_action"),
+])
+def test_errors_say_what_went_wrong(text, kind):
+    with pytest.raises(ActionParseError) as raised:
+        parse_action(text)
+    assert raised.value.kind == kind
+    assert raised.value.as_observation().startswith(f"Parse error ({kind}):")
+
+
+@pytest.mark.parametrize("size", [1, 5, 100])
+def test_a_quoted_brace_in_the_prose_does_not_hide_the_action(size):
+    text = 'Use "{" for it. {"action": "finish"}'
+    parser = ActionParser()
+    for chunk in chunked(text, size):
+        parser.feed(chunk)
+    assert parser.close() == {"action": "finish"}
+    assert parser.end == len(text)
+
+
+def test_unterminated_is_reported_where_the_first_candidate_started():
+    with pytest.raises(ActionParseError) as raised:
+        parse_action('x {"action": "a" {"b"')
+    assert (raised.value.kind, raised.value.position) == ("unterminated", 2)
@@ -0,0 +1,27 @@
+import asyncio
+import json
+
+from agent_core import agent_llm, sample_core
+from resilience import default_policy
+from response_cache import ResponseCache
+
+
+def test_agent_llm_streams_caches_and_goes_through_the_shared_policy():
+    calls, tokens, cache = [], [], ResponseCache()
+
+    def backend(prompt):
+        calls.append(prompt)
+        yield from ('{"action": ', '"finish"}')
+    llm = agent_llm(backend, cache, on_token=tokens.append)
+    before = default_policy().counts["calls"]
+    assert asyncio.run(llm("p")) == asyncio.run(llm("p")) == '{"action": "finish"}'
+    assert calls == ["p"] and cache.hits == 1
+    assert tokens == ['{"action": ', '"finish"}', '{"action": "finish"}']
+    assert default_policy().counts["calls"] == before + 1
+
+
+def test_a_turn_runs_on_agent_llm_without_a_cache():
+    reply = json.dumps({"thought": "greet", "action": "conversation", "action_input": "hi"})
+    llm = agent_llm(lambda prompt: reply)
+    steps = asyncio.run(sample_core().turn("say hi to me please", llm, max_steps=3))
+    assert steps[0]["observation"] == "I heard you: hi"
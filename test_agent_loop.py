@@ -0,0 +1,67 @@
+import json
+import threading
+from functools import partial
+
+from agent_loop import run_agent_loop
+from tool_registry import ToolRegistry
+
+
+def scripted_llm(*replies):
+    replies = iter(replies)
+    return lambda prompt: json.dumps(next(replies))
+
+
+def build_prompt(user_input, step_count, observation):
+    return f"{user_input} {step_count} {observation}"
+
+
+def run(registry, llm):
+    return run_agent_loop("q", llm, build_prompt, registry.dispatch, dispatch_many=registry.dispatch_many)
+
+
+def test_single_call_step_is_bound_by_the_tool_timeout():
+    release = threading.Event()
+    registry = ToolRegistry()
+    registry.register("Slow", lambda _: release.wait(5) and "late", timeout=0.05)
+    steps = run(registry, scripted_llm({"action": "Slow", "action_input": ""},
+                                       {"action": "finish", "thought": "done"}))
+    release.set()
+    assert steps[0]["observation"] == "Error: Slow timed out after 0.05s"
+    assert steps[-1]["action"] == "finish"
+
+
+def test_single_call_without_timeout_runs_inline():
+    threads = []
+    registry = ToolRegistry()
+    registry.register("Where", lambda _: threads.append(threading.current_thread()) or "here")
+    steps = run(registry, scripted_llm({"action": "Where", "action_input": ""},
+                                       {"action": "finish"}))
+    assert steps[0]["observation"] == "here"
+    assert threads == [threading.current_thread()]
+
+
+def test_several_calls_merge_in_order():
+    registry = ToolRegistry()
+    registry.register("Echo", lambda text: text.upper())
+    calls = [{"action": "Echo", "action_input": "a"}, {"action": "Echo", "action_input": "b"}]
+    steps = run(registry, scripted_llm({"actions": calls}, {"action": "finish"}))
+    assert steps[0]["observation"] == "[1] Echo: A\n[2] Echo: B"
+    assert steps[-1]["observation"] == steps[0]["observation"]
+
+
+def test_without_dispatch_many_every_call_uses_dispatch_tool():
+    seen = []
+    llm = scripted_llm({"actions": [{"action": "T", "action_input": 1}, {"action": "T", "action_input": 2}]},
+                       {"action": "finish"})
+    steps = run_agent_loop("q", llm, build_prompt, lambda name, value: seen.append(value) or str(value))
+    assert seen == [1, 2]
+    assert steps[0]["observation"] == "[1] T: 1\n[2] T: 2"
+
+
+def test_context_reaches_the_tools_through_dispatch_many():
+    registry = ToolRegistry()
+    registry.register("File", lambda _, uploaded_file: uploaded_file, uses_context=True, timeout=1)
+    steps = run_agent_loop("q", scripted_llm({"action": "File", "action_input": ""}, {"action": "finish"}),
+                           build_prompt, partial(registry.dispatch, uploaded_file="a.csv"),
+                           dispatch_many=partial(registry.dispatch_many, uploaded_file="a.csv"))
+    assert steps[0]["observation"] == "a.csv"
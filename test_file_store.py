@@ -0,0 +1,110 @@
+import codecs
+import hashlib
+import io
+import os
+
+import pytest
+
+import file_store
+from file_store import describe_stats, detect_encoding, file_stats, head_lines, spool_upload, tail_lines
+
+
+class Upload(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+        self.file_id = f"{name}-{hashlib.md5(data).hexdigest()}"
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return lambda data, name="data.txt": spool_upload(Upload(data, name), directory=str(tmp_path))
+
+
+def test_uploads_are_spooled_once_by_content(spool, tmp_path):
+    first = spool(b"a,b\n1,2\n", "one.csv")
+    second = spool(b"a,b\n1,2\n", "two.csv")
+    assert first.digest == second.digest == hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+    assert first.path == second.path
+    assert [p.name for p in tmp_path.iterdir()] == [first.digest]
+    assert spool_upload(first) is first
+
+
+def test_paths_are_hashed_in_place(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"x\ny\n")
+    spooled = spool_upload(str(path))
+    assert (spooled.path, spooled.name, spooled.size) == (str(path), "notes.txt", 4)
+
+
+def test_head_and_tail_read_only_the_lines_they_show(spool):
+    spooled = spool(b"".join(b"line %d\n" % i for i in range(1, 10001)))
+    assert head_lines(spooled, 3) == ["line 1", "line 2", "line 3"]
+    assert tail_lines(spooled, 2) == ["line 9999", "line 10000"]
+    short = spool(b"only line")
+    assert head_lines(short) == tail_lines(short) == ["only line"]
+    assert head_lines(spool(b"")) == tail_lines(spool(b"")) == []
+
+
+@pytest.mark.parametrize("data, encoding", [
+    ("héllo".encode("utf-8"), "utf-8"),
+    (codecs.BOM_UTF8 + "héllo".encode("utf-8"), "utf-8-sig"),
+    ("héllo".encode("utf-16"), "utf-16"),
+    ("héllo €".encode("cp1252"), "cp1252"),
+    (b"\x81\x8d\x8f", "latin-1"),
+])
+def test_encoding_detection(spool, data, encoding):
+    spooled = spool(data)
+    assert detect_encoding(spooled.path, spooled.digest) == encoding
+
+
+def test_csv_stats_infer_types_and_count_blanks(spool):
+    spooled = spool(b"id,price,name,flag\n1,2.5,a,true\n2,3,,false\n3,,c,true\n", "items.csv")
+    stats = file_stats(spooled)
+    assert stats["rows"] == 3
+    assert [(c["name"], c["dtype"], c["empty"]) for c in stats["columns"]] == [
+        ("id", "int", 0), ("price", "float", 1), ("name", "str", 1), ("flag", "bool", 0)]
+    assert describe_stats(spooled).splitlines()[1:] == [
+        "Rows: 3", "Columns: id (int), price (float, 1 empty), name (str, 1 empty), flag (bool)"]
+
+
+def test_jsonl_stats_skip_invalid_lines(spool):
+    spooled = spool(b'{"a": 1, "b": null}\n{"a": 2.5, "b": "x"}\nnot json\n\n', "rows.jsonl")
+    stats = file_stats(spooled)
+    assert (stats["kind"], stats["rows"], stats["invalid_lines"]) == ("jsonl", 2, 1)
+    assert [(c["name"], c["dtype"], c["empty"]) for c in stats["columns"]] == [("a", "float", 0), ("b", "str", 1)]
+
+
+def test_other_files_report_their_line_count(spool):
+    assert file_stats(spool(b"a\nb\nc\n", "notes.md"))["lines"] == 3
+
+
+def test_uploads_without_a_file_id_are_never_confused(tmp_path):
+    first = spool_upload(io.BytesIO(b"first"), directory=str(tmp_path))
+    second = spool_upload(io.BytesIO(b"second"), directory=str(tmp_path))
+    assert head_lines(first) == ["first"] and head_lines(second) == ["second"]
+
+
+def test_forgotten_uploads_lose_their_spooled_copy(spool, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_store, "MAX_SPOOLED", 2)
+    monkeypatch.setattr(file_store, "_spooled", type(file_store._spooled)())
+    first = spool(b"one", "a.txt")
+    spool(b"one", "b.txt")  # same content, still remembered under b.txt
+    spool(b"two", "c.txt")
+    assert os.path.exists(first.path)
+    spool(b"three", "d.txt")
+    assert not os.path.exists(first.path)
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+@pytest.mark.parametrize("encoding", ["utf-16", "utf-16-be", "utf-32"])
+def test_head_and_tail_follow_wide_encodings(spool, encoding):
+    text = "a,b\n1,2\n3,4\n5,6\n"
+    data = (codecs.BOM_UTF16_BE if encoding == "utf-16-be" else b"") + text.encode(encoding)
+    spooled = spool(data)
+    assert head_lines(spooled, 2) == ["a,b", "1,2"]
+    assert tail_lines(spooled, 2) == ["3,4", "5,6"]
+    assert head_lines(spooled, 10) == tail_lines(spooled, 10) == ["a,b", "1,2", "3,4", "5,6"]
@@ -0,0 +1,54 @@
+import pytest
+
+from intent_router import IntentRouter, TfidfClassifier, extract_expression, rule_intent
+
+TOOLS = ["conversation", "calculator", "DateInfo"]
+
+
+@pytest.mark.parametrize("message", ["2026-10-18", "what is 2026-10-18?", "555-1234", "call 555-1234",
+                                     "12/25/2026", "pages 10-12"])
+def test_dates_phone_numbers_and_ranges_are_not_arithmetic(message):
+    assert extract_expression(message) is None
+    assert IntentRouter().route(message, TOOLS) is None
+
+
+@pytest.mark.parametrize("message, expression", [
+    ("what is 2**10 + sqrt(16)?", "2**10 + sqrt(16)"),
+    ("calculate 7*6", "7*6"),
+    ("12 / 4", "12 / 4"),
+    ("2+2=", "2+2"),
+    ("what's -5 + 3", "-5 + 3"),
+])
+def test_cued_or_spaced_arithmetic_is_routed_to_the_calculator(message, expression):
+    route = IntentRouter().route(message, TOOLS)
+    assert (route.intent, route.tool, route.action_input, route.confidence) == ("math", "calculator", expression, 1.0)
+
+
+def test_bare_unspaced_arithmetic_is_left_to_the_model():
+    assert rule_intent("1/2") == ("math", 0.8)
+    assert IntentRouter().route("1/2", TOOLS) is None
+    assert IntentRouter(threshold=0.8).route("1/2", TOOLS).action_input == "1/2"
+
+
+@pytest.mark.parametrize("message", ["what is the capital of France?", "what is 2 plus the moon", "hello 2+2"])
+def test_anything_more_than_an_expression_goes_to_the_agent(message):
+    assert IntentRouter().route(message, TOOLS) is None
+
+
+def test_greetings_and_dates_use_their_tools_when_registered():
+    router = IntentRouter()
+    assert router.route("Hello there!", TOOLS).tool == "conversation"
+    assert router.route("what's the date today?", TOOLS).tool == "DateInfo"
+    assert router.route("what's the date today?", ["calculator"]) is None
+    assert router.stats()["routed"] == 2
+
+
+def test_classifier_routes_paraphrases_and_round_trips(tmp_path):
+    examples = [("good day to you", "greeting"), ("hey hey", "greeting"), ("greetings friend", "greeting"),
+                ("explain quantum physics", "other"), ("write me a poem", "other"), ("summarize this file", "other")]
+    model = TfidfClassifier.train(examples, epochs=50)
+    model.save(tmp_path / "model.json")
+    loaded = TfidfClassifier.load(tmp_path / "model.json")
+    assert loaded.predict("good day") == model.predict("good day")
+    route = IntentRouter(threshold=0.5, classifier=loaded).route("good day", TOOLS)
+    assert (route.intent, route.source) == ("greeting", "model")
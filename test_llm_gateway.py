@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_client import async_llm, iter_response, streaming_llm
+from llm_gateway import LLMGateway, coalesced
+from resilience import LLMTimeout, ResiliencePolicy
+
+
+def run_threads(*targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def slow_backend(calls, delay=0.05):
+    def backend(prompt):
+        calls.append(prompt)
+        for chunk in ("hel", "lo ", prompt):
+            time.sleep(delay)
+            yield chunk
+    return backend
+
+
+def no_retries(**options):
+    return ResiliencePolicy(retries=0, hedge=False, **options)
+
+
+def test_concurrent_identical_prompts_share_one_backend_call():
+    calls, results, gateway = [], [], LLMGateway()
+    llm = streaming_llm(coalesced(slow_backend(calls), gateway), stop_on_json=False)
+    run_threads(*[lambda: results.append(llm("abc"))] * 5, lambda: results.append(llm("xyz")))
+    assert sorted(results) == ["hello abc"] * 5 + ["hello xyz"]
+    assert sorted(calls) == ["abc", "xyz"]
+    assert gateway.stats()["coalesced"] == 4
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_an_error_reaches_every_coalesced_caller():
+    errors, gateway = [], LLMGateway()
+
+    def failing(prompt):
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    def call():
+        try:
+            streaming_llm(coalesced(failing, gateway))("q")
+        except RuntimeError as e:
+            errors.append(e)
+    run_threads(call, call, call)
+    assert len(errors) == 3 and len({id(e) for e in errors}) == 1
+    assert gateway.stats()["backend_calls"] == 1
+
+
+def test_a_reader_that_stops_early_does_not_cut_off_the_others():
+    calls, out, gateway = [], {}, LLMGateway()
+    backend = coalesced(slow_backend(calls), gateway)
+
+    def partial():
+        chunks = iter_response(backend, "ppp")
+        out["partial"] = next(chunks)
+        chunks.close()
+    run_threads(lambda: out.update(full="".join(iter_response(backend, "ppp"))), partial)
+    assert out == {"full": "hello ppp", "partial": "hel"}
+    assert len(calls) == 1
+
+
+def test_async_callers_are_coalesced_per_loop():
+    calls, tokens, gateway = [], [], LLMGateway()
+
+    async def backend(prompt):
+        calls.append(prompt)
+        for chunk in ("a", "b", "c"):
+            await asyncio.sleep(0.02)
+            yield chunk
+
+    async def main():
+        llm = async_llm(coalesced(backend, gateway), stop_on_json=False)
+        streaming = async_llm(coalesced(backend, gateway), on_token=tokens.append, stop_on_json=False)
+        return await asyncio.gather(llm("p"), streaming("p"), llm("q"))
+    assert asyncio.run(main()) == ["abc", "abc", "abc"]
+    assert sorted(calls) == ["p", "q"]
+    assert tokens == ["a", "b", "c"]
+
+
+def test_distinct_prompts_are_micro_batched():
+    batches = []
+
+    def batch(prompts):
+        batches.append(len(prompts))
+        time.sleep(0.05)
+        return [prompt.upper() for prompt in prompts]
+    gateway = LLMGateway(batch, max_batch=4, max_wait=0.05)
+    results = {}
+    llm = streaming_llm(coalesced(slow_backend([]), gateway), stop_on_json=False)
+    run_threads(*[lambda i=i: results.update({i: llm(f"p{i % 6}")}) for i in range(12)])
+    assert results == {i: f"P{i % 6}" for i in range(12)}
+    assert sum(batches) <= 6 and max(batches) <= 4
+    assert gateway.stats()["batches"] == len(batches)
+
+
+def test_batch_backend_must_answer_every_prompt():
+    gateway = LLMGateway(lambda prompts: [], max_wait=0.01)
+    with pytest.raises(ValueError, match="0 completions for 1 prompts"):
+        streaming_llm(coalesced(slow_backend([]), gateway))("a")
+
+
+def test_batches_are_retried_under_the_policy():
+    attempts = []
+
+    def flaky(prompts):
+        attempts.append(len(prompts))
+        if len(attempts) == 1:
+            raise ConnectionError("reset")
+        return [prompt * 2 for prompt in prompts]
+    policy = ResiliencePolicy(retries=1, backoff=0.01, hedge=False)
+    gateway = LLMGateway(flaky, max_wait=0.01, policy=policy)
+    assert streaming_llm(coalesced(slow_backend([]), gateway))("ab") == "abab"
+    assert attempts == [1, 1]
+    assert policy.stats()["retries"] == 1
+
+
+def test_a_hung_batch_times_out_and_trips_the_breaker():
+    release = threading.Event()
+
+    def hung(prompts):
+        release.wait(5)
+        return prompts
+    policy = no_retries(timeout=0.1)
+    policy.breaker.failure_threshold = 1
+    gateway = LLMGateway(hung, max_wait=0.01, policy=policy)
+    with pytest.raises(LLMTimeout):
+        streaming_llm(coalesced(slow_backend([]), gateway))("a")
+    release.set()
+    assert policy.breaker.state == "open"
+
+
+def test_async_batch_backend_runs_under_the_policy():
+    attempts = []
+
+    async def flaky(prompts):
+        attempts.append(prompts)
+        if len(attempts) == 1:
+            raise ConnectionError("reset")
+        return [prompt.upper() for prompt in prompts]
+    gateway = LLMGateway(flaky, max_batch=8, max_wait=0.02,
+                         policy=ResiliencePolicy(retries=1, backoff=0.01, hedge=False))
+
+    async def main():
+        llm = async_llm(coalesced(slow_backend([]), gateway), stop_on_json=False)
+        return await asyncio.gather(*[llm(f"z{i}") for i in range(3)])
+    assert asyncio.run(main()) == ["Z0", "Z1", "Z2"]
+    assert len(attempts) == 2
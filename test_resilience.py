@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpen, LatencyTracker, LLMTimeout, ResiliencePolicy, resilient
+from step_budget import StepBudget
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def flaky(failures, calls):
+    """Backend that raises for its first `failures` calls, then answers."""
+    def backend(prompt):
+        calls.append(prompt)
+        if len(calls) <= failures:
+            raise ConnectionError(f"attempt {len(calls)} failed")
+        return f"ok {prompt}"
+    return backend
+
+
+def fast_retries(**options):
+    return ResiliencePolicy(backoff=0.001, hedge=False, timeout=2, **options)
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens_for_one_trial():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=10, clock=clock)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen, match="retrying in 10s"):
+        breaker.before_call()
+    clock.now = 10
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()  # only one trial call at a time
+    breaker.failure()
+    assert breaker.state == "open"
+    clock.now = 20
+    breaker.before_call()
+    breaker.success()
+    assert breaker.state == "closed"
+
+
+def test_a_lost_trial_call_does_not_block_the_breaker_forever():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=5, clock=clock)
+    breaker.failure()
+    clock.now = 5
+    breaker.before_call()
+    clock.now = 10
+    breaker.before_call()
+
+
+def test_failed_calls_are_retried_until_one_answers():
+    calls = []
+    policy = fast_retries(retries=2)
+    assert "".join(resilient(flaky(2, calls), policy)("q")) == "ok q"
+    assert calls == ["q"] * 3
+    assert policy.counts["retries"] == 2 and policy.counts["failures"] == 2
+    assert policy.breaker.state == "closed" and policy.breaker.failures == 0
+
+
+def test_the_last_error_is_raised_when_retries_run_out():
+    calls = []
+    with pytest.raises(ConnectionError, match="attempt 2 failed"):
+        list(resilient(flaky(5, calls), fast_retries(retries=1))("q"))
+    assert len(calls) == 2
+
+
+def test_retries_are_capped_by_the_turn_step_budget():
+    calls = []
+    turn = StepBudget().plan("q", cap=10)
+    turn.spend_retry()
+    with turn.activate(), pytest.raises(ConnectionError):
+        list(resilient(flaky(5, calls), fast_retries(retries=5))("q"))
+    assert len(calls) == 2 and turn.retries_left() == 0
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    policy = ResiliencePolicy(retries=10, backoff=1, max_backoff=4)
+    delays = [policy.retry_delay(attempt) for attempt in range(4)]
+    assert 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2 and 2 <= delays[2] <= 4 and 2 <= delays[3] <= 4
+    assert ResiliencePolicy(retries=1).retry_delay(1) is None
+
+
+def test_an_open_circuit_rejects_calls_without_reaching_the_backend():
+    calls = []
+    policy = ResiliencePolicy(retries=0, hedge=False, breaker=CircuitBreaker(failure_threshold=1, reset_after=60))
+    backend = resilient(flaky(5, calls), policy)
+    with pytest.raises(ConnectionError):
+        list(backend("q"))
+    with pytest.raises(CircuitOpen):
+        list(backend("q"))
+    assert len(calls) == 1 and policy.counts["rejected"] == 1
+    assert policy.describe() == "0 hedged, 0 retried, circuit open"
+
+
+def test_a_hanging_backend_times_out_at_the_deadline():
+    release = threading.Event()
+    policy = ResiliencePolicy(timeout=0.1, retries=0, hedge=False)
+    started = time.monotonic()
+    with pytest.raises(LLMTimeout, match="no response within 0.1s"):
+        list(resilient(lambda prompt: release.wait(5) and "late", policy)("q"))
+    release.set()
+    assert time.monotonic() - started < 1
+    assert policy.counts["timeouts"] == 1
+
+
+def test_a_slow_first_chunk_is_hedged_and_the_faster_answer_wins():
+    calls, release = [], threading.Event()
+
+    def backend(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            release.wait(5)
+            yield "slow"
+            return
+        yield "fast"
+    latency = LatencyTracker(min_samples=1)
+    latency.record(0.02)
+    policy = ResiliencePolicy(retries=0, latency=latency, min_hedge_delay=0.02)
+    assert "".join(resilient(backend, policy)("q")) == "fast"
+    release.set()
+    assert len(calls) == 2
+    assert policy.counts["hedged"] == policy.counts["hedge_wins"] == 1
+
+
+def test_no_hedge_until_enough_latencies_were_seen():
+    policy = ResiliencePolicy(latency=LatencyTracker(min_samples=3))
+    assert policy.hedge_delay() is None
+    for seconds in (0.01, 0.2, 0.03):
+        policy.latency.record(seconds)
+    assert policy.hedge_delay() == 0.2
+    assert ResiliencePolicy(hedge=False).hedge_delay() is None
+
+
+def test_closing_the_stream_early_stops_the_backend():
+    closed = threading.Event()
+
+    def backend(prompt):
+        try:
+            for i in range(1000):
+                yield f"{i} "
+                time.sleep(0.001)
+        finally:
+            closed.set()
+    policy = ResiliencePolicy(retries=0, hedge=False)
+    stream = resilient(backend, policy)("q")
+    assert next(stream) == "0 "
+    stream.close()
+    assert closed.wait(2)
+    assert policy.breaker.state == "closed"
+
+
+def test_async_backends_get_the_same_retries_and_deadlines():
+    calls = []
+
+    async def backend(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            raise ConnectionError("first attempt failed")
+        for chunk in ("o", "k"):
+            yield chunk
+
+    async def hangs(prompt):
+        await asyncio.sleep(5)
+        yield "late"
+
+    async def collect(stream):
+        return "".join([chunk async for chunk in stream])
+    policy = fast_retries(retries=1)
+    assert asyncio.run(collect(resilient(backend, policy)("q"))) == "ok"
+    assert len(calls) == 2 and policy.counts["retries"] == 1
+    with pytest.raises(LLMTimeout):
+        asyncio.run(collect(resilient(hangs, ResiliencePolicy(timeout=0.1, retries=0, hedge=False))("q")))
+
+
+def test_the_same_backend_and_policy_give_the_same_wrapper():
+    policy = ResiliencePolicy()
+    backend = flaky(0, [])
+    assert resilient(backend, policy) is resilient(backend, policy)
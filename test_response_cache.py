@@ -0,0 +1,70 @@
+import asyncio
+
+from llm_client import async_llm, streaming_llm
+from response_cache import LRUTTLCache, ResponseCache, cached_llm
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def backend(prompt):
+    yield from ("Hello", " world")
+
+
+def test_prompts_are_normalized_and_counted():
+    cache = ResponseCache()
+    cache.set("What  is\n2+2?", "4")
+    assert cache.get("What is 2+2?") == "4"
+    assert cache.get("What is 2+3?") is None
+    assert cache.get("What is 2+2?", stop=["\n"]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_evicts_oldest_and_ttl_expires():
+    clock = Clock()
+    cache = LRUTTLCache(max_entries=2, ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    clock.now = 10
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    ResponseCache(path=str(tmp_path / "c.db")).set("p", "r")
+    assert ResponseCache(path=str(tmp_path / "c.db")).get("p") == "r"
+
+
+def test_cache_hit_is_streamed_into_on_token():
+    tokens, cache = [], ResponseCache()
+    llm = cached_llm(streaming_llm(backend, on_token=tokens.append), cache)
+    assert llm("p") == "Hello world"
+    assert tokens == ["Hello", " world"]
+    tokens.clear()
+    assert llm("p") == "Hello world"
+    assert tokens == ["Hello world"]
+
+
+def test_async_cache_hit_is_streamed_into_on_token():
+    tokens, cache = [], ResponseCache()
+    llm = cached_llm(async_llm(backend, on_token=tokens.append), cache)
+    assert asyncio.run(llm("p")) == "Hello world"
+    tokens.clear()
+    assert asyncio.run(llm("p")) == "Hello world"
+    assert tokens == ["Hello world"]
+    assert cache.hits == 1
+
+
+def test_explicit_on_token_and_plain_llms():
+    tokens, cache = [], ResponseCache()
+    cache.set("p", "cached")
+    assert cached_llm(lambda prompt: "live", cache, on_token=tokens.append)("p") == "cached"
+    assert cached_llm(lambda prompt: "live", cache)("q") == "live"
+    assert tokens == ["cached"]
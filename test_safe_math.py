@@ -0,0 +1,93 @@
+import math
+import time
+
+import pytest
+
+from safe_math import (MAX_EXPONENT, MAX_FACTORIAL, MathError, UnsupportedExpression, calculate, compile_expression,
+                       evaluate, evaluate_batch)
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("2 + 3 * 4", 14),
+    ("2**10 + sqrt(16)", 1028.0),
+    ("-(7 // 2) % 5", 2),
+    ("max(1, 2, 3) + abs(-4)", 7),
+    ("factorial(5) / 4", 30.0),
+    ("round(pi, 2)", 3.14),
+])
+def test_whitelisted_arithmetic(source, expected):
+    assert evaluate(source) == expected
+
+
+def test_variables_are_bound_per_call():
+    assert evaluate("x * y + 1", x=3, y=4) == 13
+    with pytest.raises(UnsupportedExpression, match="unknown name"):
+        evaluate("x + 1")
+
+
+@pytest.mark.parametrize("source", [
+    "__import__('os').system('true')",
+    "(1).__class__",
+    "[1, 2]",
+    "open('/etc/passwd')",
+    "lambda: 1",
+    "print(1)",
+    "sqrt(x=4)",
+])
+def test_anything_outside_the_whitelist_is_rejected(source):
+    with pytest.raises(UnsupportedExpression):
+        evaluate(source)
+
+
+@pytest.mark.parametrize("source, message", [
+    ("9**9**9", "exponent larger"),
+    (f"2**{MAX_EXPONENT + 1}", "exponent larger"),
+    ("12345678901234567890**5000", "too large"),
+    ("(10**4000) * (10**4000)", "too large"),
+    (f"factorial({MAX_FACTORIAL + 1})", "factorial argument"),
+    ("1" + "+1" * 600, "too long"),
+    ("10.0**400", "too large"),
+    ("1/0", "division by zero"),
+    ("sqrt(-1)", "math domain error"),
+    ("(-8)**0.5", "not a real number"),
+])
+def test_expensive_or_invalid_input_fails_fast(source, message):
+    started = time.monotonic()
+    with pytest.raises(MathError, match=message):
+        evaluate(source)
+    assert time.monotonic() - started < 1
+
+
+def test_deep_nesting_evaluates_or_fails_cleanly():
+    try:
+        assert evaluate("-" * 998 + "1") == 1
+    except MathError as e:  # depends on how much stack the caller already uses
+        assert str(e) == "expression is nested too deeply"
+
+
+def test_compiled_expressions_are_memoized():
+    assert compile_expression("6 * 7") is compile_expression("6 * 7")
+    assert compile_expression("6 * 7").value == 42
+
+
+def test_calculate_digs_arithmetic_out_of_text():
+    assert calculate("what is 2^10?") == 1024
+    assert calculate("12 * (3 + 4) =") == 84
+    assert calculate("compute (3 + 4) * 2 please") == 14
+    with pytest.raises(UnsupportedExpression):
+        calculate("no numbers here")
+
+
+@pytest.mark.parametrize("text", ["pow(2,3)", "x(2)", "sqrt of 16", "7 squared", "2 apples and 3 pears"])
+def test_calculate_refuses_text_whose_numbers_it_cannot_read(text):
+    with pytest.raises(UnsupportedExpression):
+        calculate(text)
+
+
+def test_evaluate_batch_matches_evaluate_and_marks_failures_nan():
+    expressions = ["2+3", "40+2", "sqrt(16)*2", "factorial(5)", "1/0", "nope", "2**10"]
+    results = evaluate_batch(expressions)
+    assert results[:4] == [5.0, 42.0, 8.0, 120.0]
+    assert math.isinf(results[4]) or math.isnan(results[4])
+    assert math.isnan(results[5])
+    assert results[6] == 1024.0
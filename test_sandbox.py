@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+
+import pytest
+
+from sandbox import SandboxPool
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1, timeout=5, queue_timeout=0.2)
+    yield pool
+    pool.close()
+
+
+def test_runs_code_and_captures_stdout(pool):
+    reply = pool.run("print('hi')\nresult = 6 * 7")
+    assert reply == {"result": "42", "stdout": "hi\n"}
+
+
+def test_wall_clock_timeout_replaces_the_worker(pool):
+    assert pool.run("while True: pass", timeout=0.3)["error"] == "execution timed out after 0.3s"
+    assert pool.run("result = 1") == {"result": "1", "stdout": ""}
+
+
+def test_waiting_for_a_busy_pool_gives_up_after_queue_timeout(pool):
+    busy = threading.Thread(target=pool.run, args=("import time; time.sleep(1)",))
+    busy.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    reply = pool.run("result = 1")
+    waited = time.monotonic() - started
+    busy.join()
+    assert reply["error"] == "no sandbox worker became free within 0.2s"
+    assert waited < 0.9
+
+
+def test_close_removes_the_working_directory(pool):
+    pool.run("open('scratch.txt', 'w').write('x')")
+    assert os.path.exists(os.path.join(pool.workdir, "scratch.txt"))
+    pool.close()
+    assert not os.path.exists(pool.workdir)
+    assert pool.run("result = 1")["error"] == "sandbox is shut down"
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from search_index import build_index, load_index
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "weather.txt").write_text("Tomorrow will be sunny with a light breeze from the west.")
+    (docs / "stocks.txt").write_text("Major indices closed mixed after the earnings reports.")
+    return docs, str(tmp_path / "index")
+
+
+def mapped(index):
+    return [m for segment in index.segments for m in segment._maps]
+
+
+def test_bm25_finds_the_matching_passage(corpus):
+    docs, directory = corpus
+    build_index(str(docs), directory)
+    hits = load_index(directory).search("sunny weather tomorrow", k=1)
+    assert [hit.source for hit in hits] == ["weather.txt"]
+    assert "sunny" in hits[0].snippet
+
+
+def test_unchanged_index_is_reused_and_a_reindexed_one_replaces_it(corpus):
+    docs, directory = corpus
+    assert load_index(directory) is None
+    build_index(str(docs), directory)
+    first = load_index(directory)
+    assert load_index(directory) is first
+    (docs / "news.txt").write_text("Headlines about new advances in battery chemistry.")
+    build_index(str(docs), directory)
+    second = load_index(directory)
+    assert second is not first
+    assert all(m.closed for m in mapped(first))
+    assert [hit.source for hit in second.search("battery", k=1)] == ["news.txt"]
+
+
+def test_replaced_index_closes_after_its_searches_finish(corpus):
+    docs, directory = corpus
+    build_index(str(docs), directory)
+    old = load_index(directory)
+    entered, release = threading.Event(), threading.Event()
+    search = old._search
+
+    def slow_search(*args):
+        entered.set()
+        release.wait(5)
+        return search(*args)
+
+    old._search = slow_search
+    results = []
+    searching = threading.Thread(target=lambda: results.append(old.search("sunny", k=1)))
+    searching.start()
+    entered.wait(5)
+    (docs / "weather.txt").write_text("Rain all week long.")
+    build_index(str(docs), directory)
+    assert load_index(directory) is not old
+    assert not any(m.closed for m in mapped(old))
+    release.set()
+    searching.join()
+    assert [hit.source for hit in results[0]] == ["weather.txt"]
+    assert all(m.closed for m in mapped(old))
+    # A late caller of the retired index is answered from the current one
+    assert [hit.source for hit in old.search("rain", k=1)] == ["weather.txt"]
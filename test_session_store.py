@@ -0,0 +1,73 @@
+import socket
+
+import pytest
+
+from conversation_memory import ConversationMemory
+from session_store import JSONCodec, MemoryBackend, RedisBackend, Session
+
+
+class CountingCodec(JSONCodec):
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, value):
+        self.encoded += 1
+        return super().encode(value)
+
+
+@pytest.fixture
+def session():
+    return Session(MemoryBackend(), "sid", ("history", "memory", "step_count"), codec=CountingCodec())
+
+
+def test_unchanged_fields_are_not_encoded_again(session):
+    state = {"history": [{"role": "user", "content": "hi"}], "memory": ConversationMemory(), "step_count": 0}
+    assert sorted(session.flush(state)) == ["history", "memory", "step_count"]
+    encoded = session.codec.encoded
+    assert session.flush(state) == []
+    assert session.codec.encoded == encoded
+
+
+def test_appends_and_memory_changes_are_written(session):
+    state = {"history": [], "memory": ConversationMemory(), "step_count": 0}
+    session.flush(state)
+    state["history"].append({"role": "user", "content": "hi"})
+    assert session.flush(state) == ["history"]
+    state["memory"].add("user", "hi")
+    assert session.flush(state) == ["memory"]
+    state["step_count"] = 1
+    assert session.flush(state) == ["step_count"]
+    assert session.backend.load("sid").keys() == {"history", "memory", "step_count"}
+
+
+def test_replaced_or_touched_fields_are_compared_by_content(session):
+    state = {"history": [{"role": "user", "content": "hi"}]}
+    session.flush(state)
+    state["history"] = [{"role": "user", "content": "hi"}]  # a new but equal list
+    assert session.flush(state) == []
+    state["history"][0]["content"] = "edited"  # in place: invisible until touched
+    assert session.flush(state) == []
+    session.touch("history")
+    assert session.flush(state) == ["history"]
+
+
+def test_loaded_fields_are_clean(session):
+    memory = ConversationMemory()
+    memory.add("user", "hi")
+    session.flush({"history": [{"role": "user", "content": "hi"}], "memory": memory})
+    restored = Session(session.backend, "sid", session.fields, codec=CountingCodec())
+    state = restored.load()
+    assert state["memory"].turns() == [("user", "hi")]
+    assert restored.flush(state) == []
+    assert restored.codec.encoded == 0
+
+
+def test_redis_reconnect_closes_the_broken_connection():
+    backend = RedisBackend(port=1)  # nothing listens there: the reconnect fails too
+    ours, theirs = socket.socketpair()
+    theirs.close()
+    backend._local.conn = (ours, ours.makefile("rb"))
+    with pytest.raises(OSError):
+        backend.command(b"PING")
+    assert ours.fileno() == -1
+    assert backend._local.conn is None
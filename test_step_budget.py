@@ -0,0 +1,78 @@
+import json
+
+from agent_loop import run_agent_loop
+from step_budget import StepBudget, active_budget, estimate_intents
+
+
+def step(action, action_input, observation):
+    return {"thought": "", "action": action, "action_input": action_input, "observation": observation}
+
+
+def test_limit_grows_with_the_intents_and_data_work_and_stays_capped():
+    budget = StepBudget()
+    assert estimate_intents("what is 2+2") == 1
+    assert estimate_intents("what is 2+2? then tell me the date; also greet me") == 3
+    assert budget.limit_for("what is 2+2", cap=10) == 3
+    assert budget.limit_for("average the price column of the csv", cap=10) == 5
+    assert budget.limit_for("add one; then add two; then add three; then add four; then add five", cap=10) == 10
+    assert budget.limit_for("hi", cap=2) == 2
+
+
+def test_repeating_a_call_or_an_observation_stops_the_turn():
+    turn = StepBudget().plan("q", cap=10)
+    steps = [step("search", "x", "first")]
+    assert turn.stop_reason(steps) is None
+    steps.append(step("search", "x", "second"))
+    assert turn.stop_reason(steps) == "search was already run with the same input"
+    turn = StepBudget().plan("q", cap=10)
+    steps = [step("search", "x", "same"), step("search", "y", "same")]
+    assert turn.stop_reason(steps) == "the last two steps produced the same observation"
+
+
+def test_a_failed_call_may_be_retried_with_the_same_input():
+    turn = StepBudget().plan("q", cap=10)
+    steps = [step("python", "code", "Error: timed out"), step("python", "code", "Code executed.")]
+    assert turn.stop_reason(steps) is None
+
+
+def test_final_tool_observations_end_the_turn_once_every_intent_is_answered():
+    budget = StepBudget(is_final=lambda name: name == "calculator")
+    turn = budget.plan("what is 6*7", cap=10)
+    assert turn.stop_reason([step("calculator", "6*7", "The result is 42")]) == \
+        "the observation already answers the query"
+    assert turn.stop_reason([step("calculator", "6*7", "Invalid calculation: x")]) is None
+    assert turn.stop_reason([step("search", "x", "some text")]) is None
+    two = budget.plan("what is 6*7? and what is 2+2?", cap=10)
+    assert two.stop_reason([step("calculator", "6*7", "The result is 42")]) is None
+    merged = step("calculator, calculator", [{"action": "calculator", "action_input": "6*7"},
+                                             {"action": "calculator", "action_input": "2+2"}],
+                  "[1] calculator: The result is 42\n[2] calculator: The result is 4")
+    assert two.stop_reason([merged]) == "the observation already answers the query"
+    assert StepBudget(is_final=lambda name: True, early_finish=False).plan("q", 10).stop_reason(
+        [step("calculator", "1", "1")]) is None
+
+
+def test_retries_are_paid_from_the_step_budget():
+    turn = StepBudget().plan("what is 2+2", cap=10)
+    assert turn.limit == 3 and turn.retries_left() == 2
+    with turn.activate():
+        assert active_budget() is turn
+        assert active_budget().spend_retry() and active_budget().spend_retry()
+        assert not active_budget().spend_retry()
+    assert active_budget() is None
+    assert turn.stop_reason([step("search", "x", "partial")]) == "the step budget was used up by retries"
+
+
+def test_early_stop_saves_the_finishing_model_call():
+    prompts = []
+    replies = iter([{"action": "calculator", "action_input": "6*7"}])
+
+    def llm(prompt):
+        prompts.append(prompt)
+        return json.dumps(next(replies))
+    turn = StepBudget(is_final=lambda name: name == "calculator").plan("what is 6*7", cap=10)
+    steps = run_agent_loop("what is 6*7", llm, lambda *args: "prompt", lambda name, value: "The result is 42",
+                           max_steps=turn.limit, stop_reason=turn.stop_reason)
+    assert len(prompts) == 1
+    assert steps[-1] == {"thought": "Stopped early: the observation already answers the query.", "action": "finish",
+                         "observation": "The result is 42"}
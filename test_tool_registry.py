@@ -0,0 +1,98 @@
+import threading
+import time
+
+from tool_registry import ToolRegistry
+
+
+def test_dispatch_and_describe_come_from_the_same_entries():
+    registry = ToolRegistry()
+    registry.register("Echo", lambda text: text, "Repeats its input.", input_schema={"description": "any text"})
+
+    @registry.register("Upper", description="Shouts.")
+    def upper(text):
+        return text.upper()
+
+    assert registry.dispatch("Echo", "hi") == "hi"
+    assert registry.dispatch("Upper", "hi") == "HI"
+    assert registry.dispatch("Missing", "hi") == "Unknown tool requested."
+    assert registry.describe() == "- Echo: Repeats its input. Input: any text\n- Upper: Shouts."
+
+
+def test_describe_is_rerendered_only_after_a_change():
+    registry = ToolRegistry()
+    registry.register("A", lambda _: "", "first")
+    text = registry.describe()
+    assert registry.describe() is text
+    registry.unregister("A")
+    assert registry.describe() == ""
+
+
+def test_tool_errors_become_observations():
+    registry = ToolRegistry()
+    registry.register("Broken", lambda _: 1 / 0)
+    assert registry.dispatch("Broken", "") == "Error: division by zero"
+
+
+def test_context_is_only_passed_to_tools_that_use_it():
+    registry = ToolRegistry()
+    registry.register("File", lambda _, uploaded_file=None: f"file={uploaded_file}", uses_context=True)
+    registry.register("Plain", lambda value: f"plain={value}")
+    assert registry.dispatch("File", "", uploaded_file="a.csv") == "file=a.csv"
+    assert registry.dispatch("Plain", "x", uploaded_file="a.csv") == "plain=x"
+
+
+def test_overlay_adds_and_hides_tools_without_touching_the_base():
+    base = ToolRegistry()
+    base.register("Shared", lambda _: "shared")
+    base.register("Hidden", lambda _: "hidden")
+    overlay = ToolRegistry(base=base)
+    overlay.register("Own", lambda _: "own")
+    overlay.unregister("Hidden")
+    assert overlay.names() == ["Shared", "Own"]
+    assert overlay.dispatch("Hidden", "") == "Unknown tool requested."
+    assert base.names() == ["Shared", "Hidden"]
+    base.register("Later", lambda _: "later")
+    assert "Later" in overlay.describe()
+
+
+def test_cacheable_tools_run_once_per_normalized_input():
+    runs = []
+    registry = ToolRegistry()
+    registry.register("Calc", lambda text: runs.append(text) or "42", cacheable=True)
+    registry.register("Now", lambda text: runs.append(text) or "now")
+    assert registry.dispatch("Calc", "6 * 7") == registry.dispatch("Calc", "  6   * 7 ") == "42"
+    registry.dispatch("Now", "")
+    registry.dispatch("Now", "")
+    assert runs == ["6 * 7", "", ""]
+    assert registry.cached("Calc", "6 * 7") and not registry.cached("Now", "")
+    assert registry.cache.stats()["hits"] == 1
+
+
+def test_context_tools_are_cached_per_context_key():
+    runs = []
+    registry = ToolRegistry()
+    registry.register("Preview", lambda _, uploaded_file: runs.append(uploaded_file) or uploaded_file,
+                      uses_context=True, cacheable=True, context_key=lambda uploaded_file: uploaded_file)
+    for name in ("a.csv", "a.csv", "b.csv"):
+        registry.dispatch("Preview", "", uploaded_file=name)
+    assert runs == ["a.csv", "b.csv"]
+
+
+def test_dispatch_many_runs_concurrently_and_keeps_order():
+    barrier = threading.Barrier(3, timeout=2)
+    registry = ToolRegistry()
+    registry.register("Wait", lambda value: barrier.wait() is not None and value)
+    started = time.monotonic()
+    assert registry.dispatch_many([("Wait", "a"), ("Wait", "b"), ("Wait", "c")]) == ["a", "b", "c"]
+    assert time.monotonic() - started < 1
+
+
+def test_dispatch_many_enforces_each_tools_timeout():
+    release = threading.Event()
+    registry = ToolRegistry()
+    registry.register("Slow", lambda _: release.wait(5) and "late", timeout=0.05)
+    registry.register("Fast", lambda value: value)
+    observations = registry.dispatch_many([("Slow", ""), ("Fast", "ok")])
+    release.set()
+    assert observations == ["Error: Slow timed out after 0.05s", "ok"]
+    assert registry.dispatch_many([("Slow", "")]) == ["late"]
@@ -0,0 +1,225 @@
+# --- Tool Registry ---
+# One object holds every tool: dispatch is a dict lookup and the prompt's
+# tool list is rendered from the same entries, so they can never drift.
+# Observations of `cacheable` tools are reused from a bounded ToolCache.
+
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import tracing
+from response_cache import LRUTTLCache
+
+# Shared by every registry; tools are I/O or subprocess bound, so threads are enough.
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+
+MAX_CACHED_CHARS = 64 * 1024  # larger observations are recomputed rather than held
+
+
+class ToolSpec:
+    """A registered tool.
+
+    `func(action_input, **context)` returns the observation string; context is
+    only passed when `uses_context` is set (e.g. the uploaded file).
+    `timeout` is in seconds, None meaning unbounded. A `final` tool's
+    observation is a complete answer by itself (see step_budget).
+
+    A `cacheable` tool's observation is reused for `ttl` seconds (None: until
+    evicted, 0: never). A tool that uses context is only cached if
+    `context_key(**context)` says what its result depends on (e.g. a file hash).
+    """
+
+    def __init__(self, name, func, description, input_schema=None, timeout=None,
+                 cacheable=False, uses_context=False, final=False, ttl=None, context_key=None):
+        self.name = name
+        self.func = func
+        self.description = description
+        self.input_schema = input_schema or {}
+        self.timeout = timeout
+        self.cacheable = cacheable
+        self.uses_context = uses_context
+        self.final = final
+        self.ttl = ttl
+        self.context_key = context_key
+
+    def __call__(self, action_input, **context):
+        if self.uses_context:
+            return self.func(action_input, **context)
+        return self.func(action_input)
+
+
+def normalize_input(action_input):
+    if isinstance(action_input, str):
+        return " ".join(action_input.split())
+    return json.dumps(action_input, sort_keys=True, default=str)
+
+
+class ToolCache:
+    """Observations of cacheable tools by (tool, normalized input, context key), LRU-bounded."""
+
+    def __init__(self, max_entries=2048, max_chars=MAX_CACHED_CHARS):
+        self.entries = LRUTTLCache(max_entries=max_entries)
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, spec, action_input, context):
+        """Cache key for this call, or None if it must run."""
+        if not spec.cacheable or spec.ttl == 0:
+            return None
+        scope = None
+        if spec.uses_context:
+            if spec.context_key is None:
+                return None
+            scope = spec.context_key(**context)
+        # The spec itself, not its name: an overlay's tool never sees the base tool's results
+        return spec, normalize_input(action_input), scope
+
+    def peek(self, key):
+        """Whether `key` is cached right now, without counting a hit or miss."""
+        return self.entries.get(key) is not None
+
+    def get(self, key):
+        observation = self.entries.get(key)
+        if observation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return observation
+
+    def put(self, key, observation, ttl=None):
+        if len(str(observation)) <= self.max_chars:
+            self.entries.set(key, observation, ttl=ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries)}
+
+
+class ToolRegistry:
+    """Tools by name.
+
+    A registry built with `base` is an overlay: it sees every tool of the
+    (typically process-wide) base registry plus its own, so a session can add
+    or hide tools without copying the shared ones. Overlays share the base's
+    ToolCache unless given their own.
+    """
+
+    def __init__(self, unknown_tool_message="Unknown tool requested.", base=None, cache=None):
+        self._tools = {}
+        self.base = base
+        self.cache = cache or (base.cache if base is not None else ToolCache())
+        self.unknown_tool_message = unknown_tool_message
+        self._version = 0
+        self._described = (None, "")
+
+    def register(self, name, func=None, description="", **options):
+        """Add or replace a tool. Works as a decorator when `func` is omitted."""
+        if func is None:
+            return lambda f: self.register(name, f, description, **options)
+        self._tools[name] = ToolSpec(name, func, description, **options)
+        self._version += 1
+        return func
+
+    def unregister(self, name):
+        if self.base is not None and name in self.base:
+            self._tools[name] = None  # hide the shared tool in this overlay only
+        else:
+            self._tools.pop(name, None)
+        self._version += 1
+
+    @property
+    def version(self):
+        """Changes whenever this registry or its base gains or loses a tool."""
+        return (self._version, self.base.version if self.base is not None else None)
+
+    def _specs(self):
+        specs = dict(self.base._specs()) if self.base is not None else {}
+        specs.update(self._tools)
+        return {name: spec for name, spec in specs.items() if spec is not None}
+
+    def get(self, name):
+        if name in self._tools:
+            return self._tools[name]
+        return self.base.get(name) if self.base is not None else None
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(self._specs().values())
+
+    def __len__(self):
+        return len(self._specs())
+
+    def names(self):
+        return list(self._specs())
+
+    def describe(self):
+        """Render the tool list for the prompt; re-rendered only after the tools change."""
+        version, text = self._described
+        if version == self.version:
+            return text
+        lines = []
+        for spec in self:
+            line = f"- {spec.name}: {spec.description}"
+            if spec.input_schema.get("description"):
+                line += f" Input: {spec.input_schema['description']}"
+            lines.append(line)
+        self._described = (self.version, "\n".join(lines))
+        return self._described[1]
+
+    def cached(self, name, action_input, **context):
+        """Whether `dispatch(name, action_input)` would be answered from the cache."""
+        spec = self.get(name)
+        key = self.cache.key(spec, action_input, context) if spec is not None else None
+        return key is not None and self.cache.peek(key)
+
+    def dispatch(self, name, action_input, **context):
+        spec = self.get(name)
+        if spec is None:
+            return self.unknown_tool_message
+        with tracing.span(f"tool:{name}", input_chars=len(str(action_input))) as span:
+            key = self.cache.key(spec, action_input, context)
+            if key is not None:
+                observation = self.cache.get(key)
+                span.set(cache_hit=observation is not None)
+                if observation is not None:
+                    span.set(output_chars=len(str(observation)))
+                    return observation
+            try:
+                observation = spec(action_input, **context)
+            except Exception as e:
+                span.set(error=f"{type(e).__name__}: {e}")
+                return f"Error: {str(e)}"
+            if key is not None:
+                self.cache.put(key, observation, spec.ttl)
+            span.set(output_chars=len(str(observation)))
+            return observation
+
+    def dispatch_many(self, calls, **context):
+        """Run independent `(name, action_input)` calls concurrently.
+
+        Observations come back in the order of `calls`. A call that outlives
+        its tool's `timeout` yields an error observation; the worker thread
+        itself cannot be interrupted and finishes in the background.
+        """
+        if len(calls) == 1 and getattr(self.get(calls[0][0]), "timeout", None) is None:
+            name, action_input = calls[0]
+            return [self.dispatch(name, action_input, **context)]
+        started = time.monotonic()
+        # Each call runs in a copy of this context so its tool span keeps its parent
+        futures = [_POOL.submit(contextvars.copy_context().run, self.dispatch, name, action_input, **context)
+                   for name, action_input in calls]
+        observations = []
+        for (name, _), future in zip(calls, futures):
+            timeout = getattr(self.get(name), "timeout", None)
+            remaining = None if timeout is None else max(0, started + timeout - time.monotonic())
+            try:
+                observations.append(future.result(timeout=remaining))
+            except FutureTimeout:
+                observations.append(f"Error: {name} timed out after {timeout}s")
+        return observations
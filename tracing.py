@@ -0,0 +1,218 @@
+# --- Turn Tracing ---
+# Every background turn gets a Trace (see agent_runtime): a tree of timed
+# spans for each step's prompt build, LLM call, parsing and tools, plus the
+# rerun that renders the result. The active span lives in a contextvar, so
+# instrumented code (agent_loop, tool_registry, response_cache, chat_render)
+# just opens `span(...)`; with no active trace that is a no-op.
+#
+# Finished traces can be appended to AGENT_TRACE_PATH as JSON lines, either
+# one span per line ("jsonl") or one OTLP/JSON export request per trace
+# ("otlp", the OpenTelemetry collector file format).
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_PATH = os.environ.get("AGENT_TRACE_PATH")
+TRACE_FORMAT = os.environ.get("AGENT_TRACE_FORMAT", "jsonl")
+
+_current = contextvars.ContextVar("agent_span", default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation; children are appended as they start (thread-safe)."""
+
+    def __init__(self, name, trace, parent=None, **attrs):
+        self.name = name
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.attrs = attrs
+        self.children = []
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.end_ns = None
+
+    def child(self, name, **attrs):
+        span = Span(name, self.trace, self, **attrs)
+        self.children.append(span)
+        return span
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, **attrs):
+        self.attrs.update(attrs)
+        if self.end_ns is None:
+            self.end_ns = self.start_ns + time.perf_counter_ns() - self._t0
+
+    @property
+    def duration(self):
+        """Seconds, up to now while the span is still open."""
+        end = self.end_ns if self.end_ns is not None else self.start_ns + time.perf_counter_ns() - self._t0
+        return (end - self.start_ns) / 1e9
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    def __init__(self, name="turn", **attrs):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, self, **attrs)
+
+    def finish(self, **attrs):
+        self.root.finish(**attrs)
+
+    def spans(self):
+        return list(self.root.walk())
+
+
+# Context API used by instrumented code
+@contextmanager
+def activate(trace):
+    """Make `trace` the parent of spans opened in this context (None: tracing off)."""
+    token = _current.set(trace.root if trace is not None else None)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def enter(name, **attrs):
+    """Open a span under the current one and make it current; pair with leave()."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    span = parent.child(name, **attrs)
+    return span, _current.set(span)
+
+
+def leave(entered, **attrs):
+    """Close a span opened by enter() and return it (None when tracing is off)."""
+    if entered is None:
+        return None
+    span, token = entered
+    _current.reset(token)
+    span.finish(**attrs)
+    return span
+
+
+@contextmanager
+def span(name, **attrs):
+    entered = enter(name, **attrs)
+    if entered is None:
+        yield _NULL_SPAN
+        return
+    try:
+        yield entered[0]
+    except BaseException as e:
+        entered[0].set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        leave(entered)
+
+
+def annotate(**attrs):
+    """Add attributes to the current span, if any."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+# Inspector
+def _ms(seconds):
+    return f"{seconds * 1000:.0f} ms" if seconds >= 0.01 else f"{seconds * 1000:.1f} ms"
+
+
+def _label(span):
+    text = f"{span.name} {_ms(span.duration)}"
+    if "cache_hit" in span.attrs:
+        text += " (cache hit)" if span.attrs["cache_hit"] else " (cache miss)"
+    if "error" in span.attrs:
+        text += " (error)"
+    if span.children:
+        text += " [" + ", ".join(_label(child) for child in span.children) + "]"
+    return text
+
+
+def describe(span):
+    """One line for the Inspector: `prompt 0.2 ms · llm 812 ms (cache miss) · ... · total 815 ms`."""
+    return " · ".join([_label(child) for child in span.children] + [f"total {_ms(span.duration)}"])
+
+
+# Export
+def span_records(trace):
+    """Flat JSON-able dicts, one per span, parents before children."""
+    return [{
+        "trace_id": trace.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent.span_id if span.parent else None,
+        "name": span.name,
+        "start_ns": span.start_ns,
+        "duration_ms": round(span.duration * 1000, 3),
+        "attributes": span.attrs,
+    } for span in trace.spans()]
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace, service="react-agent"):
+    """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for span in trace.spans():
+        end_ns = span.end_ns if span.end_ns is not None else span.start_ns + int(span.duration * 1e9)
+        record = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent.span_id if span.parent else "",
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attrs.items()],
+        }
+        if "error" in span.attrs:
+            record["status"] = {"code": 2, "message": str(span.attrs["error"])}
+        spans.append(record)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeSpans": [{"scope": {"name": "agent"}, "spans": spans}],
+    }]}
+
+
+def export_trace(trace, path=None, format=None):
+    """Append `trace` to `path` (default AGENT_TRACE_PATH); does nothing without a path."""
+    path = path or TRACE_PATH
+    if trace is None or not path:
+        return False
+    if (format or TRACE_FORMAT) == "otlp":
+        lines = [to_otlp(trace)]
+    else:
+        lines = span_records(trace)
+    text = "".join(json.dumps(line, default=str) + "\n" for line in lines)
+    with _export_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+    return True